@@ -7,6 +7,7 @@
 # internal dependencies
 from MedusaServer import MedusaServer
 from MedusaClient import MedusaClient
+from MedusaGameTime import time_str_to_epoch
 
 # system and os
 import sys
@@ -27,11 +28,18 @@ if __name__ == "__main__" :
 	client_server_port = 1877
 	client_replay_filename = None
 	client_logs_dir_path = None
+	client_aggregate = False
+	client_replay_speedup = 1.
+	client_replay_start = None
+	client_replay_end = None
+	client_parse_processes = 0
 
 	server_mode = False
 	server_bind_addr = "0.0.0.0"
 	server_bind_port = 1877
 	server_replay_logs_output_fname = None
+	server_status_windows = [5, 15, 60]
+	server_incremental_status = True
 
 
 	single_mode = False
@@ -45,11 +53,18 @@ if __name__ == "__main__" :
 		if sys.argv[i] == "-l" or sys.argv[i] == "--logs-dir" : client_dir_path = sys.argv[i+1]
 		if sys.argv[i] == "-r" or sys.argv[i] == "--replay" : client_replay_filename = sys.argv[i+1]
 		if sys.argv[i] == "-l" or sys.argv[i] == "--logs-dir" : client_logs_dir_path = sys.argv[i+1]
+		if sys.argv[i] == "-a" or sys.argv[i] == "--aggregate" : client_aggregate = True
+		if sys.argv[i] == "--replay-speed" : client_replay_speedup = float(sys.argv[i+1])
+		if sys.argv[i] == "--replay-start" : client_replay_start = sys.argv[i+1]
+		if sys.argv[i] == "--replay-end" : client_replay_end = sys.argv[i+1]
+		if sys.argv[i] == "-j" or sys.argv[i] == "--parse-processes" : client_parse_processes = int(sys.argv[i+1])
 		
 		if sys.argv[i] == "-s" or sys.argv[i] == "--server" : server_mode = True
 		if sys.argv[i] == "-b" or sys.argv[i] == "--server-bind-addr" : server_bind_addr = sys.argv[i+1]
 		if sys.argv[i] == "-c" or sys.argv[i] == "--server-bind-port" : server_bind_port = int(sys.argv[i+1])
 		if sys.argv[i] == "-f" or sys.argv[i] == "--replay-filename" : server_replay_logs_output_fname = sys.argv[i+1]
+		if sys.argv[i] == "--status-windows" : server_status_windows = [int(w) for w in sys.argv[i+1].split(",") if w]
+		if sys.argv[i] == "--rebuild-status" : server_incremental_status = False
 		
 		if sys.argv[i] == "-1" or sys.argv[i] == "--single" : single_mode = True
 
@@ -65,11 +80,18 @@ if __name__ == "__main__" :
 	print ("-p <port number> or --server-port <port number> (" + str(client_server_port) + ") :\n\tserver port to connect to (ignored for server mode)")
 	print ("-l <directory path> or --logs-dir <directory path> (" + str(client_logs_dir_path) + ") :\n\tpath to the Eve logs directory (ignored for server mode)")
 	print ("-r <filename> for --replay <filename> (" + str(client_replay_filename) + ") :\n\treplay file instead of scanning for live game logs (ignored for server mode")
+	print ("-a or --aggregate (" + str(client_aggregate) + ") :\n\tsend log entries aggregated per second, instead of every single entry (ignored for server mode)")
+	print ("--replay-speed <speedup> (" + str(client_replay_speedup) + ") :\n\treplay speed, relative to game time, 0 to replay as fast as possible (replay only)")
+	print ("--replay-start <\"YYYY.MM.DD HH:MM:SS\"> (" + str(client_replay_start) + ") :\n\tskip log lines before this game time (replay only)")
+	print ("--replay-end <\"YYYY.MM.DD HH:MM:SS\"> (" + str(client_replay_end) + ") :\n\tskip log lines after this game time (replay only)")
+	print ("-j <processes> or --parse-processes <processes> (" + str(client_parse_processes) + ") :\n\tparse game logs in that many processes, for machines running many Eve clients, 0 to parse in a single thread (ignored for server mode)")
 	print ("")
 	print ("-s or --server (" + str(server_mode) + ") :\n\trun as server")
 	print ("-b <local address> or --server-bind-addr <local address> (" + str(server_bind_addr) + ") :\n\tserver address to bind to (ignored for client mode)")
 	print ("-c <port number> or --server-bind-port <port number> (" + str(server_bind_port) + ") :\n\tserver port to bind to (ignored for client mode)")
 	print ("-f <filename> or --replay-filename <filename> (" + str(server_replay_logs_output_fname) + ") :\n\twrite logs in profided filename for later replay")
+	print ("--status-windows <seconds,seconds...> (" + ",".join(str(w) for w in server_status_windows) + ") :\n\tdps windows reported along the main one, e.g burst and sustained dps (ignored for client mode)")
+	print ("--rebuild-status (" + str(not server_incremental_status) + ") :\n\tbuild status info from every retained log entry on each update, using numpy when installed, instead of maintaining it as log entries come (ignored for client mode)")
 	print ("")
 	print ("-1 or --single (" + str(single_mode) + ") :\n\trun as client and server at the same time")
 	print ("")
@@ -84,6 +106,8 @@ if __name__ == "__main__" :
 			bind_addr = server_bind_addr,
 			bind_port = server_bind_port,
 			replay_logs_output_filename = server_replay_logs_output_fname,
+			status_windows = server_status_windows,
+			incremental_status = server_incremental_status,
 			debug = debug_mode)
 		threading.Thread(target=server.serve).start()
 		client = MedusaClient(
@@ -91,6 +115,11 @@ if __name__ == "__main__" :
 			server_addr = client_server_addr,
 			server_port = client_server_port,
 			replay_filename = client_replay_filename,
+			aggregate = client_aggregate,
+			replay_speedup = client_replay_speedup,
+			replay_start = time_str_to_epoch(client_replay_start) if client_replay_start is not None else None,
+			replay_end = time_str_to_epoch(client_replay_end) if client_replay_end is not None else None,
+			parse_processes = client_parse_processes,
 			debug = debug_mode)
 		client.run()
 	else :
@@ -99,6 +128,8 @@ if __name__ == "__main__" :
 				bind_addr = server_bind_addr,
 				bind_port = server_bind_port,
 				replay_logs_output_filename = server_replay_logs_output_fname,
+				status_windows = server_status_windows,
+				incremental_status = server_incremental_status,
 				debug = debug_mode)
 			server.serve()
 		else :
@@ -107,5 +138,10 @@ if __name__ == "__main__" :
 				server_addr = client_server_addr,
 				server_port = client_server_port,
 				replay_filename = client_replay_filename,
+				aggregate = client_aggregate,
+				replay_speedup = client_replay_speedup,
+				replay_start = time_str_to_epoch(client_replay_start) if client_replay_start is not None else None,
+				replay_end = time_str_to_epoch(client_replay_end) if client_replay_end is not None else None,
+				parse_processes = client_parse_processes,
 				debug = debug_mode)
 			client.run()
\ No newline at end of file
@@ -0,0 +1,117 @@
+# Medusa agent format cache
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import AgentParser
+
+# system and os
+import os
+import sys
+
+# concurrency management
+import threading
+
+# output and formatting
+import json
+
+# On disk cache of agent formats (AgentParser agent regexps), by character :
+# either derived from an overview file, valid as long as the overview file is not modified,
+# or detected from gamelogs by late initialization, when the character has no overview file.
+# Restarting the client or opening a new session then skips overview parsing and agent format detection.
+# Detected formats are checked again by their agent parser, and replaced or forgotten when they stop matching (see AgentParser.redetect).
+# {character : {overview filename, or "" for detected formats : {"mtime" : overview file mtime, "agent_re" : agent regexp}}}
+class AgentFormatCache :
+
+	# returns the cached agent regexp of character for overview_filename (None for the detected format), or None
+	def get(self, character, overview_filename = None) :
+		with self.lock :
+			entry = self.formats.get(character, {}).get(overview_filename or "")
+		if entry is None : return None
+		if overview_filename is not None and entry["mtime"] != self.get_mtime(overview_filename) : return None # overview modified since
+		return entry["agent_re"]
+
+	def put(self, character, agent_re, overview_filename = None) :
+		with self.lock :
+			entry = {"mtime" : self.get_mtime(overview_filename) if overview_filename is not None else None, "agent_re" : agent_re}
+			self.formats.setdefault(character, {})[overview_filename or ""] = entry
+			self.save()
+
+	# forget the detected agent format of character
+	def forget(self, character) :
+		with self.lock :
+			if self.formats.get(character, {}).pop("", None) is None : return
+			self.save()
+
+	def get_mtime(self, fname) :
+		try :
+			return os.path.getmtime(fname)
+		except OSError :
+			return None
+
+	def load(self) :
+		try :
+			with open(self.fname, "r", encoding = "utf8") as f :
+				self.formats = json.load(f)
+		except FileNotFoundError :
+			self.formats = {}
+		except (OSError, ValueError) :
+			print("Warning : AgentFormatCache : could not read " + self.fname + ", starting with an empty cache")
+			self.formats = {}
+
+	def save(self) :
+		try :
+			tmp_fname = self.fname + ".tmp"
+			with open(tmp_fname, "w", encoding = "utf8") as f :
+				json.dump(self.formats, f, indent = 1)
+			os.replace(tmp_fname, self.fname) # never leave a half written cache behind
+		except OSError :
+			print("Warning : AgentFormatCache : could not write " + self.fname)
+
+	def __init__(self, fname = "agent_formats.json") :
+		self.fname = fname
+		self.lock = threading.Lock()
+		self.load()
+
+# overview files that may hold the agent format of session_owner, in order of preference, for the provided Eve logs directories
+def get_overview_files(logs_dirs, session_owner) :
+	r = []
+	for dirpath in logs_dirs :
+		r.append(os.path.join(os.path.split(dirpath)[0], "Overview", session_owner + ".yaml"))
+		r.append(os.path.join(os.path.split(dirpath)[0], "Overview", "overview.yaml"))
+	r.append(session_owner + ".yaml")
+	r.append("overview.yaml")
+	return r
+
+# agent parser for session_owner : from the first overview file found, or by late initialization.
+# agent formats are cached on disk when agent_format_cache is provided, so that overview parsing and agent format detection only happen once
+def make_agent_parser(session_owner, logs_dirs, agent_format_cache = None, debug = False) :
+	for fname in get_overview_files(logs_dirs, session_owner) :
+		if not os.path.isfile(fname) :
+			if debug : print("Warning : make_agent_parser : file not found : " +  fname)
+			continue
+		agent_re = agent_format_cache.get(session_owner, fname) if agent_format_cache is not None else None
+		if agent_re is not None :
+			print("using cached agent format for overview configuration file :" + fname)
+			return AgentParser(agent_re = agent_re, debug = debug)
+		try : 
+			r = AgentParser(overview_filename = fname, debug = debug)
+		except Exception :
+			print("Warning : could not read overview configuration file " + fname + " : " + str(sys.exc_info()[1]))
+			continue
+		print("found overview configuration file :" + fname)
+		if agent_format_cache is not None : agent_format_cache.put(session_owner, r.agent_re, fname)
+		return r
+
+	if agent_format_cache is None :
+		if debug : print("found no overview setup file, defaulting to late initialization")
+		return AgentParser(debug = debug)
+	# detected formats are checked again if agent lines stop matching : the cache follows
+	detected_callback = lambda agent_re : agent_format_cache.put(session_owner, agent_re)
+	invalidated_callback = lambda : agent_format_cache.forget(session_owner)
+	agent_re = agent_format_cache.get(session_owner)
+	if agent_re is not None :
+		print("found no overview setup file, using previously detected agent format")
+		return AgentParser(agent_re = agent_re, debug = debug, detected_callback = detected_callback, redetectable = True, invalidated_callback = invalidated_callback)
+	print("found no overview setup file, defaulting to late initialization")
+	return AgentParser(debug = debug, detected_callback = detected_callback, invalidated_callback = invalidated_callback)
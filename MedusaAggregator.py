@@ -0,0 +1,225 @@
+# Medusa incremental status aggregator
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import block_size, select_block_rows
+from MedusaSymbolTable import no_symbol
+from MedusaStatusInfo import metric_registry_by_rule_id, metric_reductions, total_metrics, build_status_info, name_characters, accumulate_status
+from MedusaGameTime import epoch_to_datetime
+
+# Ring buffer of one second buckets over the last seconds of several nested windows (sorted, the largest one being the size of the ring) :
+# entries count, amounts sum and largest amount of each second, plus running count and sum over each window.
+# Adding an entry is O(windows), expiring a second of a window is O(1) : each window only visits the seconds elapsed since its last expiry.
+class Ring :
+	__slots__ = ["times", "counts", "sums", "maxes", "window_counts", "window_sums", "cutoffs"]
+
+	# returns False if t is too old to fit in the largest window
+	def add(self, t, amount) :
+		i = t % len(self.times)
+		bucket_time = self.times[i]
+		if bucket_time != t :
+			if bucket_time is not None :
+				if bucket_time > t : return False # the window has moved past t
+				self.expire_bucket(i)
+			if t < self.cutoffs[-1] : return False
+			self.times[i] = t
+		self.counts[i] += 1
+		self.sums[i] += amount
+		if amount > self.maxes[i] : self.maxes[i] = amount
+		for k, cutoff in enumerate(self.cutoffs) :
+			if t >= cutoff :
+				self.window_counts[k] += 1
+				self.window_sums[k] += amount
+		return True
+
+	# remove bucket i from the windows still counting it, then clear it
+	def expire_bucket(self, i) :
+		t = self.times[i]
+		for k, cutoff in enumerate(self.cutoffs) :
+			if t >= cutoff :
+				self.window_counts[k] -= self.counts[i]
+				self.window_sums[k] -= self.sums[i]
+		self.times[i] = None
+		self.counts[i] = 0
+		self.sums[i] = 0
+		self.maxes[i] = 0
+
+	# move each window start to its cutoff (one per window, in windows order) : seconds older than the largest window cutoff are forgotten
+	def expire(self, cutoffs) :
+		times = self.times
+		size = len(times)
+		last = len(cutoffs) - 1
+		for k, cutoff in enumerate(cutoffs) :
+			expired_until = self.cutoffs[k]
+			if cutoff <= expired_until : continue
+			if k == last :
+				for t in range(max(expired_until, cutoff - size), cutoff) :
+					i = t % size
+					if times[i] is not None and times[i] < cutoff : self.expire_bucket(i)
+			else :
+				for t in range(max(expired_until, cutoff - size), cutoff) :
+					i = t % size
+					if times[i] is not None and expired_until <= times[i] < cutoff :
+						self.window_counts[k] -= self.counts[i]
+						self.window_sums[k] -= self.sums[i]
+			self.cutoffs[k] = cutoff
+
+	# largest amount of window k
+	def max(self, k = -1) :
+		if k == -1 or k == len(self.cutoffs) - 1 : return max(self.maxes) # older buckets are cleared already
+		cutoff = self.cutoffs[k]
+		return max([m for t, m in zip(self.times, self.maxes) if t is not None and t >= cutoff], default = 0)
+
+	# size : seconds of the largest window, cutoffs : game time (epoch seconds) each window starts at
+	def __init__(self, size, cutoffs) :
+		self.times = [None] * size
+		self.counts = [0] * size
+		self.sums = [0] * size
+		self.maxes = [0] * size
+		self.window_counts = [0] * len(cutoffs)
+		self.window_sums = [0] * len(cutoffs)
+		self.cutoffs = list(cutoffs)
+
+# Incremental version of make_status_info over sliding windows : per character and per metric ring buffers of one second buckets,
+# updated as make_status_info would from the metric registry (see MedusaStatusInfo.metric_registry).
+# Blocks are added as they are collected (add_block), the status of the last window seconds is then built from the ring buffers alone (get_status_info),
+# its cost depending on the number of active characters and metrics, not on the number of log entries in the window.
+# Extra status windows (e.g 5 seconds burst and 60 seconds sustained dps) share the same ring buffers, each adding its own running sums.
+class WindowAggregator :
+
+	def add_block(self, block) :
+		rule, time = block["rule"], block["time"]
+		fields = {"src" : block["src"], "target" : block["target"], "amount" : block["amount"], "max" : block["max"] if "max" in block else block["amount"]}
+		ship_fields = {"src" : block["src_ship"], "target" : block["target_ship"]}
+		size, cutoffs = self.windows[-1], self.cutoffs
+		expired_until = cutoffs[-1]
+		rings, totals, ships = self.rings, self.totals, self.ships
+		for i in range(block_size(block)) :
+			entry = metric_registry_by_rule_id[rule[i]]
+			if entry is None : continue
+			t = time[i]
+			if t < expired_until : continue # too late
+			updates, ship_pilot_fields = entry
+			for pilot_field, amount_field, metric, reduction in updates :
+				value = fields[amount_field][i] if amount_field is not None else 0
+				if pilot_field is None :
+					ring = totals.get(metric)
+					if ring is None : ring = totals[metric] = Ring(size, cutoffs)
+				else :
+					pilot = fields[pilot_field][i]
+					pilot_rings = rings.get(pilot)
+					if pilot_rings is None : pilot_rings = rings[pilot] = {}
+					ring = pilot_rings.get(metric)
+					if ring is None : ring = pilot_rings[metric] = Ring(size, cutoffs)
+				ring.add(t, value)
+			for pilot_field in ship_pilot_fields :
+				ship_type = ship_fields[pilot_field][i]
+				if ship_type is None or ship_type == no_symbol : continue
+				pilot = fields[pilot_field][i]
+				known = ships.get(pilot)
+				if known is None or known[0] <= t : ships[pilot] = (t, ship_type)
+
+	# forget everything older than the largest window ending at game time now (epoch seconds)
+	def expire(self, now) :
+		cutoffs = [now - window + 1 for window in self.windows]
+		if cutoffs[-1] <= self.cutoffs[-1] : return
+		self.cutoffs = cutoffs
+		for pilot in list(self.rings.keys()) :
+			pilot_rings = self.rings[pilot]
+			for metric in list(pilot_rings.keys()) :
+				ring = pilot_rings[metric]
+				ring.expire(cutoffs)
+				if ring.window_counts[-1] == 0 : del pilot_rings[metric]
+			if not pilot_rings : del self.rings[pilot]
+		for ring in self.totals.values() : ring.expire(cutoffs)
+		self.ships = {pilot : ship for pilot, ship in self.ships.items() if ship[0] >= cutoffs[-1]}
+
+	# characters and totals of window k, sums averaged over dps_window
+	def get_window_status(self, k, dps_window) :
+		characters = {}
+		for pilot, pilot_rings in self.rings.items() :
+			character = {}
+			for metric, ring in pilot_rings.items() :
+				if ring.window_counts[k] == 0 : continue
+				reduction = metric_reductions[metric]
+				if reduction == "sum" : character[metric] = ring.window_sums[k] / dps_window
+				elif reduction == "max" : character[metric] = ring.max(k)
+				else : character[metric] = True
+			if not character : continue
+			ship = self.ships.get(pilot)
+			if ship is not None : character["ship_type"] = ship[1]
+			characters[pilot] = character
+		totals = {}
+		for metric in total_metrics :
+			ring = self.totals.get(metric)
+			totals[metric] = (ring.window_sums[k] if ring is not None else 0) / dps_window
+		return characters, totals
+
+	# status_info of the window ending at gametime (datetime, see GameTime), as make_status_info would build it from the log entries of that window,
+	# with a "windows" entry holding the characters and totals of each status window ({seconds : {"characters" : ..., "total" : ...}}, sums averaged over the window)
+	def get_status_info(self, gametime, now) :
+		self.expire(now)
+		characters, totals = self.get_window_status(self.windows.index(self.window), self.dps_window)
+		status_info = build_status_info(gametime, characters, totals, self.symbol_table)
+		if self.status_windows :
+			status_info["windows"] = {}
+			for window in self.status_windows :
+				characters, totals = self.get_window_status(self.windows.index(window), window)
+				status_info["windows"][str(window)] = {"characters" : name_characters(characters, self.symbol_table), "total" : totals}
+		return status_info
+
+	# window : seconds of log entries kept, dps_window : seconds amounts are averaged over (see make_status_info)
+	# status_windows : seconds of the extra windows reported in status_info, computed along the main one
+	def __init__(self, window, dps_window, symbol_table = None, status_windows = ()) :
+		self.window = window
+		self.dps_window = dps_window
+		self.symbol_table = symbol_table
+		self.status_windows = list(status_windows)
+		self.windows = sorted(set([window] + self.status_windows)) # ring buffers cover the largest one
+		self.cutoffs = [0] * len(self.windows) # log entries older than these game times (epoch seconds) are out of each window
+		self.rings = {} # pilot -> {metric -> Ring}
+		self.totals = {} # total metric -> Ring
+		self.ships = {} # pilot -> (game time, ship type), latest known ship type
+
+# Status of a whole fight, accumulated from every log entry since it started : a fight ends when no log entry was timed in the last idle seconds,
+# the next log entry starting a new one. Sums are amounts totals over the fight, not averaged over any window.
+class FightAggregator :
+
+	def add_block(self, block) :
+		times = block["time"]
+		if block_size(block) == 0 : return
+		oldest, newest = min(times), max(times)
+		if self.end is None : self.start_fight(oldest)
+		elif newest > self.end + self.idle : self.start_fight(min(t for t in times if t > self.end + self.idle))
+		if oldest < self.start : # late entries of the previous fight
+			block = select_block_rows(block, [i for i, t in enumerate(times) if t >= self.start])
+		accumulate_status(block, self.characters, self.totals)
+		if self.end is None or newest > self.end : self.end = newest
+
+	def start_fight(self, start) :
+		self.start = start
+		self.end = None
+		self.characters = {}
+		self.totals = {metric : 0 for metric in total_metrics}
+
+	# "fight" entry of status_info : start and end game times, duration in seconds, characters and totals
+	def get_status(self) :
+		if self.start is None : return None
+		characters = {pilot : dict(character) for pilot, character in self.characters.items()}
+		return {
+			"start" : epoch_to_datetime(self.start).isoformat(timespec='seconds'),
+			"end" : epoch_to_datetime(self.end).isoformat(timespec='seconds'),
+			"duration" : self.end - self.start + 1,
+			"characters" : name_characters(characters, self.symbol_table),
+			"total" : dict(self.totals),
+		}
+
+	# idle : seconds without log entries ending a fight
+	def __init__(self, idle = 120, symbol_table = None) :
+		self.idle = idle
+		self.symbol_table = symbol_table
+		self.start = None # game time (epoch seconds) of the first log entry of the fight
+		self.end = None # game time of its latest log entry
+		self.characters = {} # pilot -> {metric -> value}
+		self.totals = {metric : 0 for metric in total_metrics}
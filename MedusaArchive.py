@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Medusa gamelogs archive
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# Bulk ingestion of historical gamelogs into an on disk columnar archive, for the analysis of past fights.
+# Gamelog files are parsed in parallel by a pool of processes, each file by a single parser (see MedusaParser),
+# with the agent format of its session owner taken from overview files, as the client does (see make_agent_parser).
+# The archive is partitioned by day and character : <archive dir>/<YYYY.MM.DD>/<character>/<gamelog file name>.mdw,
+# each part holding the log entries of one gamelog file for one day, as a collection in the wire format (see MedusaWire).
+# Ingestion is incremental : files ingested already and not modified since are skipped (see the archive index file).
+
+# internal dependencies
+from MedusaParser import MedusaParser, block_columns_no_log_str, block_symbol_columns, block_size, select_block_rows, recursive_merge, new_block
+from MedusaSymbolTable import SymbolTable, no_symbol
+from MedusaAgentFormatCache import make_agent_parser
+from MedusaGamelogsIndex import parse_session_owner
+from MedusaWire import encode_collection, decode_collection
+from MedusaGameTime import epoch_to_datetime
+
+# system and os
+import sys
+import os
+import io
+import contextlib
+
+# time management
+import time
+
+# concurrency management
+import multiprocessing
+
+# output and formatting
+import json
+
+archive_part_extension = ".mdw"
+archive_index_fname = "archive_index.json" # {gamelog file path : gamelog file mtime when ingested}
+parse_chunk_lines = 50000 # lines parsed at once, bounding the memory used by workers on huge files
+
+def get_day_dirname(day) :
+	return epoch_to_datetime(day * 86400).strftime("%Y.%m.%d")
+
+# character names are made of letters, digits, spaces, dashes and quotes : anything else is replaced, just in case
+def get_character_dirname(character) :
+	return "".join(c if c.isalnum() or c in " -'." else "_" for c in character).strip(". ") or "_"
+
+def get_part_fname(archive_dir, day, character, gamelog_fname) :
+	return os.path.join(archive_dir, get_day_dirname(day), get_character_dirname(character), os.path.splitext(os.path.basename(gamelog_fname))[0] + archive_part_extension)
+
+def write_part(fname, block, symbol_table) :
+	os.makedirs(os.path.dirname(fname), exist_ok = True)
+	col = dict(block)
+	col["symbols"] = [1, symbol_table.names_since(1)]
+	tmp_fname = fname + ".tmp"
+	with open(tmp_fname, "wb") as f :
+		f.write(encode_collection(col))
+	os.replace(tmp_fname, fname) # never leave a half written part behind
+
+# returns the log entries block stored in an archive part, with names instead of symbol ids
+def read_part(fname) :
+	with open(fname, "rb") as f :
+		col = decode_collection(f.read())
+	start, names = col.pop("symbols")
+	names = [None] * start + names
+	for c in block_symbol_columns :
+		if c in col : col[c] = [names[i] if i != no_symbol else None for i in col[c]]
+	return col
+
+# parse a gamelog file and write its log entries to the archive, one part per day
+# returns (gamelog file name, session owner, lines count, log entries count, error message or None)
+def ingest_file(args) :
+	fname, archive_dir, logs_dirs, debug = args
+	try :
+		with open(fname, "r", encoding = "utf8", errors = "replace") as f :
+			session_owner = parse_session_owner(f)
+			if session_owner is None : return (fname, None, 0, 0, None) # not a gamelog
+			f.seek(0)
+			lines = f.read().splitlines()
+		symbol_table = SymbolTable()
+		with contextlib.redirect_stdout(io.StringIO()) if not debug else contextlib.nullcontext() :
+			parser = MedusaParser(session_owner, make_agent_parser(session_owner, logs_dirs, debug = debug), debug, symbol_table)
+			block = new_block(block_columns_no_log_str)
+			for i in range(0, len(lines), parse_chunk_lines) :
+				recursive_merge(parser.parse_many(lines[i : i + parse_chunk_lines], keep_log_str = False), block)
+		days = {}
+		for i, t in enumerate(block["time"]) : days.setdefault(t // 86400, []).append(i)
+		for day, indexes in days.items() :
+			write_part(get_part_fname(archive_dir, day, session_owner, fname), select_block_rows(block, indexes), symbol_table)
+		return (fname, session_owner, len(lines), block_size(block), None)
+	except Exception :
+		return (fname, None, 0, 0, str(sys.exc_info()[1]))
+
+class MedusaArchive :
+
+	def load_index(self) :
+		try :
+			with open(os.path.join(self.archive_dir, archive_index_fname), "r", encoding = "utf8") as f :
+				return json.load(f)
+		except FileNotFoundError :
+			return {}
+
+	def save_index(self) :
+		fname = os.path.join(self.archive_dir, archive_index_fname)
+		with open(fname + ".tmp", "w", encoding = "utf8") as f :
+			json.dump(self.index, f, indent = 1)
+		os.replace(fname + ".tmp", fname)
+
+	# returns the gamelog files of gamelogs_dir that were not ingested yet, or modified since
+	def get_new_files(self, gamelogs_dir) :
+		r = []
+		with os.scandir(gamelogs_dir) as it :
+			for entry in it :
+				if not entry.name.endswith(".txt") or not entry.is_file() : continue
+				if self.index.get(entry.path) != entry.stat().st_mtime : r.append(entry.path)
+		return sorted(r)
+
+	# parse every new gamelog file of gamelogs_dir into the archive, with jobs processes (one per core by default)
+	# logs_dirs : Eve logs directories, for overview files lookup (the parent directory of gamelogs_dir by default)
+	def ingest(self, gamelogs_dir, logs_dirs = None, jobs = None) :
+		gamelogs_dir = os.path.expanduser(gamelogs_dir)
+		if logs_dirs is None : logs_dirs = [os.path.dirname(os.path.normpath(gamelogs_dir))]
+		fnames = self.get_new_files(gamelogs_dir)
+		print("MedusaArchive : " + str(len(fnames)) + " new gamelog files to ingest from " + gamelogs_dir)
+		start = time.monotonic()
+		lines_count, entries_count, files_count = 0, 0, 0
+		os.makedirs(self.archive_dir, exist_ok = True)
+		with multiprocessing.Pool(jobs) as pool :
+			# larger files first, for the pool not to end up waiting on a single huge file
+			fnames.sort(key = lambda fname : os.path.getsize(fname), reverse = True)
+			for fname, session_owner, lines, entries, error in pool.imap_unordered(ingest_file, [(fname, self.archive_dir, logs_dirs, self.debug) for fname in fnames]) :
+				if error is not None :
+					print("Warning : MedusaArchive : could not ingest " + fname + " : " + error)
+					continue
+				self.index[fname] = os.path.getmtime(fname)
+				files_count += 1
+				lines_count += lines
+				entries_count += entries
+				if self.debug : print("MedusaArchive : " + fname + " (" + str(session_owner) + ") : " + str(entries) + " log entries")
+				if files_count % 100 == 0 : self.save_index()
+		self.save_index()
+		duration = time.monotonic() - start
+		print("MedusaArchive : ingested " + str(files_count) + " files, " + str(lines_count) + " lines, " + str(entries_count) + " log entries in " +
+		      "{:.1f}s ({:.0f} lines/s)".format(duration, lines_count / duration if duration > 0 else 0))
+
+	# returns the file names of the archive parts, optionally filtered by day ("YYYY.MM.DD") and character
+	def get_parts(self, day = None, character = None) :
+		r = []
+		for day_dirname in sorted(os.listdir(self.archive_dir)) :
+			day_dir = os.path.join(self.archive_dir, day_dirname)
+			if not os.path.isdir(day_dir) or (day is not None and day_dirname != day) : continue
+			for character_dirname in sorted(os.listdir(day_dir)) :
+				if character is not None and character_dirname != get_character_dirname(character) : continue
+				character_dir = os.path.join(day_dir, character_dirname)
+				for part in sorted(os.listdir(character_dir)) :
+					if part.endswith(archive_part_extension) : r.append(os.path.join(character_dir, part))
+		return r
+
+	# returns a single block (with names instead of symbol ids) of every log entry archived for day ("YYYY.MM.DD") and character, both optional
+	def load(self, day = None, character = None) :
+		r = new_block(block_columns_no_log_str)
+		for fname in self.get_parts(day, character) : recursive_merge(read_part(fname), r)
+		return r
+
+	def __init__(self, archive_dir, debug = False) :
+		self.archive_dir = os.path.expanduser(archive_dir)
+		self.debug = debug
+		self.index = self.load_index()
+
+
+if __name__ == "__main__" :
+
+	gamelogs_dir = None
+	archive_dir = "medusa_archive"
+	logs_dirs = None
+	jobs = None
+	debug = False
+
+	for i in range(len(sys.argv)) :
+		if sys.argv[i] == "-g" or sys.argv[i] == "--gamelogs-dir" : gamelogs_dir = sys.argv[i+1]
+		if sys.argv[i] == "-o" or sys.argv[i] == "--archive-dir" : archive_dir = sys.argv[i+1]
+		if sys.argv[i] == "-l" or sys.argv[i] == "--logs-dir" : logs_dirs = (logs_dirs or []) + [sys.argv[i+1]]
+		if sys.argv[i] == "-j" or sys.argv[i] == "--jobs" : jobs = int(sys.argv[i+1])
+		if sys.argv[i] == "-d" or sys.argv[i] == "--debug" : debug = True
+
+	if gamelogs_dir is None :
+		print("usage : python3 MedusaArchive.py -g <Gamelogs directory> [-o <archive directory>] [-l <Eve logs directory>] [-j <processes>] [-d]")
+		sys.exit(1)
+	MedusaArchive(archive_dir, debug).ingest(gamelogs_dir, logs_dirs, jobs)
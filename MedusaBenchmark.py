@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# Medusa parser benchmark suite
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# Measures MedusaParser throughput on synthetic gamelogs (see MedusaSynthLogs), for every agent format :
+# lines/second on a realistic line mix and for each rule alone, late initialization cost, and parsing errors.
+# Results can be saved, and compared to previously saved ones to catch performance regressions.
+
+# internal dependencies
+from MedusaParser import MedusaParser, AgentParser, block_size
+from MedusaSynthLogs import SynthLogsGenerator, agent_formats, agent_format_re
+
+# system and os
+import sys
+import io
+import contextlib
+
+# time management
+import time
+
+# output and formatting
+import json
+
+# runs f(), returns the best duration in seconds over repeat runs
+# parsers print warnings on some failures : they are muted while timing
+def best_time(f, repeat) :
+	r = None
+	for i in range(repeat) :
+		with contextlib.redirect_stdout(io.StringIO()) :
+			start = time.perf_counter()
+			f()
+			duration = time.perf_counter() - start
+		if r is None or duration < r : r = duration
+	return r
+
+def make_parser(listener, agent_format) :
+	return MedusaParser(listener, AgentParser(agent_re = agent_format_re(agent_format)))
+
+# forget compiled rule sets and late initialization results, so that the next parsers start from scratch
+def clear_parser_caches() :
+	MedusaParser.rule_sets.clear()
+	AgentParser.late_init_results.clear()
+
+# returns the number of lines not parsed into the expected rule and pilots, by expected rule
+def count_errors(parser, lines) :
+	r = {}
+	with contextlib.redirect_stdout(io.StringIO()) :
+		for line, rule_name, src, target in lines :
+			entry = parser.parse(line)
+			if entry is None or entry.rule_name() != rule_name or (src is not None and (entry.src, entry.target) != (src, target)) :
+				r[rule_name] = r.get(rule_name, 0) + 1
+	return r
+
+# returns the best duration in seconds over repeat runs of the late initialization attempts of a parser without agent format :
+# the lines it parses until its agent format is detected, the detecting line included. None if the format is never detected
+def late_init_best_time(listener, lines, repeat) :
+	r = None
+	for i in range(repeat) :
+		clear_parser_caches()
+		parser = MedusaParser(listener)
+		duration = 0.
+		with contextlib.redirect_stdout(io.StringIO()) :
+			for line in lines :
+				start = time.perf_counter()
+				parser.parse(line, keep_log_str = False)
+				duration += time.perf_counter() - start
+				if parser.agent_parser.is_init : break
+		if not parser.agent_parser.is_init : return None
+		if r is None or duration < r : r = duration
+	return r
+
+def benchmark_format(agent_format, line_count, fight_size, seed, repeat, late_init_lines) :
+	generator = SynthLogsGenerator(agent_format = agent_format, fight_size = fight_size, profile = "mixed", seed = seed)
+	lines = list(generator.generate(line_count))
+	log_lines = [line for line, rule_name, src, target in lines]
+	r = {}
+
+	# realistic line mix, parsed by an initialized parser
+	parser = make_parser(generator.listener, agent_format)
+	r["lines_per_second"] = len(log_lines) / best_time(lambda : parser.parse_many(log_lines, keep_log_str = False), repeat)
+
+	# each rule alone, on as many lines as the mix for comparable timings
+	r["rules"] = {}
+	by_rule = {}
+	for line, rule_name, src, target in lines : by_rule.setdefault(rule_name, []).append(line)
+	for rule_name, rule_lines in sorted(by_rule.items()) :
+		rule_lines = rule_lines * (len(log_lines) // len(rule_lines) + 1)
+		parser = make_parser(generator.listener, agent_format)
+		r["rules"][rule_name] = len(rule_lines) / best_time(lambda : parser.parse_many(rule_lines, keep_log_str = False), repeat)
+
+	# late initialization : first lines of a session parsed by a parser without agent format, until it detects the format
+	first_lines = log_lines[:late_init_lines]
+	late_init_time = late_init_best_time(generator.listener, first_lines, repeat)
+	r["late_init_ms"] = late_init_time * 1000. if late_init_time is not None else None
+	with contextlib.redirect_stdout(io.StringIO()) :
+		parser = MedusaParser(generator.listener)
+		r["late_init_parsed"] = block_size(parser.parse_many(first_lines, keep_log_str = False))
+		r["late_init_ok"] = parser.agent_parser.is_init
+	r["late_init_expected"] = len(first_lines)
+
+	r["errors"] = count_errors(make_parser(generator.listener, agent_format), lines)
+	return r
+
+def print_results(results) :
+	rule_names = sorted(set(rule_name for r in results.values() for rule_name in r["rules"]))
+	formats = list(results.keys())
+	print("lines/s".ljust(24) + "".join(f.rjust(20) for f in formats))
+	print("mix".ljust(24) + "".join("{:20.0f}".format(results[f]["lines_per_second"]) for f in formats))
+	for rule_name in rule_names :
+		print(rule_name.ljust(24) + "".join("{:20.0f}".format(results[f]["rules"].get(rule_name, 0)) for f in formats))
+	print("")
+	print("late init (ms)".ljust(24) + "".join(("{:20.3f}".format(results[f]["late_init_ms"]) if results[f]["late_init_ms"] is not None else "n/a".rjust(20)) for f in formats))
+	print("late init parsed".ljust(24) + "".join(("{}/{}".format(results[f]["late_init_parsed"], results[f]["late_init_expected"])).rjust(20) for f in formats))
+	print("late init success".ljust(24) + "".join(str(results[f]["late_init_ok"]).rjust(20) for f in formats))
+	print("")
+	for f in formats :
+		if results[f]["errors"] : print("Warning : " + f + " : lines not parsed as expected : " + str(results[f]["errors"]))
+
+# returns the list of (format, measure, reference lines/s, lines/s) slower than the reference by more than tolerance
+def compare_results(results, reference, tolerance) :
+	r = []
+	for f, format_results in results.items() :
+		if not f in reference : continue
+		measures = [("mix", format_results["lines_per_second"], reference[f]["lines_per_second"])]
+		for rule_name, lines_per_second in format_results["rules"].items() :
+			if rule_name in reference[f]["rules"] : measures.append((rule_name, lines_per_second, reference[f]["rules"][rule_name]))
+		for measure, lines_per_second, reference_lines_per_second in measures :
+			if lines_per_second < reference_lines_per_second * (1. - tolerance) :
+				r.append((f, measure, reference_lines_per_second, lines_per_second))
+	return r
+
+
+if __name__ == "__main__" :
+
+	formats = agent_formats
+	line_count = 5000
+	fight_size = 20
+	seed = 0
+	repeat = 5
+	late_init_lines = 200
+	save_fname = None
+	compare_fname = None
+	tolerance = 0.1
+
+	for i in range(len(sys.argv)) :
+		if sys.argv[i] == "-f" or sys.argv[i] == "--formats" : formats = sys.argv[i+1].split(",")
+		if sys.argv[i] == "-n" or sys.argv[i] == "--lines" : line_count = int(sys.argv[i+1])
+		if sys.argv[i] == "-s" or sys.argv[i] == "--fight-size" : fight_size = int(sys.argv[i+1])
+		if sys.argv[i] == "-r" or sys.argv[i] == "--repeat" : repeat = int(sys.argv[i+1])
+		if sys.argv[i] == "--late-init-lines" : late_init_lines = int(sys.argv[i+1])
+		if sys.argv[i] == "--seed" : seed = int(sys.argv[i+1])
+		if sys.argv[i] == "--save" : save_fname = sys.argv[i+1]
+		if sys.argv[i] == "--compare" : compare_fname = sys.argv[i+1]
+		if sys.argv[i] == "--tolerance" : tolerance = float(sys.argv[i+1])
+
+	results = {}
+	for agent_format in formats :
+		print("benchmarking " + agent_format + "...")
+		results[agent_format] = benchmark_format(agent_format, line_count, fight_size, seed, repeat, late_init_lines)
+	print("")
+	print_results(results)
+
+	if save_fname is not None :
+		with open(save_fname, "w") as f : json.dump(results, f, indent = 1)
+		print("results saved to " + save_fname)
+
+	if compare_fname is not None :
+		with open(compare_fname, "r") as f : reference = json.load(f)
+		regressions = compare_results(results, reference, tolerance)
+		for f, measure, reference_lines_per_second, lines_per_second in regressions :
+			print("Regression : " + f + " : " + measure + " : {:.0f} -> {:.0f} lines/s".format(reference_lines_per_second, lines_per_second))
+		if regressions : sys.exit(1)
+		print("no regression against " + compare_fname)
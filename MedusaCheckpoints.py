@@ -0,0 +1,102 @@
+# Medusa gamelog offset checkpoints
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# system and os
+import os
+
+# time management
+import time
+
+# concurrency management
+import threading
+
+# output and formatting
+import json
+
+# On disk checkpoints of how far each tailed gamelog file was read, for a restarted client to resume where it stopped
+# instead of skipping everything written in between (see MedusaClient.setup_watch).
+# Checkpoints are updated in memory once the lines read were sent to the server, and written to disk by flush(), when they changed.
+# Checkpoints of files deleted, or not written to for longer than what a restarted client catches up on, are forgotten on flush.
+# {"saved" : time of the last flush, "files" : {path : {"inode" : inode, "offset" : bytes read and sent, "time" : last log entry sent, epoch seconds}}}
+class OffsetCheckpoints :
+
+	# returns the checkpoint of path as (offset, last log entry time or None), or None if there is none, or if path is another file now
+	def get(self, path) :
+		with self.lock :
+			checkpoint = self.files.get(path)
+		if checkpoint is None : return None
+		try :
+			st = os.stat(path)
+		except OSError :
+			return None
+		if st.st_ino != checkpoint["inode"] or st.st_size < checkpoint["offset"] : return None # replaced or truncated
+		return checkpoint["offset"], checkpoint.get("time")
+
+	# last_time : time of the last log entry sent, None to keep the previous one (e.g nothing but header lines were read)
+	def update(self, path, inode, offset, last_time = None) :
+		with self.lock :
+			checkpoint = self.files.get(path)
+			if checkpoint is not None and checkpoint["inode"] == inode :
+				if last_time is None : last_time = checkpoint.get("time")
+				if checkpoint["offset"] == offset and checkpoint.get("time") == last_time : return
+			self.files[path] = {"inode" : inode, "offset" : offset, "time" : last_time}
+			self.changes += 1
+
+	def forget(self, path) :
+		with self.lock :
+			if self.files.pop(path, None) is not None : self.changes += 1
+
+	# true if path was modified since checkpoints were written by the previous run (e.g created while the client was not running)
+	def is_modified_since_saved(self, path) :
+		try :
+			return self.saved is not None and os.path.getmtime(path) > self.saved
+		except OSError :
+			return False
+
+	def load(self) :
+		try :
+			with open(self.fname, "r", encoding = "utf8") as f :
+				data = json.load(f)
+			self.saved, self.files = data["saved"], data["files"]
+		except FileNotFoundError :
+			self.saved, self.files = None, {}
+		except (OSError, ValueError, KeyError, TypeError) :
+			print("Warning : OffsetCheckpoints : could not read " + self.fname + ", starting from the end of gamelog files")
+			self.saved, self.files = None, {}
+
+	# forget checkpoints of files deleted, or not modified for max_age seconds : a restarted client would not catch up on them anyway
+	def prune(self, max_age) :
+		now = time.time()
+		with self.lock :
+			for path in list(self.files) :
+				try :
+					if os.path.getmtime(path) >= now - max_age : continue
+				except OSError : # deleted
+					pass
+				del self.files[path]
+				self.changes += 1
+
+	# writes checkpoints if they changed since last written, after pruning them if max_age is given (see prune)
+	def flush(self, max_age = None) :
+		if max_age is not None : self.prune(max_age)
+		with self.lock :
+			changes = self.changes
+			if changes == self.flushed_changes : return
+			data = {"saved" : time.time(), "files" : dict(self.files)}
+		try :
+			tmp_fname = self.fname + ".tmp"
+			with open(tmp_fname, "w", encoding = "utf8") as f :
+				json.dump(data, f, indent = 1)
+			os.replace(tmp_fname, self.fname) # never leave half written checkpoints behind
+		except OSError :
+			print("Warning : OffsetCheckpoints : could not write " + self.fname + ", retrying on next flush")
+			return
+		with self.lock : self.flushed_changes = max(self.flushed_changes, changes) # changes made meanwhile are written on next flush
+
+	def __init__(self, fname = "gamelog_offsets.json") :
+		self.fname = fname
+		self.lock = threading.Lock()
+		self.changes = 0 # updates count
+		self.flushed_changes = 0 # updates count when last written
+		self.load()
@@ -4,60 +4,136 @@
 # Author : Tnemelc Abramovich
 
 # internal dependencies
-from MedusaParser import MedusaParser, AgentParser, recursive_merge, re_time, time_str_to_datetime
+from MedusaParser import MedusaParser, recursive_merge, block_size, aggregate_block, re_line_head
+from MedusaSymbolTable import SymbolTable
+from MedusaAgentFormatCache import AgentFormatCache, make_agent_parser
+from MedusaTailer import Tailer, TailReader
+from MedusaGamelogsIndex import GamelogsIndex, parse_session_owner
+from MedusaWire import wire_versions, encode_collection
+from MedusaSendQueue import SendQueue
+from MedusaReplay import Replayer
+from MedusaCheckpoints import OffsetCheckpoints
+from MedusaParsePool import ParsePool, PooledParser
+from MedusaGameTime import GameTime, epoch_to_datetime
 
 # system and os
 import sys
 import os
 import platform
+import signal
+import traceback
 
 # time management
-import datetime
 import time
 
 # concurrency management
-import queue
 import threading
 
 # web app setup and networking
 import socketio
 
 # output and formatting
-import json
 import pprint
-import re
 
 
 class MedusaClient:
-	watch_loop_sleep_time = 1
-	send_loop_sleep_time = 1
 	refresh_watchers_loop_sleep_time = 30
+	reconnect_wait_time = 1 # seconds between checks of the connection when the server is unreachable
+	checkpoint_loop_sleep_time = 5
+	parser_stats_period = 10 # seconds between two parser statistics updates sent to the server
 	# sender thread
 
+	# waits for the next batch of log entries to be due (see SendQueue), and returns it as a single collection
 	def make_entries_collection(self):
+		blocks, queue_stats = self.send_queue.get_blocks()
 		r = {}
 		log_entries_count = 0
-		while True:
-			try:
-				recursive_merge(self.log_entries_queue.get(block=False), r)
-				log_entries_count += 1
-			except queue.Empty:
-				break
+		keep_log_str = self.keep_log_str
+		for block in blocks:
+			# keep_log_str may have changed since blocks were queued (see on_collector_config) : every merged block gets the same columns,
+			# entries parsed without their raw log line get an empty one
+			if not keep_log_str: block.pop("log_str", None)
+			elif not "log_str" in block: block["log_str"] = [""] * block_size(block)
+			# blocks themselves are left unchanged : they are queued again if sending fails (see send_loop)
+			if r == {}: r = {c: column[:] for c, column in block.items()}
+			else: recursive_merge(block, r)
+			log_entries_count += block_size(block)
 		if r == {}: return None
+		# raw log lines, when the server asks for them, cannot be aggregated. Batches hold whole game seconds (see SendQueue.hold_seconds) : a single row per second and key is sent
+		if self.aggregate and not keep_log_str: r = aggregate_block(r)
+		# parser statistics are only sent every parser_stats_period seconds, when they changed
+		now = time.monotonic()
+		if now >= self.parser_stats_next:
+			self.parser_stats_next = now + MedusaClient.parser_stats_period
+			parser_stats = self.get_parser_stats()
+			if parser_stats != self.parser_stats_sent: r["parser_stats"] = parser_stats
+		r["queue_stats"] = queue_stats # queue depth before this batch was taken
+		# names interned since the last collection sent, for the server to translate symbol ids
+		r["symbols"] = [self.symbols_sent, self.symbol_table.names_since(self.symbols_sent)]
 		if self.debug: print("make_entries_collection : ready to send next entry collection with " +
 		                     str(log_entries_count) + " log entries")
 		# if self.debug : pprint.pprint(r)
 		return r
 	def send_loop(self) :
 		print("thread " + str(threading.get_ident()) + 
-			  " entering send loop. MedusaClient.send_loop_sleep_time = " + str(MedusaClient.send_loop_sleep_time))
+			  " entering send loop. flush rows = " + str(self.send_queue.flush_rows) + ", max latency = " + str(self.send_queue.max_latency) + "s")
 		while True :
-			col = self.make_entries_collection()
+			# while disconnected, log entries stay queued (and the oldest droppable ones get dropped if the queue fills up)
+			if not self.socketio_client.connected :
+				time.sleep(MedusaClient.reconnect_wait_time)
+				continue
+			try :
+				col = self.make_entries_collection()
+				if col is not None :
+					if self.debug : print("send_loop : sending collected log entries (queue stats : " + str(col["queue_stats"]) + ") : ")
+					if self.debug : pprint.pprint(col)
+					if self.wire_version is not None :
+						self.socketio_client.emit("log_entries_bin", encode_collection(col, self.wire_version), namespace='/medusacollector')
+					else :
+						self.socketio_client.emit("log_entries_col", col, namespace='/medusacollector')
+			except Exception :
+				# the batch goes back to the queue, checkpoints stay where they are
+				print("Warning : MedusaClient : could not send log entries, retrying : " + repr(sys.exc_info()[1]))
+				traceback.print_exc()
+				self.send_queue.task_done(sent = False)
+				time.sleep(MedusaClient.reconnect_wait_time)
+				continue
 			if col is not None :
-				if self.debug : print("send_loop : sending collected log entries : ")
-				if self.debug : pprint.pprint(col)
-				self.socketio_client.emit("log_entries_col", col, namespace='/medusacollector')
-			time.sleep(MedusaClient.send_loop_sleep_time)
+				symbols = col["symbols"]
+				self.symbols_sent = symbols[0] + len(symbols[1])
+				if "parser_stats" in col : self.parser_stats_sent = col["parser_stats"]
+			self.send_queue.task_done() # checkpoints of the lines just sent move forward (see on_lines_sent)
+
+	# per-rule statistics of every parser, merged by session owner
+	def get_parser_stats(self):
+		r = {}
+		for parser in list(self.parsers.values()):
+			owner_stats = r.setdefault(parser.session_owner, {})
+			for rule_name, stats in parser.get_rule_stats().items():
+				if not rule_name in owner_stats: owner_stats[rule_name] = dict(stats)
+				else:
+					for k, v in stats.items(): owner_stats[rule_name][k] += v
+		return r
+
+	def print_parser_stats(self):
+		for parser in list(self.parsers.values()): parser.print_rule_stats()
+
+	# dump parser and send queue statistics, e.g on SIGUSR1 (see setup_stats_signal)
+	def print_stats(self):
+		self.print_parser_stats()
+		print("MedusaClient : send queue statistics : " + str(self.send_queue.get_stats()))
+
+	# statistics are dumped on SIGUSR1 ("kill -USR1 <pid>"), where available
+	def setup_stats_signal(self):
+		if not hasattr(signal, "SIGUSR1"): return
+		previous_handler = signal.getsignal(signal.SIGUSR1)
+		def on_signal(signum, frame):
+			self.print_stats()
+			if callable(previous_handler): previous_handler(signum, frame)
+		try:
+			signal.signal(signal.SIGUSR1, on_signal)
+		except ValueError: # not the main thread
+			print("Warning : MedusaClient : could not set up statistics dump on SIGUSR1")
 
 	def setup_send_loop_thread(self):
 		t = threading.Thread(target=self.send_loop, name="send_loop")
@@ -67,100 +143,141 @@ class MedusaClient:
 
 	# watcher thread
 
-	def watch_loop(self, f, fname, parser):
-		print("thread " + str(threading.get_ident()) +
-		      " entering watch loop. MedusaClient.watch_loop_sleep_time = " + str(MedusaClient.watch_loop_sleep_time))
-		while fname in self.watcher_threads:
-			l = f.readline()
-			if not l:
-				time.sleep(MedusaClient.watch_loop_sleep_time)
-			else:
-				if self.debug: print(l)
-				self.log_entries_queue.put(parser.parse(l))
-		f.close()
+	# tailer callback : parse the lines appended to a watched file since last read
+	# under watch_lock : remove_watch closes the reader, the file may have been unwatched since the tailer noticed the change
+	def read_watched_file(self, fname):
+		with self.watch_lock:
+			if not fname in self.watched_files: return
+			reader, parser = self.watched_files[fname]
+			self.read_lines(fname, reader, parser, reader.read_lines())
+
+	# the checkpoint of fname moves forward once the lines are sent, or dropped (see SendQueue)
+	def read_lines(self, fname, reader, parser, lines):
+		if not lines: return
+		if self.debug: print("\n".join(lines))
+		sent_token = (reader.inode, reader.get_line_offset())
+		if self.parse_pool is not None: # parsed blocks come back to on_pool_block
+			parser.parse_many(lines, self.keep_log_str, sent_token)
+			return
+		self.queue_lines_block(fname, parser.parse_many(lines, self.keep_log_str), sent_token)
+
+	def queue_lines_block(self, fname, block, sent_token):
+		last_time = max(block["time"]) if block_size(block) > 0 else None
+		self.send_queue.put(block, lambda: self.on_lines_sent(fname, sent_token, last_time))
+
+	# send queue callback : lines of fname up to the offset in sent_token were sent, the last log entry sent is timed last_time
+	def on_lines_sent(self, fname, sent_token, last_time):
+		inode, offset = sent_token
+		watched = self.watched_files.get(fname)
+		if watched is None or watched[0].inode != inode: return # not watched anymore
+		self.checkpoints.update(fname, inode, offset, last_time)
+
+	# parse pool callbacks
+	def on_pool_block(self, fname, block, sent_token):
+		self.queue_lines_block(fname, block, sent_token)
+
+	def on_pool_agent_detected(self, fname, agent_re):
+		parser = self.parsers.get(fname)
+		if parser is None: return
+		if agent_re is not None: self.agent_format_cache.put(parser.session_owner, agent_re)
+		else: self.agent_format_cache.forget(parser.session_owner)
+
+	# lines written while the client was not running : the ones the server would not keep anyway are skipped (see on_collector_config),
+	# as well as the ones timed before the last log entry sent, if known (see OffsetCheckpoints)
+	def catch_up(self, fname, reader, parser, last_sent_time = None):
+		lines = reader.read_lines()
+		if not lines: return
+		cutoff_time = GameTime.now_epoch() - self.catch_up_max_age
+		if last_sent_time is not None: cutoff_time = max(cutoff_time, last_sent_time)
+		cutoff_time_str = epoch_to_datetime(cutoff_time).strftime("%Y.%m.%d %H:%M:%S")
+		# log entries only, header lines ("  Listener: ...") included otherwise
+		recent_lines = [l for l in lines if re_line_head.match(l) is not None and l[2:21] >= cutoff_time_str] # "[ 2020.07.09 11:35:20 ] ..."
+		print("catching up on " + fname + " : " + str(len(recent_lines)) + " recent lines, " + str(len(lines) - len(recent_lines)) + " older or header lines skipped")
+		self.read_lines(fname, reader, parser, recent_lines)
+		if not recent_lines: self.checkpoints.update(fname, reader.inode, reader.get_line_offset()) # nothing of fname to send
+
+	def checkpoint_loop(self):
+		while True:
+			time.sleep(MedusaClient.checkpoint_loop_sleep_time)
+			self.checkpoints.flush(self.catch_up_max_age)
+
+	def setup_checkpoint_loop_thread(self):
+		t = threading.Thread(target=self.checkpoint_loop, name="checkpoint_loop")
+		t.daemon = True
+		t.start()
+		return t
 
+	# replay a session recorded by the server (see Replayer), at replay_speedup times the game speed, between replay_start and replay_end
 	def replay_file(self, fname):
 		print("thread " + str(threading.get_ident()) + " entering replay loop.")
-		replay_speedup = 1
-		replay_time = None
-		with open(fname, "r", encoding='utf8') as f:
-			while True:
-				try: l = f.readline()
-				except:
-					"could not read line"
-				if not l: break
-				else:
-					m = re.match(r"(\[(?P<session_owner>(\w+ ?)+)\])?\s?" +
-					             re_time + "(?P<log_str>.*)", l)
-					if m is None:
-						print("could not read session replay line : \n" + l)
-						continue
-					gdict = m.groupdict()
-					if gdict["session_owner"] is None:
-						parser = MedusaParser(gdict["Unknown"], self.debug)
-					else:
-						parser = MedusaParser(gdict["session_owner"], self.debug)
-					log_entry_time = time_str_to_datetime(gdict['time_str'])
-					if replay_time is None: replay_time = log_entry_time
-					if replay_time > log_entry_time:  # ! TODO : do it better
-						sleeptime = (log_entry_time - replay_time).total_seconds() / \
-						             replay_speedup
-						print("sleeping for" + sleeptime)
-						time.sleep(sleeptime)
-					print("new line in replay file : " + l)
-					self.log_entries_queue.put(parser.parse(
-					    "[ " + gdict["time_str"] + " ]" + gdict["log_str"]))
-
-	def parse_session_owner(self, f):
-		while True:
-			l = f.readline()
-			if not l: return None
-			m = re.match(r"\s*Listener:\s*(?P<session_owner>(\w+ ?)+)", l)
-			if m:
-				r = m.groupdict()["session_owner"]
-				return r
-		return None
+		replayer = Replayer(fname, self.queue_replay_lines, self.replay_speedup, self.replay_start, self.replay_end, self.debug)
+		start = time.monotonic()
+		lines_replayed = replayer.run()
+		print("MedusaClient : replayed " + str(lines_replayed) + " lines in " + "{:.1f}".format(time.monotonic() - start) + "s")
 
+	# Replayer callback : one parser per session owner, compiled rules are shared through the parser rule set cache
+	def queue_replay_lines(self, session_owner, lines):
+		parser = self.parsers.get(session_owner)
+		if parser is None:
+			parser = self.parsers[session_owner] = MedusaParser(session_owner, debug = self.debug, symbol_table = self.symbol_table)
+		block = parser.parse_many(lines, self.keep_log_str)
+		if block_size(block) > 0: self.send_queue.put(block)
+
+	# agent parser for session_owner, from its overview file or agent format cache (see make_agent_parser)
 	def make_agent_parser(self, session_owner) :
-		logs_dirs = self.get_logs_dirs_path()
-		ov_files = []
-		for dirpath in logs_dirs :
-			ov_files.append(os.path.join(os.path.split(dirpath)[0], "Overview", session_owner + ".yaml"))
-			ov_files.append(os.path.join(os.path.split(dirpath)[0], "Overview", "overview.yaml"))
-		ov_files.append(session_owner + ".yaml")
-		ov_files.append("overview.yaml")
-
-		r = None
-
-		for fname in ov_files :
-			try : 
-				r = AgentParser(overview_filename = fname)
-				print("found overview configuration file :" + fname)
-				break
-			except FileNotFoundError: 
-				if self.debug : print("Warning : make_agent_parser : file not found : " +  fname)
-
-		if r == None : print("found no overview setup file, defaulting to late initialization")
-		r = AgentParser()
-		return r
+		return make_agent_parser(session_owner, self.get_logs_dirs_path(), self.agent_format_cache, self.debug)
+
+	# parser of a gamelog file : a local one, or a proxy of a parser running in the parse pool when enabled
+	def make_parser(self, fname, session_owner) :
+		agent_parser = self.make_agent_parser(session_owner)
+		if self.parse_pool is None : return MedusaParser(session_owner, agent_parser, self.debug, self.symbol_table)
+		return PooledParser(self.parse_pool, fname, session_owner, agent_parser.agent_re if agent_parser.is_init else None, agent_parser.redetectable)
 		
-	def setup_watch_loop_thread(self, fname) :
-		if self.debug : print("setup_watch_loop_thread : " + fname)
-		f = open(fname, "r", encoding='utf8')
-		session_owner = self.parse_session_owner(f)
+	# start tailing a gamelog file, returns False if it is not a gamelog (yet).
+	# files are read from their checkpoint if any, from their start if written while the client was not running, or else from their end
+	def setup_watch(self, fname) :
+		if self.debug : print("setup_watch : " + fname)
+		with open(fname, "r", encoding='utf8') as f :
+			session_owner = parse_session_owner(f)
 		if session_owner is None:
 			if self.debug : print("could not find session owner. Ignoring file")
-			return None
+			return False
 		else: print("found new log file for character " + session_owner)
-		parser = MedusaParser(session_owner, self.make_agent_parser(session_owner), self.debug)
-		f.seek(0, 2)
-		t = threading.Thread(target=self.watch_loop, name="watch_loop " + fname, args=(f, fname, parser))
-		t.daemon = True
-		t.start()
-		return t
-		# return None # return present in precedent line
+		parser = self.make_parser(fname, session_owner)
+		checkpoint = self.checkpoints.get(fname)
+		last_sent_time = None
+		if checkpoint is not None :
+			offset, last_sent_time = checkpoint
+			reader = TailReader(fname, offset = offset)
+		else : reader = TailReader(fname, from_end = not self.checkpoints.is_modified_since_saved(fname))
+		# watched before catching up, for its checkpoint to move forward once caught up lines are sent (see on_lines_sent)
+		self.parsers[fname] = parser
+		self.watched_files[fname] = (reader, parser)
+		self.catch_up(fname, reader, parser, last_sent_time)
+		self.tailer.watch(fname, lambda : self.read_watched_file(fname))
+		return True
+
+	# a brand new gamelog file may not have its header written yet : until it does, the file is watched for its header
+	def add_watch(self, fname) :
+		with self.watch_lock :
+			if fname in self.watched_files : return
+			if self.setup_watch(fname) : self.pending_files.discard(fname)
+			elif not fname in self.pending_files :
+				self.pending_files.add(fname)
+				self.tailer.watch(fname, lambda : self.add_watch(fname))
+
+	def remove_watch(self, fname) :
+		with self.watch_lock :
+			self.tailer.unwatch(fname)
+			self.pending_files.discard(fname)
+			if not fname in self.watched_files : return
+			reader, parser = self.watched_files.pop(fname)
+			reader.close()
+			self.parsers.pop(fname, None)
+			self.checkpoints.forget(fname)
+			if self.parse_pool is not None : self.parse_pool.forget(fname)
 
-	# refresh watcher threads thread
+	# refresh watched files thread
 	def get_logs_dirs_path(self) :
 		logs_dirs = []
 		if self.client_logs_dir_path is not None :
@@ -181,38 +298,22 @@ class MedusaClient:
 			logs_dirs.append("~/.local/share/Steam/steamapps/compatdata/8500/pfx/drive_c/users/steamuser/My Documents/EVE/logs")
 		return logs_dirs
 
+	def get_gamelogs_dirs_path(self) :
+		return [os.path.join(d, "Gamelogs") for d in self.get_logs_dirs_path()]
+
 	def get_log_file_path_list(self):
-		# look for eve online log files
-		logs_dirs = self.get_logs_dirs_path()
-		r = []
-		
-		for d in logs_dirs :
-			try : 
-				gamelogs_dir_path = os.path.join(d, "Gamelogs")
-				flist = os.listdir(gamelogs_dir_path)
-				flist = list(filter(lambda x : x.endswith('.txt'), flist)) # filter .txt files
-				yesterday = datetime.datetime.now() - datetime.timedelta(days = 1)
-				time_filter_comp = "{:04}{:02}{:02}_{:02}{:02}{:02}.txt".format( yesterday.year, yesterday.month, yesterday.day, yesterday.hour, yesterday.minute, yesterday.second )
-				flist = list(filter(lambda x : x > time_filter_comp, flist)) # filter files that are les than 24h old
-				if self.debug : print("found " + str(len(flist)) + " files that are less than 24h old")
-				r = r + [os.path.join(gamelogs_dir_path, x) for x in flist]
-			except FileNotFoundError : 
-				# print("Warning directory not found : " + sys.exc_info()[1]) # error in str concatenation
-				if self.debug : print("Warning directory not found : " + d)
-		if (len(r) == 0) : print("Warning : no game log files were found")
-		return r
+		# look for eve online log files, without listing directories that did not change
+		self.gamelogs_index.refresh()
+		return self.gamelogs_index.get_recent_files()
 	
 	def refresh_watchers(self) :
 		filename_list = self.get_log_file_path_list()
 		for f in filename_list :
-			if not f in self.watcher_threads :
-				self.watcher_threads[f] = True # because thread may startup and attempt to check if it is allowed to kepp running before the thread setup call returns the newly constructed thread object
-				t = self.setup_watch_loop_thread(f)
-				if t is not None : self.watcher_threads[f] = t
-				else : del self.watcher_threads[f]
-		for f in list(self.watcher_threads.keys()) :
+			if not f in self.watched_files :
+				self.add_watch(f)
+		for f in list(self.watched_files.keys()) + list(self.pending_files) :
 			if not f in filename_list :
-				del self.watcher_threads[f]
+				self.remove_watch(f)
 	
 	def refresh_watchers_loop(self) : 
 		print("thread " + str(threading.get_ident()) + " entering refresh watchers loop. MedusaClient.refresh_watchers_loop_sleep_time = " + str(MedusaClient.refresh_watchers_loop_sleep_time))
@@ -226,30 +327,81 @@ class MedusaClient:
 		t.start()
 		return t
 	
+	# 'collector_config' event handler : the server tells its clients what it expects in log entries collections
+	def on_collector_config(self, config) :
+		if self.debug : print("on_collector_config : " + str(config))
+		self.keep_log_str = bool(config.get("log_str", False))
+		if self.aggregate and self.keep_log_str: print("MedusaClient : the server writes replay logs, sending log entries instead of aggregates")
+		self.send_queue.hold_seconds = self.aggregate and not self.keep_log_str
+		self.symbols_sent = 1 # new connection : every symbol has to be sent again (symbol 0 is None on both ends)
+		self.parser_stats_sent = None # and statistics as well
+		# the server drops log entries older than its persistance duration : no need to send them when catching up
+		self.catch_up_max_age = config.get("persistance", self.catch_up_max_age)
+		# highest wire format version known on both ends, or json for older servers
+		common_versions = set(config.get("wire_versions", [])) & set(wire_versions)
+		self.wire_version = max(common_versions) if common_versions else None
+		if self.debug : print("on_collector_config : sending " + ("wire format version " + str(self.wire_version) if self.wire_version is not None else "json") + " collections")
+
 	def run(self) :
 		if self.replay_filename is not None : # replay mode
 			self.replay_file(self.replay_filename)
+			# let the sender thread deliver the end of the replay before leaving : queued entries, and the batch being sent
+			while self.socketio_client.connected and not self.send_queue.join(MedusaClient.reconnect_wait_time) : pass
 		else :
+			self.tailer.start()
+			self.setup_checkpoint_loop_thread()
+			# new gamelog files are picked up as soon as they are created, refresh_watchers only drops old ones
+			self.gamelogs_index = GamelogsIndex(self.get_gamelogs_dirs_path(), self.tailer, self.add_watch, self.debug)
 			self.refresh_watchers_loop()
 	
-	def __init__(self, client_logs_dir_path = None, server_addr = "localhost", server_port = 1877, replay_filename = None, debug = True) :
+	# aggregate : send log entries aggregated per second, source, target and weapon instead of every entry (see MedusaParser.aggregate_block)
+	# replay_speedup : game seconds replayed per second, None or 0 to replay as fast as possible
+	# replay_start, replay_end : epoch seconds, only replay log lines timed in between
+	# parse_processes : parse gamelogs in that many worker processes (see ParsePool), 0 to parse them in the tailer thread
+	def __init__(self, client_logs_dir_path = None, server_addr = "localhost", server_port = 1877, replay_filename = None, aggregate = False, debug = True,
+	             replay_speedup = 1., replay_start = None, replay_end = None, parse_processes = 0) :
 		print ("New MedusaClient")
 		self.client_logs_dir_path = client_logs_dir_path
 		self.debug = debug
-		self.log_entries_queue = queue.Queue()
-		self.watcher_threads = {}
+		self.symbol_table = SymbolTable() # shared by every parser
+		# worker processes are started first, before this process runs any other thread
+		self.parse_pool = None
+		if parse_processes and replay_filename is None :
+			self.parse_pool = ParsePool(self.symbol_table, self.on_pool_block, self.on_pool_agent_detected, parse_processes, debug)
+		self.send_queue = SendQueue()
+		self.watched_files = {} # file name -> (TailReader, parser), for every tailed gamelog
+		self.pending_files = set() # new files watched until their header is written
+		self.watch_lock = threading.Lock()
+		self.tailer = Tailer(self.debug)
+		self.gamelogs_index = None
+		self.parsers = {} # parsers by watched file name, or by session owner in replay mode
+		self.symbols_sent = 1
+		self.parser_stats_sent = None # latest parser statistics sent to the server
+		self.parser_stats_next = 0 # monotonic time parser statistics are due
+		self.agent_format_cache = AgentFormatCache()
+		self.checkpoints = OffsetCheckpoints()
+		self.catch_up_max_age = 15 # seconds, until the server tells its persistance duration (see on_collector_config)
 		self.replay_filename = replay_filename
+		self.replay_speedup = replay_speedup
+		self.replay_start = replay_start
+		self.replay_end = replay_end
+		self.aggregate = aggregate
+		self.keep_log_str = False # raw log lines are only sent when the server asks for them (see on_collector_config)
+		self.send_queue.hold_seconds = aggregate # aggregates are only sent for whole game seconds
+		self.wire_version = None # binary collections are only sent to servers supporting them (see on_collector_config)
 		
 		self.server_addr = server_addr
 		self.server_port = server_port
 		self.socketio_client = socketio.Client()
 		target = self.server_addr
 		if self.server_port is not None : target += ":" + str(self.server_port)
+		self.socketio_client.on("collector_config", self.on_collector_config, namespace='/medusacollector')
 		print ("MedusaClient : connecting to " + target)
 		self.socketio_client.connect(target, namespaces=['/medusacollector'])
 		print ("MedusaClient : connected to " + target)
 		
 		self.setup_send_loop_thread()
+		self.setup_stats_signal()
 		
 	
 	def __del__(self) :
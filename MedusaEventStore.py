@@ -0,0 +1,85 @@
+# Medusa event store
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import new_block, block_size, select_block_rows, recursive_merge
+
+# data layout
+import bisect
+
+# Time ordered store of log entries (see MedusaParser.block_columns) : one block per game second, whatever the order entries arrive in.
+# Entries from lagging clients are accepted as long as they are at most max_lateness seconds older than the newest entry,
+# and newer than the last expiry : older ones are dropped.
+# Expiry pops whole seconds from the head of the store, and range queries only visit the seconds they cover.
+# Without retain, the store only filters late entries out (e.g when status info is maintained as entries come, see MedusaAggregator) : nothing is kept.
+class EventStore :
+
+	# add the rows of block to the store, returns the block of rows actually stored (late rows being dropped)
+	def add_block(self, block) :
+		times = block["time"]
+		n = block_size(block)
+		if n == 0 : return block
+		oldest, newest = min(times), max(times)
+		if self.newest is None or newest > self.newest : self.newest = newest
+		cutoff = max(self.expired_until, self.newest - self.max_lateness)
+		if oldest >= cutoff and (oldest == newest or not self.retain) : # nothing late, and a single second or nothing to keep : the common case
+			if self.retain : self.add_second_rows(oldest, block)
+			return block
+		seconds = {}
+		for i, t in enumerate(times) :
+			if t >= cutoff : seconds.setdefault(t, []).append(i)
+		accepted = []
+		for t, indexes in seconds.items() :
+			if self.retain : self.add_second_rows(t, select_block_rows(block, indexes))
+			accepted.extend(indexes)
+		self.dropped += n - len(accepted)
+		if len(accepted) == n : return block
+		return select_block_rows(block, sorted(accepted))
+
+	def add_second_rows(self, t, block) :
+		bucket = self.buckets.get(t)
+		if bucket is None :
+			bucket = self.buckets[t] = new_block(self.columns, typed = True, symbols = self.symbols)
+			bisect.insort(self.seconds, t)
+		recursive_merge({c : block[c] for c in self.columns}, bucket)
+		self.rows += block_size(block)
+
+	# forget every entry older than cutoff (epoch seconds)
+	def expire(self, cutoff) :
+		if cutoff > self.expired_until : self.expired_until = cutoff
+		count = bisect.bisect_left(self.seconds, cutoff)
+		for t in self.seconds[:count] : self.rows -= block_size(self.buckets.pop(t))
+		del self.seconds[:count]
+
+	# returns a single block of the entries timed between start and end (epoch seconds, included, both optional), in time order
+	def get_range(self, start = None, end = None) :
+		r = new_block(self.columns, typed = True, symbols = self.symbols)
+		lo = bisect.bisect_left(self.seconds, start) if start is not None else 0
+		hi = bisect.bisect_right(self.seconds, end) if end is not None else len(self.seconds)
+		for t in self.seconds[lo:hi] : recursive_merge(self.buckets[t], r)
+		return r
+
+	# entries of the last seconds seconds, up to now
+	def get_last(self, seconds, now) :
+		return self.get_range(now - seconds + 1, now)
+
+	def get_block(self) :
+		return self.get_range()
+
+	def __len__(self) :
+		return self.rows
+
+	# columns : block columns stored, as typed arrays (symbol columns included if symbols, see new_block)
+	# retain : keep the entries accepted, for range queries
+	def __init__(self, columns, max_lateness, symbols = True, retain = True) :
+		self.columns = columns
+		self.max_lateness = max_lateness
+		self.symbols = symbols
+		self.retain = retain
+		self.buckets = {} # game second -> block
+		self.seconds = [] # game seconds of the buckets, sorted
+		self.rows = 0
+		self.newest = None # newest entry time
+		self.expired_until = 0 # entries older than this are dropped
+		self.dropped = 0 # late entries dropped
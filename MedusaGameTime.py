@@ -9,6 +9,35 @@
 
 import datetime
 
+
+# Timestamp engine : game logs timestamps have a fixed "YYYY.MM.DD HH:MM:SS" layout (UTC), parsed by slicing instead of strptime.
+# Log lines come in bursts sharing the same few seconds : the last time_str_cache_size distinct strings are memoized.
+# Timestamps are meant to be parsed once, at ingestion, and carried around as integer epoch seconds afterwards.
+epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+time_str_cache = {}
+time_str_cache_size = 16
+
+def time_str_to_epoch(time_str) :
+	r = time_str_cache.get(time_str)
+	if r is not None : return r
+	r = ((datetime.date(int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10])).toordinal() - epoch_ordinal) * 86400
+		+ int(time_str[11:13]) * 3600 + int(time_str[14:16]) * 60 + int(time_str[17:19]))
+	if len(time_str_cache) >= time_str_cache_size :
+		try : del time_str_cache[next(iter(time_str_cache))] # evict the oldest string
+		except (KeyError, RuntimeError, StopIteration) : pass # evicted concurrently by another thread
+	time_str_cache[time_str] = r
+	return r
+
+def time_str_to_datetime(time_str) :
+	return datetime.datetime(int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]), int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19]))
+
+def epoch_to_datetime(epoch) :
+	return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds = epoch)
+
+def datetime_to_epoch(dt) :
+	return (dt.toordinal() - epoch_ordinal) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
 class GameTime :
 	dt = None # the smallest timedelta observed between any server datetime and now
 
@@ -23,7 +52,7 @@ class GameTime :
 
 	@classmethod
 	def time_str_to_datetime(cls, time_str) :
-		return datetime.datetime.strptime(time_str,"%Y.%m.%d %H:%M:%S")
+		return time_str_to_datetime(time_str)
 	
 	@classmethod
 	def parse(cls, str, update_ref = True) : # init from eve logs string
@@ -36,5 +65,8 @@ class GameTime :
 		if cls.dt is None : return datetime.datetime.utcnow()
 		return datetime.datetime.now() - cls.dt
 
+	@classmethod
+	def now_epoch(cls) : return datetime_to_epoch(cls.now())
+
 	@classmethod
 	def now_str(cls) : return cls.now().strftime("%Y.%m.%d %H:%M:%S")
@@ -0,0 +1,116 @@
+# Medusa gamelogs directory index
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# system and os
+import os
+
+# time management
+import datetime
+
+# concurrency management
+import threading
+
+# output and formatting
+import re
+
+# gamelog header line naming the session owner : "  Listener: Tnemelc Abramovich"
+re_listener = re.compile(r"\s*Listener:\s*(?P<session_owner>(\w+ ?)+)")
+
+# returns the session owner found in the header of the gamelog file f, or None
+def parse_session_owner(f) :
+	while True :
+		l = f.readline()
+		if not l : return None
+		m = re_listener.match(l)
+		if m : return m.groupdict()["session_owner"]
+
+# Incremental index of recent gamelog files (less than max_age old), over a set of Gamelogs directories.
+# Gamelogs directories hold years worth of files : each directory is scanned once, only keeping recent files,
+# then new files are added as they are created, from tailer directory events (see Tailer.watch_directory),
+# or from a new scan when the directory mtime changed (refresh).
+# on_new_file(path) is called for every new recent file found after the first scan.
+class GamelogsIndex :
+	max_age = datetime.timedelta(days = 1)
+
+	# gamelog file names start with their creation date : "20200711_094402.txt", "20200711_094402_123456789.txt"
+	def get_cutoff_name(self) :
+		cutoff = datetime.datetime.now() - GamelogsIndex.max_age
+		return "{:04}{:02}{:02}_{:02}{:02}{:02}.txt".format(cutoff.year, cutoff.month, cutoff.day, cutoff.hour, cutoff.minute, cutoff.second)
+
+	def is_recent(self, name, cutoff_name) :
+		return name.endswith(".txt") and name > cutoff_name
+
+	def get_dir_mtime(self, dirpath) :
+		try :
+			return os.stat(dirpath).st_mtime_ns
+		except OSError :
+			return None
+
+	# (re)scan a directory, returns the recent files found that were not indexed yet
+	def scan_dir(self, dirpath) :
+		cutoff_name = self.get_cutoff_name()
+		mtime = self.get_dir_mtime(dirpath)
+		try :
+			with os.scandir(dirpath) as it :
+				names = [entry.name for entry in it if self.is_recent(entry.name, cutoff_name)]
+		except OSError :
+			if self.debug : print("Warning directory not found : " + dirpath)
+			return []
+		if self.debug : print("GamelogsIndex : scanned " + dirpath + ", found " + str(len(names)) + " files that are less than " + str(GamelogsIndex.max_age) + " old")
+		with self.lock :
+			first_scan = not dirpath in self.dir_mtimes
+			self.dir_mtimes[dirpath] = mtime
+			new_files = [os.path.join(dirpath, name) for name in names if not os.path.join(dirpath, name) in self.files]
+			self.files.update(new_files)
+		if first_scan and self.tailer is not None : self.tailer.watch_directory(dirpath, lambda name : self.on_dir_change(dirpath, name))
+		return new_files
+
+	# tailer directory callback
+	def on_dir_change(self, dirpath, name) :
+		if name is None :
+			new_files = self.scan_dir(dirpath)
+		elif self.is_recent(name, self.get_cutoff_name()) :
+			path = os.path.join(dirpath, name)
+			with self.lock :
+				new_files = [] if path in self.files else [path]
+				self.files.update(new_files)
+		else :
+			new_files = []
+		for path in new_files : self.notify_new_file(path)
+
+	def notify_new_file(self, path) :
+		if self.debug : print("GamelogsIndex : new gamelog file " + path)
+		if self.on_new_file is not None : self.on_new_file(path)
+
+	# scans directories seen for the first time or modified since last scan, without listing the others
+	def refresh(self) :
+		for dirpath in self.gamelogs_dirs :
+			mtime = self.get_dir_mtime(dirpath)
+			if mtime is None : continue # not found (yet)
+			with self.lock :
+				known = dirpath in self.dir_mtimes
+				unchanged = self.dir_mtimes.get(dirpath) == mtime
+			if unchanged : continue
+			new_files = self.scan_dir(dirpath)
+			if known :
+				for path in new_files : self.notify_new_file(path)
+
+	# returns the list of indexed recent files, forgetting the ones that got too old
+	def get_recent_files(self) :
+		cutoff_name = self.get_cutoff_name()
+		with self.lock :
+			self.files = set(path for path in self.files if self.is_recent(os.path.basename(path), cutoff_name))
+			r = sorted(self.files)
+		if len(r) == 0 : print("Warning : no game log files were found")
+		return r
+
+	def __init__(self, gamelogs_dirs, tailer = None, on_new_file = None, debug = False) :
+		self.gamelogs_dirs = [os.path.expanduser(d) for d in gamelogs_dirs]
+		self.tailer = tailer
+		self.on_new_file = on_new_file
+		self.debug = debug
+		self.lock = threading.Lock()
+		self.dir_mtimes = {} # directory path -> mtime at last scan
+		self.files = set() # recent gamelog file paths
+		self.refresh()
@@ -0,0 +1,141 @@
+# Medusa parse pool
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import MedusaParser, AgentParser, block_symbol_columns
+from MedusaSymbolTable import SymbolTable, SymbolMap
+
+# system and os
+import sys
+
+# concurrency management
+import threading
+import multiprocessing
+
+# Parsing backend running parsers in worker processes, for clients tailing many gamelogs at once (multiboxing) :
+# parser threads of a single process contend on the GIL, worker processes parse on every core.
+# Each gamelog file is assigned to a single worker, which keeps its parser : lines of a file are parsed in order, by the same parser.
+# Workers have their own symbol table : blocks come back with the names interned since the last block of that worker,
+# and are translated into the client symbol table before being passed to on_block(key, block, token).
+# PooledParser stands for a MedusaParser living in a worker, for the client to use it as a local one.
+
+# worker process main loop : tasks are ("parse", key, session owner, agent regexp or None, redetectable, lines, keep_log_str, token) or ("forget", key), None to stop
+# results are (worker id, key, block, [first new symbol id, new symbol names], rule statistics, agent format changes, token)
+# agent format changes are the agent regexps detected by this parse (late initialization or redetection), None for an invalidated one (see AgentParser)
+def parse_worker_loop(worker_id, task_queue, result_queue, debug) :
+	symbol_table = SymbolTable()
+	symbols_sent = 1
+	parsers = {}
+	agent_changes = {} # key -> agent format changes since the last result
+	while True :
+		task = task_queue.get()
+		if task is None : break
+		if task[0] == "forget" :
+			parsers.pop(task[1], None)
+			agent_changes.pop(task[1], None)
+			continue
+		op, key, session_owner, agent_re, redetectable, lines, keep_log_str, token = task
+		parser = parsers.get(key)
+		if parser is None :
+			changes = agent_changes[key] = []
+			agent_parser = AgentParser(agent_re = agent_re, debug = debug, detected_callback = changes.append, redetectable = redetectable, invalidated_callback = lambda changes = changes : changes.append(None))
+			parser = parsers[key] = MedusaParser(session_owner, agent_parser, debug, symbol_table)
+		try :
+			block = parser.parse_many(lines, keep_log_str)
+		except Exception :
+			print("Warning : parse worker " + str(worker_id) + " : could not parse lines of " + str(key) + " : " + str(sys.exc_info()[1]))
+			continue
+		names = symbol_table.names_since(symbols_sent)
+		changes = list(agent_changes[key])
+		del agent_changes[key][:]
+		result_queue.put((worker_id, key, block, [symbols_sent, names], parser.get_rule_stats(), changes, token))
+		symbols_sent += len(names)
+
+class ParsePool :
+
+	# returns the worker parsing key, assigning one if needed (the one with the fewest files)
+	def get_worker(self, key) :
+		with self.lock :
+			worker_id = self.assignments.get(key)
+			if worker_id is None :
+				loads = [0] * len(self.workers)
+				for w in self.assignments.values() : loads[w] += 1
+				worker_id = self.assignments[key] = loads.index(min(loads))
+			return worker_id
+
+	# token : any picklable value, passed back to on_block along with the parsed block
+	def parse(self, key, session_owner, agent_re, redetectable, lines, keep_log_str, token = None) :
+		self.task_queues[self.get_worker(key)].put(("parse", key, session_owner, agent_re, redetectable, lines, keep_log_str, token))
+
+	def forget(self, key) :
+		with self.lock :
+			worker_id = self.assignments.pop(key, None)
+			self.rule_stats.pop(key, None)
+		if worker_id is not None : self.task_queues[worker_id].put(("forget", key))
+
+	def get_rule_stats(self, key) :
+		with self.lock : return self.rule_stats.get(key, {})
+
+	def result_loop(self) :
+		while True :
+			worker_id, key, block, symbols, rule_stats, agent_changes, token = self.result_queue.get()
+			symbol_map = self.symbol_maps[worker_id]
+			symbol_map.add_names(*symbols)
+			for c in block_symbol_columns :
+				if c in block : block[c] = symbol_map.map_column(block[c])
+			with self.lock :
+				if not key in self.assignments : continue # forgotten meanwhile
+				self.rule_stats[key] = rule_stats
+			if self.on_detected is not None :
+				for agent_re in agent_changes : self.on_detected(key, agent_re)
+			self.on_block(key, block, token)
+
+	def stop(self) :
+		for task_queue in self.task_queues : task_queue.put(None)
+
+	# processes : number of worker processes (one per core by default)
+	# on_block(key, block, token) : called with every parsed block (possibly empty), symbol ids translated into symbol_table ids, and the token given to parse()
+	# on_detected(key, agent_re) : called when the agent format of key was detected by late initialization or redetection, with None when it was invalidated
+	def __init__(self, symbol_table, on_block, on_detected = None, processes = None, debug = False) :
+		self.on_block = on_block
+		self.on_detected = on_detected
+		self.lock = threading.Lock()
+		self.assignments = {} # key -> worker id
+		self.rule_stats = {} # key -> latest rule statistics
+		processes = processes or multiprocessing.cpu_count()
+		self.result_queue = multiprocessing.Queue()
+		self.task_queues = [multiprocessing.Queue() for i in range(processes)]
+		self.symbol_maps = [SymbolMap(symbol_table) for i in range(processes)]
+		self.workers = []
+		for worker_id in range(processes) :
+			p = multiprocessing.Process(target = parse_worker_loop, args = (worker_id, self.task_queues[worker_id], self.result_queue, debug), name = "parse_worker_" + str(worker_id))
+			p.daemon = True
+			p.start()
+			self.workers.append(p)
+		t = threading.Thread(target = self.result_loop, name = "parse_pool_results")
+		t.daemon = True
+		t.start()
+
+# Proxy of a MedusaParser running in a ParsePool worker : parse_many() submits lines to the pool and returns None,
+# parsed blocks being delivered later to the pool on_block callback.
+class PooledParser :
+
+	def parse_many(self, lines, keep_log_str = True, token = None) :
+		self.pool.parse(self.key, self.session_owner, self.agent_re, self.redetectable, lines, keep_log_str, token)
+		return None
+
+	def get_rule_stats(self) :
+		return self.pool.get_rule_stats(self.key)
+
+	def print_rule_stats(self) :
+		print("PooledParser : rule statistics for " + str(self.session_owner) + " : " + str(self.get_rule_stats()))
+
+	# agent_re : agent regexp of session_owner if known, None for late initialization in the worker
+	# redetectable : agent_re was detected, and is checked again if agent lines stop matching (see AgentParser.redetect)
+	def __init__(self, pool, key, session_owner, agent_re = None, redetectable = False) :
+		self.pool = pool
+		self.key = key
+		self.session_owner = session_owner
+		self.agent_re = agent_re
+		self.redetectable = redetectable or agent_re is None
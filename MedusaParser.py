@@ -6,12 +6,13 @@
 
 
 # internal dependencies
-from MedusaGameTime import GameTime
+from MedusaGameTime import time_str_to_epoch
 
-import sys
+import threading
+from time import perf_counter
 
-# time management
-import datetime
+# data layout
+import array
 
 # output and formatting
 import yaml
@@ -44,26 +45,177 @@ def recursive_merge(src, dest) :
 
 # basic construction blocks
 re_time = r"\[ (?P<time_str>\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}) \]" # "[ 2020.07.09 11:35:20 ]"
-def time_str_to_datetime(time_str) :
-	return datetime.datetime.strptime(time_str,"%Y.%m.%d %H:%M:%S")
+# time_str_to_epoch comes from the shared timestamp engine (see MedusaGameTime)
 re_entry_type = r"\(\w+\)" # "(combat)" (generic)
-re_entry_type_combat = r"\((?P<entry_type>combat)\)"  # "(combat)" (specific)
-re_entry_type_notify = r"\((?P<entry_type>notify)\)"  # "(notify)" (specific)
-re_bold = r"<b>"
-re_nobold = r"</b>"
-re_italic = r"<i>"
-re_noitalic = r"</i>"
-re_underline = r"<u>"
-re_nounderline = r"</u>"
-re_bold = r"<b>"
-re_nobold = r"</b>"
-re_color = r"<color=0x[0-9a-fA-F]{8}>"
-re_nocolor = r"</color>"
-re_size = r"<font size=\d+>"
-re_nosize = r"</font>"
-re_name = r"((\w|-)+ ?)+" # matches generic name with "-" that can either have space around them or not
-re_module_name = r"(\w+(-\w+)? ?)+" # matches a module name with "-" that cannot have space around them (e.g "A-type Medium Remote Armor Repairer" or "Light Electron Blaster II", but not "Light Electron Blaster II - Hits")
-re_weapon = r"((" + re_size + re_color + r")|(" + re_color + re_size + r"))" + r" - (?P<weapon>" + re_module_name + r")( - (?P<hit_type>" + re_name + r"))?(" + re_nosize + r")?"
+
+
+# rule table : (category, rule name, amount field) for every matching rule, rule ids being indexes in this table.
+# rule ids are shared by clients and servers : only ever append new rules at the end
+rule_table = [
+	("dps", "weapon_cycle_out", "weapon_damage"),
+	("dps", "weapon_cycle_in", "weapon_damage"),
+	("neut", "neut_out", "neut_amount"),
+	("neut", "neut_in", "neut_amount"),
+	("neut", "nos_out", "nos_amount"),
+	("neut", "nos_in", "nos_amount"),
+	("ewar", "scramble_attempt", None),
+	("ewar", "disruption_attempt", None),
+	("remote_assist", "remote_shield_out", "remote_shield_amount"),
+	("remote_assist", "remote_shield_in", "remote_shield_amount"),
+	("remote_assist", "remote_armor_out", "remote_armor_amount"),
+	("remote_assist", "remote_armor_in", "remote_armor_amount"),
+	("remote_assist", "remote_hull_out", "remote_hull_amount"),
+	("remote_assist", "remote_hull_in", "remote_hull_amount"),
+	("remote_assist", "remote_capacitor_out", "energy_amount"),
+	("remote_assist", "remote_capacitor_in", "energy_amount"),
+	("command", "command_burst", "boosted_ships_count"),
+	("other", "message", None),
+]
+rule_ids = {rule_name : i for i, (category, rule_name, amount_field) in enumerate(rule_table)}
+
+# Columnar event blocks, as returned by MedusaParser.parse_many :
+# a dict of parallel lists, one item per parsed log entry. Blocks merge with recursive_merge.
+#   rule : rule id (see rule_table)
+#   time : game time, epoch seconds
+#   src, target : source and target pilots
+#   amount : damage, GJ, hp or ships count depending on the rule (0 if irrelevant)
+#   weapon, hit : weapon or module, hit type
+#   src_ship, target_ship : ship types, when known
+#   owner : session owner, the character whose logs the entry comes from
+#   log_str : raw log line, only present when requested (e.g when the server writes replay logs)
+# aggregated blocks (see aggregate_block) stand for several entries per row, with two more columns :
+#   hits : number of entries aggregated (amount being their sum)
+#   max : largest single amount
+block_columns = ["rule", "time", "src", "target", "amount", "weapon", "hit", "src_ship", "target_ship", "owner", "log_str"]
+block_columns_no_log_str = block_columns[:-1]
+# name columns, holding symbol ids instead of names when the parser is given a symbol table (see MedusaSymbolTable)
+block_symbol_columns = ["src", "target", "weapon", "hit", "src_ship", "target_ship", "owner"]
+block_aggregate_columns = ["hits", "max"]
+# numeric columns may be backed by typed arrays (see block_to_arrays), which are far more compact than lists of ints
+block_column_typecodes = {"rule" : "b", "time" : "q", "amount" : "q", "hits" : "i", "max" : "q"}
+block_symbol_typecode = "i"
+
+# symbols : name columns hold symbol ids, and may be typed as well
+def new_block(columns = block_columns, typed = False, symbols = False) :
+	typecodes = block_typecodes(symbols)
+	return {c : array.array(typecodes[c]) if typed and c in typecodes else [] for c in columns}
+
+def block_typecodes(symbols = False) :
+	if not symbols : return block_column_typecodes
+	r = dict(block_column_typecodes)
+	for c in block_symbol_columns : r[c] = block_symbol_typecode
+	return r
+
+def block_size(block) :
+	return len(block["rule"])
+
+# convert the numeric columns of block to typed arrays, in place
+def block_to_arrays(block, symbols = False) :
+	for c, typecode in block_typecodes(symbols).items() :
+		if c in block and not isinstance(block[c], array.array) :
+			block[c] = array.array(typecode, block[c])
+	return block
+
+# returns a new block holding the rows of block at the provided indexes
+def select_block_rows(block, indexes) :
+	r = {}
+	for c, column in block.items() :
+		if isinstance(column, array.array) : r[c] = array.array(column.typecode, [column[i] for i in indexes])
+		else : r[c] = [column[i] for i in indexes]
+	return r
+
+# add aggregate columns to a block of single entries, in place
+def add_aggregate_columns(block) :
+	block["hits"] = [1] * block_size(block)
+	block["max"] = list(block["amount"])
+	return block
+
+# returns an aggregated block (see block_columns) with a single row per second, rule, session owner, source, target and weapon :
+# amounts are summed, and ship types are the last known ones. Hit type is the one of the first entry.
+# block may be aggregated already. Raw log lines are dropped.
+def aggregate_block(block) :
+	columns = block_columns_no_log_str + block_aggregate_columns
+	r = new_block(columns)
+	rows = {}
+	rule, time, owner, src, target, weapon = block["rule"], block["time"], block["owner"], block["src"], block["target"], block["weapon"]
+	amount, src_ship, target_ship = block["amount"], block["src_ship"], block["target_ship"]
+	hits = block.get("hits")
+	max_amount = block.get("max", amount)
+	r_amount, r_hits, r_max, r_src_ship, r_target_ship = r["amount"], r["hits"], r["max"], r["src_ship"], r["target_ship"]
+	for i in range(block_size(block)) :
+		key = (time[i], rule[i], owner[i], src[i], target[i], weapon[i])
+		j = rows.get(key)
+		if j is None :
+			rows[key] = block_size(r)
+			for c in block_columns_no_log_str : r[c].append(block[c][i])
+			r_hits.append(hits[i] if hits is not None else 1)
+			r_max.append(max_amount[i])
+			continue
+		r_amount[j] += amount[i]
+		r_hits[j] += hits[i] if hits is not None else 1
+		if max_amount[i] > r_max[j] : r_max[j] = max_amount[i]
+		if src_ship[i] : r_src_ship[j] = src_ship[i]
+		if target_ship[i] : r_target_ship[j] = target_ship[i]
+	return r
+
+# a single parsed log entry, as returned by MedusaParser.parse : one slot per block column
+class LogEntry :
+	__slots__ = block_columns
+
+	def __init__(self, rule, time, src, target, amount, weapon, hit, src_ship, target_ship, owner, log_str = None) :
+		self.rule = rule
+		self.time = time
+		self.src = src
+		self.target = target
+		self.amount = amount
+		self.weapon = weapon
+		self.hit = hit
+		self.src_ship = src_ship
+		self.target_ship = target_ship
+		self.owner = owner
+		self.log_str = log_str
+
+	def category(self) : return rule_table[self.rule][0]
+	def rule_name(self) : return rule_table[self.rule][1]
+
+	# append this entry to the columns of a block
+	def append_to(self, block) :
+		block["rule"].append(self.rule)
+		block["time"].append(self.time)
+		block["src"].append(self.src)
+		block["target"].append(self.target)
+		block["amount"].append(self.amount)
+		block["weapon"].append(self.weapon)
+		block["hit"].append(self.hit)
+		block["src_ship"].append(self.src_ship)
+		block["target_ship"].append(self.target_ship)
+		block["owner"].append(self.owner)
+		if "log_str" in block : block["log_str"].append(self.log_str)
+
+	def __repr__(self) :
+		return "LogEntry(" + ", ".join(c + "=" + repr(getattr(self, c)) for c in block_columns) + ")"
+# Tokenizer : a gamelog line is split in a single pass into its timestamp, entry type and span texts, interleaved with their styles,
+# style being the markup run (e.g "<b><color=0xffffffff>") preceding text.
+# Matching rules and agent regexps never see the markup : they match the span text, where each markup run is replaced by a single span_sep
+# "[ 2020.07.11 09:44:20 ] (combat) <color=0xff00ffff><b>353</b> <color=0x77ffffff><font size=10>to</font> ..."
+#   -> ("2020.07.11 09:44:20", "combat", ["", "<color=0xff00ffff><b>", "353", "</b>", " ", "<color=0x77ffffff><font size=10>", "to", ...])
+#   -> "\x1f353\x1f \x1fto\x1f ..."
+span_sep = "\x1f"
+re_line_head = re.compile(r"\[ (\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}) \] \((\w+)\) ?")
+re_markup = re.compile(r"(<[^>]*>(?:<[^>]*>)*)") # (leading literal "<" lets the regexp engine skip plain text quickly)
+
+# returns (time_str, entry_type, parts), parts being the span texts interleaved with their styles ([text, style, text, style, text ...])
+# or None if log_str is not a timestamped log entry
+def split_log_line(log_str) :
+	m = re_line_head.match(log_str)
+	if m is None : return None
+	return m.group(1), m.group(2), re_markup.split(log_str[m.end():])
+
+re_span = r"\x1f" # a markup run
+re_span_opt = r"\x1f?" # an optional markup run
+re_name = r"[\w-]+(?: [\w-]+)* ?" # matches generic name with "-" that can either have space around them or not
+re_module_name = r"\w+(?:-\w+)*(?: \w+(?:-\w+)*)* ?" # matches a module name with "-" that cannot have space around them (e.g "A-type Medium Remote Armor Repairer" or "Light Electron Blaster II", but not "Light Electron Blaster II - Hits")
+re_weapon = re_span + r" - (?P<weapon>" + re_module_name + r")(?: - (?P<hit_type>" + re_name + r"))?"
 
 
 # Agent Parser : handles the generation of regexp for parsing agents (src and target) given a supplied overview configuration file
@@ -76,10 +228,9 @@ class AgentParser() :
 		"""Exception : Agent Parser could not be initialized"""
 		pass
 
-	agent_pre = r"((" + re_bold + re_color + r")|(" + re_color + re_bold + r"))(" + re_nosize + r")?"
-	agent_post = r"(" + re_nobold + r")?"
+	# agent regexps match the text of a single span : the markup around agents is handled by the matching rules
 	# <b><color=0xffffffff>Tnemelc Abramovich[BAG8](Ishkur)</b>
-	default_damage = re_bold + re_color + r"(?P<agent_pilot>" + re_name + r")(?P<agent_corp_ticker>\[" + re_name + r"\])?\((?P<agent_ship_type>" + re_name + r")\)" + re_nobold
+	default_damage = r"(?P<agent_pilot>" + re_name + r")(?P<agent_corp_ticker>\[" + re_name + r"\])?\((?P<agent_ship_type>" + re_name + r")\)"
 	m_re_damage_src = default_damage.replace("agent", "src")
 	m_re_damage_target = default_damage.replace("agent", "target")
 
@@ -98,13 +249,32 @@ class AgentParser() :
 
 	# "[CC] Pilot [AA]" preset
 	#<color=0xffffffff><b> [BAG8]Tnemelc Abramovich&lt;XENA&gt;</b>
-	preset3 = r" \[(P?<agent_corp_ticker>" + re_name + r")\](P?<agent_pilot>" + re_name + r")(&lt;(?P<agent_alliance_ticker>" + re_name + r")&gt;)?"
+	preset3 = r" \[(?P<agent_corp_ticker>" + re_name + r")\](?P<agent_pilot>" + re_name + r")(&lt;(?P<agent_alliance_ticker>" + re_name + r")&gt;)?"
+
+	presets = [preset1, preset2, preset3]
+
+	# late initialization results, shared by every agent parser of the process : agent string example -> first matching preset (or None)
+	late_init_results = {}
+	late_init_results_max_size = 4096
+
+	# returns the first preset matching agent_str_example, or None
+	@classmethod
+	def find_preset(cls, agent_str_example) :
+		if agent_str_example in cls.late_init_results : return cls.late_init_results[agent_str_example]
+		r = None
+		for preset in cls.presets :
+			if re.match(preset, agent_str_example) is not None :
+				r = preset
+				break
+		if len(cls.late_init_results) >= cls.late_init_results_max_size : cls.late_init_results.clear()
+		cls.late_init_results[agent_str_example] = r
+		return r
 
 #	import MedusaParser; MedusaParser.AgentParser.get_LabelOrder_from_overview("C:\\Users\\Fontenaille\\Documents\\EVE\\Overview\\raoul_abramovich_2020-06-25.yaml")
 	@classmethod
 	def get_LabelOrder_from_overview(cls, from_overview_filename) :
-		f = open(from_overview_filename, "r")
-		y = yaml.load(f.read())
+		with open(from_overview_filename, "r") as f :
+			y = yaml.safe_load(f.read())
 		labelOrder = y['shipLabelOrder']
 		for i in range(len(labelOrder)) : # for each label element
 			for j in range(len(y['shipLabels'])) : # look for corresponding item in shiplabels list
@@ -113,36 +283,31 @@ class AgentParser() :
 		#pprint.pprint(labelOrder)
 		return labelOrder
 	
+	# markup runs collapse into a single span separator, which may merge with the ones of the neighbouring label elements :
+	# label element markup translates into optional span separators
+	# label texts are escaped in gamelogs ("<" -> "&lt;"), and are not regexps
+	@classmethod
+	def get_agent_re_text(cls, text) :
+		return re.escape(text.replace("<", "&lt;").replace(">", "&gt;"))
+
 	@classmethod
 	def get_agent_re_elt_pre(cls, ov_param) :
 		agent_re_pre = ""
-		if ov_param['fontsize'] :
-			agent_re_pre += re_size
-		if ov_param['color'] :
-			agent_re_pre += re_color
-		agent_re_pre += ov_param['pre']
-		if ov_param['italic'] :
-			agent_re_pre += re_italic
-		if ov_param['underline'] :
-			agent_re_pre += re_underline
-		if ov_param['bold'] :
-			agent_re_pre += re_bold
+		if ov_param['fontsize'] or ov_param['color'] :
+			agent_re_pre += re_span_opt
+		agent_re_pre += cls.get_agent_re_text(ov_param['pre'])
+		if ov_param['italic'] or ov_param['underline'] or ov_param['bold'] :
+			agent_re_pre += re_span_opt
 		return agent_re_pre
 
 	@classmethod
 	def get_agent_re_elt_post(cls, ov_param) :
 		agent_re_post = ""
-		if ov_param['bold'] :
-			agent_re_post += re_nobold
-		if ov_param['underline'] :
-			agent_re_post += re_nounderline
-		if ov_param['italic'] :
-			agent_re_post += re_noitalic
-		agent_re_post += ov_param['post']
-		if ov_param['color'] :
-			agent_re_post += re_nocolor
-		if ov_param['fontsize'] :
-			agent_re_post += re_nosize
+		if ov_param['bold'] or ov_param['underline'] or ov_param['italic'] :
+			agent_re_post += re_span_opt
+		agent_re_post += cls.get_agent_re_text(ov_param['post'])
+		if ov_param['color'] or ov_param['fontsize'] :
+			agent_re_post += re_span_opt
 		return agent_re_post
 
 	@classmethod
@@ -152,7 +317,7 @@ class AgentParser() :
 			print("found linebreak !")
 			return ' '
 		if ov_param['type'] == None and ov_param['state']: # None type is the "additionnal text", and does not trigger anything but printing pre, even if specified otherwise
-			return r'(' + ov_param['pre'] + r')?'
+			return r'(' + AgentParser.get_agent_re_text(ov_param['pre']) + r')?'
 		# other label elements
 		r = ''
 		r += AgentParser.get_agent_re_elt_pre(ov_param)
@@ -176,6 +341,7 @@ class AgentParser() :
 		agent_re = ""
 		for elt in labelOrder :
 			agent_re += cls.get_agent_re_elt(elt)
+		return agent_re
 
 	@classmethod
 	def re_dmg_src(cls) :
@@ -202,47 +368,132 @@ class AgentParser() :
 		if agent_re is not None :
 			if agent_str_example is not None :
 				if self.debug : print("AgentParser : attempting late initialization : ")
-				testre = AgentParser.agent_pre + agent_re + AgentParser.agent_post
+				testre = agent_re
 				if self.debug : print("testre = " + testre)
 				if self.debug : print("agent_str_example = " + agent_str_example)
 				m = re.match(testre, agent_str_example)
 				if m is None : 
 					print("AgentParser : late initialize attempt failed")
 					raise AgentParser.InitFailException
-			self.m_re_src = AgentParser.agent_pre + r"((" + AgentParser.you_src + r")|(" + agent_re.replace("agent", "src") + r"))" + AgentParser.agent_post
-			self.m_re_target = AgentParser.agent_pre + r"((" + AgentParser.you_target + r")|(" + agent_re.replace("agent", "target") + r"))" + AgentParser.agent_post
+			self.m_re_src = r"(?:" + AgentParser.you_src + r"|" + agent_re.replace("agent", "src") + r")"
+			self.m_re_target = r"(?:" + AgentParser.you_target + r"|" + agent_re.replace("agent", "target") + r")"
+			self.agent_re = agent_re
 			self.is_init = True
 			if self.debug : print("AgentParser initialized")
 
-	def __init__(self, agent_re = None, agent_str_example = None, overview_filename = None, debug = False) :
+	# late initialization : the agent format is detected once per session, from the agent strings of the first agent-bearing lines
+	# presets do not overlap, so the first agent string matching a preset settles the format
+	# detection gives up after detection_max_attempts agent strings matching no preset (e.g "you", or a custom overview)
+	detection_max_attempts = 50
+
+	# returns True if the agent parser is initialized
+	def detect(self, agent_str_example) :
+		if self.is_init or self.detection_failed : return self.is_init
+		preset = AgentParser.find_preset(agent_str_example)
+		if preset is not None :
+			if self.debug : print("AgentParser : detected agent format from \"" + agent_str_example + "\"")
+			self.initialize(agent_re = preset)
+			if self.detected_callback is not None : self.detected_callback(preset)
+			return True
+		self.detection_attempts += 1
+		if self.detection_attempts >= AgentParser.detection_max_attempts :
+			self.detection_failed = True
+			print("Warning : AgentParser : could not detect the agent format from " + str(self.detection_attempts) + " agent strings (last one : \"" + agent_str_example + "\").")
+			print("Maybe you should supply an updated overview configuration file instead ?")
+		return False
+
+	# redetection : a detected agent format (by late initialization, or previously detected and cached) is checked again
+	# once redetect_misses agent lines in a row matched no rule, the character may have changed their overview format since.
+	# The agent string of the last missed line is submitted to detection : a different preset matching it replaces the current format.
+	# Agent strings matching no preset (e.g NPCs) leave the format unchanged, but after redetect_max_failures such checks in a row
+	# the format is not trusted anymore (invalidated_callback is called, e.g to drop it from the agent format cache)
+	redetect_misses = 20
+	redetect_max_failures = 5
+
+	def agent_line_matched(self) :
+		self.agent_line_misses = 0
+		self.redetect_failures = 0
+
+	# returns True if the agent format should be checked again (see redetect)
+	def agent_line_missed(self) :
+		if not self.redetectable or not self.is_init : return False
+		self.agent_line_misses += 1
+		return self.agent_line_misses >= AgentParser.redetect_misses
+
+	# returns True if the agent format changed
+	def redetect(self, agent_str_example) :
+		self.agent_line_misses = 0
+		preset = AgentParser.find_preset(agent_str_example) if agent_str_example is not None else None
+		if preset is None :
+			self.redetect_failures += 1
+			if self.redetect_failures == AgentParser.redetect_max_failures :
+				print("Warning : AgentParser : agent lines keep matching no rule with the detected agent format (last agent string : \"" + str(agent_str_example) + "\")")
+				if self.invalidated_callback is not None : self.invalidated_callback()
+			return False
+		self.redetect_failures = 0
+		if preset == self.agent_re : return False
+		print("AgentParser : agent format changed, detected again from \"" + agent_str_example + "\"")
+		self.initialize(agent_re = preset)
+		if self.detected_callback is not None : self.detected_callback(preset)
+		return True
+
+	# detected_callback(agent_re) is called when the agent format is detected by late initialization or redetection
+	# redetectable : the agent format is checked again when agent lines stop matching (see redetect), by default for late initialization only
+	# invalidated_callback() is called when the redetectable agent format seems wrong, and no preset replaces it
+	def __init__(self, agent_re = None, agent_str_example = None, overview_filename = None, debug = False, detected_callback = None, redetectable = None, invalidated_callback = None) :
 		self.debug = debug
 		self.is_init = False
+		self.agent_re = None
+		self.detected_callback = detected_callback
+		self.invalidated_callback = invalidated_callback
+		self.redetectable = redetectable if redetectable is not None else (agent_re is None and overview_filename is None)
+		self.detection_attempts = 0
+		self.detection_failed = False
+		self.agent_line_misses = 0 # agent lines in a row matching no rule
+		self.redetect_failures = 0 # redetections in a row finding no preset
 		self.initialize(agent_re, agent_str_example, overview_filename)
 
 
 # parser function (dictates the entire server-side data layout)
 class MedusaParser :
 
+	# matching rules match the span text of tokenized log lines (see split_log_line), with the timestamp and entry type already removed.
+	# entry_type and key_phrase are used by the parser dispatch index : a rule is only attempted on lines of its entry type containing its key phrase.
+	# rules without a key phrase are fallback rules, attempted on every line no candidate rule could match
+	# lead_style, if supplied, must appear in the style of the first span of the line (e.g the color telling incoming and outgoing neuts apart)
+
 	class MatchingRuleSimple : # simple matching rule definition, used for parsing dps (which do not use overview-dependant formatting)
 		def match(self, str) :
 			#print("MatchingRuleDamage : attempting match :\n" + self.regexp_str + "\n" + str)
 			return self.regexp.match(str)
-		def __init__(self, regexp_str, category, rule_name) : 
+		def __init__(self, regexp_str, category, rule_name, entry_type = None, key_phrase = None, lead_style = None) : 
 			self.regexp_str = regexp_str
 			self.regexp = re.compile(regexp_str)
 			self.category = category
 			self.rule_name = rule_name
+			self.entry_type = entry_type
+			self.key_phrase = key_phrase
+			self.lead_style = lead_style
+			self.uses_agents = False
 
 
 	class MatchingRule : # matching rule definition, used for parsing log entries which use overview-dependant formatting
 		# regexp_pattern is in the form ["azeaze", "agent_src", "zerzer", "agent_target", "ertert"]
-		def __init__(self, regexp_pattern, category, rule_name, agent_parser = None, debug = False) : 
+		def __init__(self, regexp_pattern, category, rule_name, agent_parser = None, debug = False, entry_type = None, key_phrase = None, lead_style = None) : 
 			self.regexp_pattern = regexp_pattern
 			self.category = category
 			self.rule_name = rule_name
+			self.entry_type = entry_type
+			self.key_phrase = key_phrase
+			self.lead_style = lead_style
 			self.agent_parser = agent_parser
 			self.debug = debug
-			if agent_parser is None or agent_parser.is_init :
+			self.late_init_attempts = 0
+			self.regexp = None
+			self.test_regexp = None
+			self.uses_agents = "agent_src" in regexp_pattern or "agent_target" in regexp_pattern
+			# rules without agents do not depend on the agent format
+			if agent_parser is None or agent_parser.is_init or not self.uses_agents :
 				self.init_regexp()
 			else :
 				self.init_test_regexp()
@@ -260,71 +511,79 @@ class MedusaParser :
 		def init_test_regexp(self) :
 			self.test_regexp = r""
 			for e in self.regexp_pattern :
-				if e == "agent_src" : self.test_regexp += r"(?P<agent_src_test>.*)"
-				elif e == "agent_target" : self.test_regexp += r"(?P<agent_target_test>.*)"
+				if e == "agent_src" : self.test_regexp += r"(?P<agent_src_test>[^\x1f]*)"
+				elif e == "agent_target" : self.test_regexp += r"(?P<agent_target_test>[^\x1f]*)"
 				else : self.test_regexp += e
 			self.test_regexp_str = self.test_regexp
 			#print("\nMatchingRule : init_regexp : \n" + self.test_regexp_str)
 			self.test_regexp = re.compile(self.test_regexp)
 
+		# agent string of a line this rule would match whatever the agent format, or None (see AgentParser.redetect)
+		def get_agent_str(self, log_str) :
+			if self.test_regexp is None : self.init_test_regexp()
+			testm = self.test_regexp.match(log_str)
+			if testm is None : return None
+			gd = testm.groupdict()
+			return gd['agent_src_test'] if 'agent_src_test' in gd else gd['agent_target_test']
+
+		# late initialized rules never match : they submit agent strings to the agent parser format detection instead
+		# once the format is detected, the parser switches to initialized rules and parses the line again (see MedusaParser.match_line)
 		def match(self, log_str) :
-			try :
-				return self.regexp.match(log_str)
-			except AttributeError :
-				print("rule " + self.rule_name + " self.regexp.match(log_str) raised AttributeError : ")
-				#pprint.pprint(sys.exc_info())
-				pass
-			# else try init regexp
-			if self.agent_parser.is_init :
-				print("agent_parser is initialized, just finalize initialization and retry")
+			if self.regexp is not None : return self.regexp.match(log_str)
+			if self.agent_parser.is_init : # agent parser initialized from outside, finalize initialization
 				self.init_regexp()
-				return self.match(log_str) # retry and return match
-			# else try init agent_parser
-			else :
-				# make a test agent string to test default presets initializations against
-				testm = self.test_regexp.match(log_str)
-				if self.debug : print("attempting late agent parser initialization for rule " + self.rule_name)
-				if not testm :
-					return None # if failed, just return none, rule does not match anyway
-				gd = testm.groupdict()
-				teststr = gd['agent_src_test'] if 'agent_src_test' in gd else ( gd['agent_target_test'] if 'agent_target_test' in gd else None )
-				if teststr is None : # we should never hit this condition unless ill-formed matching rules
-					print("Whoops, maybe we should take a look into this : ")
-					print("str = " + log_str)
-					print("self.test_regexp = " + str(self.test_regexp))
-					print("self.test_regexp.match().groupdict() : ")
-					pprint.pprint(gd)
-					return None
-				try :
-					self.agent_parser.initialize(agent_re = AgentParser.preset1, agent_str_example = teststr)
-					return self.match(log_str) # retry and return match
-				except AgentParser.InitFailException :
-					pass
-				try :
-					self.agent_parser.initialize(agent_re = AgentParser.preset2, agent_str_example = teststr)
-					return self.match(log_str) # retry and return match
-				except AgentParser.InitFailException :
-					pass
-				try :
-					self.agent_parser.initialize(agent_re = AgentParser.preset3, agent_str_example = teststr)
-					return self.match(log_str) # retry and return match
-				except AgentParser.InitFailException :
-					pass
-				print("Warning : default late initialization of matching rule " + self.category + ":" + self.rule_name + " failed at finding a working preset for matching string \"" + teststr + "\".")
-				print("When attempting to match log entry : \n  \"" + log_str + "\"")
-				print("Maybe you should supply an updated overview configuration file instead ?")
+				return self.regexp.match(log_str)
+			if self.agent_parser.detection_failed : return None
+			self.late_init_attempts += 1
+			testm = self.test_regexp.match(log_str)
+			if testm is None : return None # rule does not match anyway
+			gd = testm.groupdict()
+			teststr = gd['agent_src_test'] if 'agent_src_test' in gd else gd['agent_target_test']
+			if self.debug : print("submitting agent string \"" + teststr + "\" to agent format detection for rule " + self.rule_name)
+			self.agent_parser.detect(teststr)
 			return None
 
+	# process-wide cache of compiled rule sets, keyed by agent regexp (preset or overview-derived) :
+	# every parser using the same agent format shares the same compiled matching rules and dispatch index
+	rule_sets = {}
+	rule_sets_lock = threading.Lock()
+
+	# set up matching rules and dispatch index, from the rule set cache whenever the agent parser is initialized
+	# rules waiting for late initialization are bound to this parser's agent parser, and are not shared
 	def init_rules(self) :
+		if not self.agent_parser.is_init :
+			self.build_rules()
+			self.init_dispatch_index()
+			self.rule_set_key = None
+			return
+		key = self.agent_parser.agent_re
+		with MedusaParser.rule_sets_lock :
+			rule_set = MedusaParser.rule_sets.get(key)
+			if rule_set is None :
+				if self.debug : print("MedusaParser : compiling new rule set")
+				self.build_rules()
+				self.init_dispatch_index()
+				MedusaParser.rule_sets[key] = (self.matching_rules, self.dispatch_index, self.fallback_rules)
+			else :
+				self.matching_rules, self.dispatch_index, self.fallback_rules = rule_set
+		self.rule_set_key = key
+
+	def build_rules(self) :
+		self.matching_rules = []
+		self.append_rules()
+		for rule in self.matching_rules :
+			rule.rule_id = rule_ids[rule.rule_name]
+			rule.amount_field = rule_table[rule.rule_id][2]
 
-		self.matching_rules = [] # a matching rule is a tuple of the form ("rule type", "rule name", re.compile(r"rule match"), result_object_build_function)
+	def append_rules(self) :
 
 		# DAMAGE
 	
-		re_weapon_cycle_out = re_time + " " + re_entry_type_combat + " " + re_color + re_bold + r"(?P<weapon_damage>\d+)" + re_nobold + " " + re_color + re_size + "to" + re_nosize + " " + AgentParser.re_dmg_target() + re_weapon
-		self.matching_rules.append(MedusaParser.MatchingRuleSimple(re_weapon_cycle_out, "dps", "weapon_cycle_out"))
-		re_weapon_cycle_in = re_time + " " + re_entry_type_combat + " " + re_color + re_bold + r"(?P<weapon_damage>\d+)" + re_nobold + " " + re_color + re_size + "from" + re_nosize + " " + AgentParser.re_dmg_src() + re_weapon
-		self.matching_rules.append(MedusaParser.MatchingRuleSimple(re_weapon_cycle_in, "dps", "weapon_cycle_in"))
+		# [ 2020.07.11 09:44:20 ] (combat) <color=0xff00ffff><b>353</b> <color=0x77ffffff><font size=10>to</font> <b><color=0xffffffff>Tnemelc Abramovich[BAG8](Ishkur)</b><font size=10><color=0x77ffffff> - Garde II - Penetrates
+		re_weapon_cycle_out = re_span + r"(?P<weapon_damage>\d+)" + re_span + " " + re_span + "to" + re_span + " " + re_span + AgentParser.re_dmg_target() + re_weapon
+		self.matching_rules.append(MedusaParser.MatchingRuleSimple(re_weapon_cycle_out, "dps", "weapon_cycle_out", entry_type = "combat", key_phrase = "\x1fto\x1f"))
+		re_weapon_cycle_in = re_span + r"(?P<weapon_damage>\d+)" + re_span + " " + re_span + "from" + re_span + " " + re_span + AgentParser.re_dmg_src() + re_weapon
+		self.matching_rules.append(MedusaParser.MatchingRuleSimple(re_weapon_cycle_in, "dps", "weapon_cycle_in", entry_type = "combat", key_phrase = "\x1ffrom\x1f"))
 	
 		# [ 2020.06.23 13:08:48 ] (combat) <color=0xff7fffff><b>1800 GJ</b><color=0x77ffffff><font size=10> energy neutralized </font><b><color=0xffffffff>Armageddon &lt;XENA&gt;[BAG8] Raoul Abramovich </b><color=0x77ffffff><font size=10> - Standup Heavy Energy Neutralizer II</font>
 
@@ -332,184 +591,304 @@ class MedusaParser :
 
 		# [ 2020.06.23 13:08:48 ] (combat) <color=0xffe57f7f><b>1800 GJ</b><color=0x77ffffff><font size=10> energy neutralized </font><b><color=0xffffffff>Fortizar [2MHS] J155002 - Baguette Launcher </b><color=0x77ffffff><font size=10> - Standup Heavy Energy Neutralizer II</font>
 		re_neut_cycle_out = [
-			re_time + " " + re_entry_type_combat +
-				" <color=0xff7fffff>" + re_bold + r"(?P<neut_amount>\d+) GJ" + re_nobold +
-				re_color + re_size + " energy neutralized " + re_nosize,
+			re_span + r"(?P<neut_amount>\d+) GJ" + re_span + " energy neutralized " + re_span,
 			"agent_target",
 			re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_neut_cycle_out, "neut", "neut_out", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_neut_cycle_out, "neut", "neut_out", self.agent_parser, entry_type = "combat", key_phrase = " energy neutralized ", lead_style = "<color=0xff7fffff>"))
 
 		re_neut_cycle_in = [
-			re_time + " " + re_entry_type_combat +
-				" <color=0xffe57f7f>" + re_bold + r"(?P<neut_amount>\d+) GJ" + re_nobold +
-				re_color + re_size + " energy neutralized " + re_nosize,
+			re_span + r"(?P<neut_amount>\d+) GJ" + re_span + " energy neutralized " + re_span,
 			"agent_src",
 			re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_neut_cycle_in, "neut", "neut_in", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_neut_cycle_in, "neut", "neut_in", self.agent_parser, entry_type = "combat", key_phrase = " energy neutralized ", lead_style = "<color=0xffe57f7f>"))
 	
 		#[ 2020.06.23 16:12:01 ] (combat) <color=0xff7fffff><b>+19 GJ</b><color=0x77ffffff><font size=10> energy drained from </font><b><color=0xffffffff>Dominix &lt;XENA&gt;[BAG8] Tnemelc Abramovich </b><color=0x77ffffff><font size=10> - Corpus X-Type Heavy Energy Nosferatu</font>
 		re_nos_cycle_out = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"\+(?P<nos_amount>\d+) GJ" + re_nobold +
-			re_color + re_size + " energy drained from " + re_nosize,
-		   "agent_target",
+			re_span + r"\+(?P<nos_amount>\d+) GJ" + re_span + " energy drained from " + re_span,
+			"agent_target",
 			re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_nos_cycle_out, "neut", "nos_out", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_nos_cycle_out, "neut", "nos_out", self.agent_parser, entry_type = "combat", key_phrase = " energy drained from "))
 		#[ 2020.06.23 16:12:01 ] (combat) <color=0xffe57f7f><b>-19 GJ</b><color=0x77ffffff><font size=10> energy drained to </font><b><color=0xffffffff>Bhaalgorn &lt;XENA&gt;[BAG8] Raoul Abramovich </b><color=0x77ffffff><font size=10> - Corpus X-Type Heavy Energy Nosferatu</font>
 		re_nos_cycle_in = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"-(?P<nos_amount>\d+) GJ" + re_nobold +
-			re_color + re_size + " energy drained to " + re_nosize +
-		   "agent_src",
+			re_span + r"-(?P<nos_amount>\d+) GJ" + re_span + " energy drained to " + re_span,
+			"agent_src",
 			re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_nos_cycle_in, "neut", "nos_in", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_nos_cycle_in, "neut", "nos_in", self.agent_parser, entry_type = "combat", key_phrase = " energy drained to "))
 	
 	
 		# EWAR
 	
 		re_scramble_attempt = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + "Warp scramble attempt" + re_nobold +
-			" " + re_color + re_size + "from" + re_nosize + " ",
+			re_span + "Warp scramble attempt" + re_span + " " + re_span + "from" + re_span + " " + re_span,
 			"agent_src",
-			" " + re_color + re_size + "to ",
+			re_span_opt + " " + re_span + "to " + re_span,
 			"agent_target"
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_scramble_attempt, "ewar", "scramble_attempt", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_scramble_attempt, "ewar", "scramble_attempt", self.agent_parser, entry_type = "combat", key_phrase = "Warp scramble attempt"))
 	
 		re_disruption_attempt = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + "Warp disruption attempt" + re_nobold +
-			" " + re_color + re_size + "from" + re_nosize + " ",
+			re_span + "Warp disruption attempt" + re_span + " " + re_span + "from" + re_span + " " + re_span,
 			"agent_src",
-			" " + re_color + re_size + "to " + 
+			re_span_opt + " " + re_span + "to " + re_span,
 			"agent_target"
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_disruption_attempt, "ewar", "disruption_attempt", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_disruption_attempt, "ewar", "disruption_attempt", self.agent_parser, entry_type = "combat", key_phrase = "Warp disruption attempt"))
 
 		# REMOTE ASSISTANCE
 
 		re_remote_shield_out = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"(?P<remote_shield_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote shield boosted to " + re_nosize,
+			re_span + r"(?P<remote_shield_amount>\d+)" + re_span + " remote shield boosted to " + re_span,
 			"agent_target",
 			re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_shield_out, "remote_assist", "remote_shield_out", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_shield_out, "remote_assist", "remote_shield_out", self.agent_parser, entry_type = "combat", key_phrase = " remote shield boosted to "))
 		re_remote_shield_in = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"(?P<remote_shield_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote shield boosted by " + re_nosize,
+			re_span + r"(?P<remote_shield_amount>\d+)" + re_span + " remote shield boosted by " + re_span,
 			"agent_src",
 			re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_shield_in, "remote_assist", "remote_shield_in", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_shield_in, "remote_assist", "remote_shield_in", self.agent_parser, entry_type = "combat", key_phrase = " remote shield boosted by "))
 	
 		re_remote_armor_out = [
-			re_time + " " + re_entry_type_combat + " " + re_color +
-			re_bold + r"(?P<remote_armor_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote armor repaired to " + re_nosize,
+			re_span + r"(?P<remote_armor_amount>\d+)" + re_span + " remote armor repaired to " + re_span,
 			"agent_target",
-			re_color + re_size + " " + re_weapon + re_nosize
+			re_span + " " + re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_armor_out, "remote_assist", "remote_armor_out", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_armor_out, "remote_assist", "remote_armor_out", self.agent_parser, entry_type = "combat", key_phrase = " remote armor repaired to "))
 		re_remote_armor_in = [
-			re_time + " " + re_entry_type_combat + " " + re_color +
-			re_bold + r"(?P<remote_armor_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote armor repaired by " + re_nosize,
+			re_span + r"(?P<remote_armor_amount>\d+)" + re_span + " remote armor repaired by " + re_span,
 			"agent_src",
-			re_color + re_size + " " + re_weapon + re_nosize
+			re_span + " " + re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_armor_in, "remote_assist", "remote_armor_in", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_armor_in, "remote_assist", "remote_armor_in", self.agent_parser, entry_type = "combat", key_phrase = " remote armor repaired by "))
 	
 		re_remote_hull_out = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"(?P<remote_hull_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote hull repaired to " + re_nosize,
+			re_span + r"(?P<remote_hull_amount>\d+)" + re_span + " remote hull repaired to " + re_span,
 			"agent_target",
-			re_color + re_size + " " + re_weapon + re_nosize
+			re_span + " " + re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_hull_out, "remote_assist", "remote_hull_out", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_hull_out, "remote_assist", "remote_hull_out", self.agent_parser, entry_type = "combat", key_phrase = " remote hull repaired to "))
 		re_remote_hull_in = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"(?P<remote_hull_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote hull repaired by " + re_nosize,
+			re_span + r"(?P<remote_hull_amount>\d+)" + re_span + " remote hull repaired by " + re_span,
 			"agent_src",
-			re_color + re_size + " " + re_weapon + re_nosize
+			re_span + " " + re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_hull_in, "remote_assist", "remote_hull_in", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_hull_in, "remote_assist", "remote_hull_in", self.agent_parser, entry_type = "combat", key_phrase = " remote hull repaired by "))
 	
 		re_remote_capacitor_out = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"(?P<energy_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote capacitor transmitted to " + re_nosize,
+			re_span + r"(?P<energy_amount>\d+)" + re_span + " remote capacitor transmitted to " + re_span,
 			"agent_target",
-			re_color + re_size + " " + re_weapon + re_nosize
+			re_span + " " + re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_capacitor_out, "remote_assist", "remote_capacitor_out", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_capacitor_out, "remote_assist", "remote_capacitor_out", self.agent_parser, entry_type = "combat", key_phrase = " remote capacitor transmitted to "))
 		re_remote_capacitor_in = [
-			re_time + " " + re_entry_type_combat + " " +
-			re_color + re_bold + r"(?P<energy_amount>\d+)" + re_nobold +
-			re_color + re_size + " remote capacitor transmitted by " + re_nosize,
+			re_span + r"(?P<energy_amount>\d+)" + re_span + " remote capacitor transmitted by " + re_span,
 			"agent_src",
-			re_color + re_size + " " + re_weapon + re_nosize
+			re_span + " " + re_weapon
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_capacitor_in, "remote_assist", "remote_capacitor_in", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_remote_capacitor_in, "remote_assist", "remote_capacitor_in", self.agent_parser, entry_type = "combat", key_phrase = " remote capacitor transmitted by "))
 
 		# COMMAND
 	
 		re_command_burst = [
-			re_time + " " + re_entry_type_notify + " " +
-			re_bold + r"(?P<command_burst_type>)" + re_nobold +
+			re_span + r"(?P<command_burst_type>[^\x1f]*)" + re_span_opt +
 			" has applied bonuses to " +
-			re_bold + r"(?P<boosted_ships_count>\d+)" + re_nobold +
+			re_span + r"(?P<boosted_ships_count>\d+)" + re_span +
 			" fleet members."
 		]
-		self.matching_rules.append(MedusaParser.MatchingRule(re_command_burst, "command", "command_burst", self.agent_parser))
+		self.matching_rules.append(MedusaParser.MatchingRule(re_command_burst, "command", "command_burst", self.agent_parser, entry_type = "notify", key_phrase = " has applied bonuses to "))
 	
 		# OTHERS
 	
-		re_timestamped_other = re_time
+		re_timestamped_other = "" # any tokenized line is a timestamped message
 		self.matching_rules.append(MedusaParser.MatchingRuleSimple(re_timestamped_other, "other", "message"))
 
 	
-	def build_matched_log_entry(self, rule, match_result, log_str) :
-		data = match_result.groupdict()
-		data["log_str"] = log_str
-		data["session_owner"] = self.session_owner #! TODO
+	# the session owner is the target of incoming entries, the source of outgoing ones, and whoever "you" is otherwise
+	def fill_session_owner(self, rule, data) :
 		if rule.rule_name.endswith("_in") : data["target_pilot"] = self.session_owner
 		elif rule.rule_name.endswith("_out") : data["src_pilot"] = self.session_owner
 		elif "src_you" in data and data["src_pilot"] == None : data["src_pilot"] = self.session_owner
 		elif "target_you" in data and data["target_pilot"] == None : data["target_pilot"] = self.session_owner
-		for k in data.keys() :
-			if data[k] is not None :
-				data[k] = data[k].strip()
-		return {rule.category : {rule.rule_name : [data]}}
+
+	# build a LogEntry from a match result, keeping only the fields used downstream (amount as an int, time as epoch seconds)
+	def build_matched_log_entry(self, rule, match_result, time_str, log_str = None) :
+		data = match_result.groupdict()
+		self.fill_session_owner(rule, data)
+		for k, v in data.items() :
+			if v is not None : data[k] = v.strip()
+		symbol = self.symbol
+		return LogEntry(rule.rule_id, time_str_to_epoch(time_str),
+			symbol(data.get("src_pilot")), symbol(data.get("target_pilot")),
+			int(data[rule.amount_field]) if rule.amount_field is not None else 0,
+			symbol(data.get("weapon")), symbol(data.get("hit_type")),
+			symbol(data.get("src_ship_type")), symbol(data.get("target_ship_type")),
+			self.session_owner_symbol, log_str)
 	
-	def parse(self, log_entry_str) :
-		if log_entry_str == None : return {}
+	# build the dispatch index from the matching rules :
+	# for each entry type, a single regexp searching for any of the key phrases of its rules,
+	# and a table giving the candidate rules for each key phrase (followed by fallback rules, in matching_rules order)
+	def init_dispatch_index(self) :
+		self.fallback_rules = [rule for rule in self.matching_rules if rule.key_phrase is None]
+		self.dispatch_index = {}
 		for rule in self.matching_rules :
-			m = rule.match(log_entry_str)
+			if rule.key_phrase is None : continue
+			if not rule.entry_type in self.dispatch_index : self.dispatch_index[rule.entry_type] = {}
+			candidates = self.dispatch_index[rule.entry_type]
+			if not rule.key_phrase in candidates : candidates[rule.key_phrase] = []
+			candidates[rule.key_phrase].append(rule)
+		for entry_type, candidates in self.dispatch_index.items() :
+			for key_phrase in candidates.keys() :
+				candidates[key_phrase] = candidates[key_phrase] + self.fallback_rules
+			# longest phrases first, so that a phrase never shadows a longer one starting at the same position
+			key_phrases = sorted(candidates.keys(), key = len, reverse = True)
+			phrase_regexp = re.compile("|".join(re.escape(p) for p in key_phrases))
+			self.dispatch_index[entry_type] = (phrase_regexp, candidates)
+
+	# returns the list of rules worth attempting on the span text of a tokenized line, in matching order
+	# the leftmost key phrase found for the entry type picks the candidate rules
+	def dispatch(self, entry_type, text) :
+		index = self.dispatch_index.get(entry_type)
+		if index is not None :
+			m = index[0].search(text)
+			if m is not None : return index[1][m.group()]
+		return self.fallback_rules
+
+	# returns (rule, match_result, time_str, entry_type) for the first rule matching log_str, or None
+	def match_line(self, log_str) :
+		if self.rule_set_key is None and self.agent_parser.is_init : # the agent parser was initialized meanwhile : switch to the shared rule set
+			self.collect_late_init_attempts()
+			self.init_rules()
+		self.parsed_lines += 1
+		if self.parsed_lines >= self.next_reorder : self.reorder_rules()
+		tokens = split_log_line(log_str)
+		if tokens is None : return None
+		time_str, entry_type, parts = tokens
+		text = span_sep.join(parts[0::2])
+		lead_style = parts[1] if len(parts) > 1 and parts[0] == "" else ""
+		missed_agent_rule = None # agent rule attempted in vain on this line
+		timed = self.parsed_lines % MedusaParser.timing_period == 0 # match time is sampled, see init_rule_stats
+		for rule in self.dispatch(entry_type, text) :
+			if rule.lead_style is not None and not rule.lead_style in lead_style : continue
+			stats = self.rule_stats[rule.rule_id]
+			if timed :
+				start = perf_counter()
+				m = rule.match(text)
+				stats[2] += perf_counter() - start
+				stats[4] += 1
+			else :
+				m = rule.match(text)
+			stats[0] += 1
 			if m is not None :
-				r = self.build_matched_log_entry(rule, m, log_entry_str)
-				if self.debug :
-					print("matched rule " + rule.rule_name + " : ")
-					pprint.pprint(r)
-				return r
-		return {}
-
-	def __init__(self, session_owner, agent_parser = None, debug = False) :
+				stats[1] += 1
+				if rule.uses_agents : self.agent_parser.agent_line_matched()
+				elif missed_agent_rule is not None : self.agent_line_missed(missed_agent_rule, text)
+				return rule, m, time_str, entry_type
+			if self.rule_set_key is None and self.agent_parser.is_init : # the agent format was just detected : parse the line again with initialized rules
+				self.collect_late_init_attempts()
+				self.init_rules()
+				return self.match_line(log_str)
+			if rule.uses_agents and self.rule_set_key is not None : missed_agent_rule = rule
+		if missed_agent_rule is not None : self.agent_line_missed(missed_agent_rule, text)
+		return None
+
+	# an agent line matched no agent rule : check the agent format again once they keep missing (see AgentParser.redetect)
+	def agent_line_missed(self, rule, text) :
+		if not self.agent_parser.agent_line_missed() : return
+		if self.agent_parser.redetect(rule.get_agent_str(text)) :
+			self.collect_late_init_attempts()
+			self.init_rules()
+
+	# per-rule statistics, indexed by rule id : [attempts, hits, timed attempts match time (s), late init attempts, timed attempts]
+	# rules are shared between parsers, so statistics are kept by each parser for its own session
+	# attempts and hits are counted on every line, but only the attempts of one line in timing_period are timed, keeping clock reads off the hot path
+	timing_period = 16
+	def init_rule_stats(self) :
+		self.rule_stats = [[0, 0, 0., 0, 0] for r in rule_table]
+		self.parsed_lines = 0
+		self.next_reorder = MedusaParser.reorder_period
+
+	# late init attempts are counted by the rules bound to this parser, collect them before the rules are dropped
+	def collect_late_init_attempts(self) :
+		for rule in self.matching_rules :
+			if getattr(rule, "late_init_attempts", 0) == 0 : continue
+			self.rule_stats[rule.rule_id][3] += rule.late_init_attempts
+			rule.late_init_attempts = 0
+
+	# returns per-rule statistics of this session, as {rule_name : {"attempts", "hits", "match_time", "late_init_attempts"}}
+	# match_time (s) is estimated from the timed attempts, over every attempt
+	# only rules attempted at least once are reported
+	def get_rule_stats(self) :
+		self.collect_late_init_attempts()
+		r = {}
+		for rule_id, stats in enumerate(self.rule_stats) :
+			if stats[0] == 0 and stats[3] == 0 : continue
+			match_time = stats[2] * stats[0] / stats[4] if stats[4] > 0 else 0.
+			r[rule_table[rule_id][1]] = {"attempts": stats[0], "hits": stats[1], "match_time": match_time, "late_init_attempts": stats[3]}
+		return r
+
+	def print_rule_stats(self) :
+		print("MedusaParser : rule statistics for " + str(self.session_owner) + " (" + str(self.parsed_lines) + " lines) :")
+		print("  {:<24} {:>10} {:>10} {:>12} {:>10} {:>6}".format("rule", "attempts", "hits", "time (ms)", "us/try", "late"))
+		for rule_name, stats in sorted(self.get_rule_stats().items(), key = lambda kv : kv[1]["match_time"], reverse = True) :
+			print("  {:<24} {:>10} {:>10} {:>12.3f} {:>10.3f} {:>6}".format(rule_name, stats["attempts"], stats["hits"], stats["match_time"] * 1000.,
+				stats["match_time"] * 1000000. / stats["attempts"] if stats["attempts"] > 0 else 0., stats["late_init_attempts"]))
+
+	# order matching rules by hit count in this session, most frequent first, and rebuild this parser's dispatch index
+	# the shared rule lists are left untouched : the reordered lists belong to this parser
+	reorder_period = 1000 # lines parsed between two reorderings, doubled each time up to reorder_period_max
+	reorder_period_max = 64000
+	def reorder_rules(self) :
+		self.next_reorder = self.parsed_lines + min(self.parsed_lines, MedusaParser.reorder_period_max)
+		order = sorted(self.matching_rules, key = lambda rule : self.rule_stats[rule.rule_id][1], reverse = True)
+		if order == self.matching_rules : return
+		if self.debug : print("MedusaParser : reordering matching rules : " + ", ".join(rule.rule_name for rule in order))
+		self.matching_rules = order
+		self.init_dispatch_index()
+
+	# parse a single log line into a LogEntry, or None if it is not a log entry
+	def parse(self, log_entry_str, keep_log_str = True) :
+		if log_entry_str == None : return None
+		matched = self.match_line(log_entry_str)
+		if matched is None : return None
+		rule, m, time_str, entry_type = matched
+		r = self.build_matched_log_entry(rule, m, time_str, log_entry_str if keep_log_str else None)
+		if self.debug :
+			print("matched rule " + rule.rule_name + " : ")
+			pprint.pprint(r)
+		return r
+
+	# parse an iterable of log lines into a single columnar event block (see block_columns)
+	# raw log lines are only kept when keep_log_str is set
+	def parse_many(self, log_lines, keep_log_str = True) :
+		block = new_block(block_columns if keep_log_str else block_columns_no_log_str)
+		for log_str in log_lines :
+			matched = self.match_line(log_str)
+			if matched is None : continue
+			rule, m, time_str, entry_type = matched
+			self.build_matched_log_entry(rule, m, time_str, log_str if keep_log_str else None).append_to(block)
+		if self.debug : print("parse_many : parsed " + str(block_size(block)) + " log entries")
+		return block
+
+	# symbol_table : if supplied, names are stored in log entries as symbol ids of this table (see MedusaSymbolTable)
+	def __init__(self, session_owner, agent_parser = None, debug = False, symbol_table = None) :
 		self.debug = debug
 		self.session_owner = session_owner
+		self.symbol_table = symbol_table
+		if symbol_table is not None :
+			self.symbol = symbol_table.intern
+		else :
+			self.symbol = lambda name : name
+		self.session_owner_symbol = self.symbol(session_owner)
 		if agent_parser : # if agent parser is supplied
 			self.agent_parser = agent_parser
 		else : # late default initialization
 			self.agent_parser = AgentParser(debug = debug)
+		self.init_rule_stats()
 		self.init_rules()
 
 if __name__ == "__main__" :
@@ -0,0 +1,74 @@
+# Medusa replay engine
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import re_time
+from MedusaGameTime import time_str_to_epoch
+
+# time management
+import time
+
+# output and formatting
+import re
+
+# replay log line, as written by MedusaWorker.dump_replay_logs : "[session owner][ 2020.07.09 11:35:20 ] (combat) ..."
+# the session owner is missing in older replay logs
+re_replay_line = re.compile(r"(\[(?P<session_owner>[^\[\]]*)\])?\s?" + re_time + r"(?P<log_str>.*)")
+
+# Replays a session recorded by the server (see MedusaWorker.dump_replay_logs), calling on_lines(session_owner, lines)
+# with consecutive log lines of the same session owner and game second, in the gamelog format expected by MedusaParser.
+# Lines are scheduled by their game timestamps : speedup 1 replays the session in real time, 10 ten times faster,
+# and None (or 0) as fast as possible. Only lines timed between start and end (epoch seconds, both optional) are replayed.
+class Replayer :
+	default_session_owner = "Unknown"
+
+	# sleep until game time t is due, the replay clock starting at the first replayed line
+	def wait_for(self, t) :
+		if not self.speedup : return
+		if self.clock_start is None :
+			self.clock_start = (time.monotonic(), t)
+			return
+		wall_start, game_start = self.clock_start
+		delay = wall_start + (t - game_start) / self.speedup - time.monotonic()
+		if delay > 0 : time.sleep(delay)
+
+	def flush(self) :
+		if not self.chunk : return
+		session_owner, t = self.chunk_key
+		self.wait_for(t)
+		self.on_lines(session_owner, self.chunk)
+		self.lines_replayed += len(self.chunk)
+		self.chunk = []
+
+	# replay the whole file, returns the number of lines replayed
+	def run(self) :
+		time_str, t = None, None
+		with open(self.fname, "r", encoding = "utf8", errors = "replace") as f :
+			for l in f :
+				m = re_replay_line.match(l)
+				if m is None :
+					if l.strip() and self.debug : print("Replayer : could not read session replay line : " + l.rstrip("\n"))
+					continue
+				session_owner, line_time_str, log_str = m.group("session_owner", "time_str", "log_str")
+				if line_time_str != time_str : time_str, t = line_time_str, time_str_to_epoch(line_time_str)
+				if (self.start is not None and t < self.start) or (self.end is not None and t > self.end) : continue
+				key = (session_owner or Replayer.default_session_owner, t)
+				if key != self.chunk_key :
+					self.flush()
+					self.chunk_key = key
+				self.chunk.append("[ " + time_str + " ]" + log_str.rstrip("\r"))
+		self.flush()
+		return self.lines_replayed
+
+	def __init__(self, fname, on_lines, speedup = 1., start = None, end = None, debug = False) :
+		self.fname = fname
+		self.on_lines = on_lines
+		self.speedup = speedup
+		self.start = start
+		self.end = end
+		self.debug = debug
+		self.clock_start = None # (wall clock, game time) of the first replayed line
+		self.chunk = [] # lines waiting to be passed to on_lines
+		self.chunk_key = None # (session owner, game time) of chunk
+		self.lines_replayed = 0
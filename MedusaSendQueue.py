@@ -0,0 +1,249 @@
+# Medusa client send queue
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import rule_table, block_size, select_block_rows
+
+# time management
+import time
+
+# concurrency management
+import threading
+import collections
+
+# rule category of each rule id
+rule_categories = [rule_category for rule_category, rule_name, amount_field in rule_table]
+
+# entries count of each rule category in block
+def count_categories(block) :
+	r = {}
+	for rule in block["rule"] :
+		category = rule_categories[rule]
+		r[category] = r.get(category, 0) + 1
+	return r
+
+# Bounded queue of parsed log entries blocks, waiting to be sent to the server.
+# get_blocks() returns as soon as flush_rows entries are waiting, or when the oldest one waited for max_latency seconds,
+# and sleeps as long as the queue is empty : a busy client sends small batches often, an idle one sends nothing.
+# Batches hold at most batch_rows entries : a backlog (e.g after a reconnection) is sent in several batches, back to back.
+# When more than max_rows entries are waiting (e.g the server is unreachable), the oldest entries of the drop_categories
+# rule categories are dropped, in that order. Damage ("dps" entries) is never dropped, the queue grows beyond max_rows instead.
+# Entries counts are kept by rule category, for the queue and for each block : nothing is scanned when there is nothing to drop.
+# Blocks may come with an on_sent callback, called once the block and every block queued before it were sent
+# (the sender calls task_done() after sending each batch), or dropped. join() waits for every queued block to be sent.
+# A batch that could not be sent goes back to the head of the queue (task_done(sent = False)), its callbacks along with it.
+# With hold_seconds set (e.g for batches aggregated per second, see MedusaParser.aggregate_block), the entries of the newest game second
+# of each session owner are held back until entries of a later second come, or for hold_time seconds at most : a game second is sent whole.
+class SendQueue :
+	flush_rows = 1000
+	max_latency = 0.15 # seconds
+	max_rows = 200000
+	batch_rows = 20000
+	drop_categories = ["other", "command", "ewar", "neut", "remote_assist"]
+	hold_time = 1.5 # seconds
+
+	def put(self, block, on_sent = None) :
+		n = block_size(block)
+		callbacks = [on_sent] if on_sent is not None else []
+		if n == 0 :
+			# nothing to send : on_sent only waits for the blocks queued before
+			if callbacks :
+				with self.cond : self.defer_callbacks(len(self.blocks), callbacks)
+			return
+		counts = count_categories(block)
+		with self.cond :
+			self.blocks.append([time.monotonic(), block, counts, callbacks])
+			self.rows += n
+			self.add_category_rows(counts, 1)
+			if self.rows > self.max_rows : self.drop_overflow()
+			self.cond.notify()
+
+	# callbacks of an entry that will not be sent (nothing to send, or dropped) : called along with the ones of the entry queued before index,
+	# or of the held entries, or of the batch being sent, or right away
+	def defer_callbacks(self, index, callbacks) :
+		with self.cond :
+			if index > 0 :
+				self.blocks[index - 1][3].extend(callbacks)
+				return
+			if self.held :
+				self.held[-1][3].extend(callbacks)
+				return
+			if self.in_flight_entries :
+				self.in_flight_entries[-1][3].extend(callbacks)
+				return
+		for callback in callbacks : callback()
+
+	def add_category_rows(self, counts, sign) :
+		for category, count in counts.items() : self.category_rows[category] = self.category_rows.get(category, 0) + sign * count
+
+	# drop the oldest entries of droppable categories, until the queue fits in max_rows again
+	def drop_overflow(self) :
+		emptied = False
+		for category in self.drop_categories :
+			if self.category_rows.get(category, 0) == 0 : continue
+			for entry in self.blocks :
+				excess = self.rows - self.max_rows
+				if excess <= 0 : break
+				put_time, block, counts, callbacks = entry
+				count = counts.get(category, 0)
+				if count == 0 : continue
+				n = block_size(block)
+				if count == n and count <= excess : # a block of this category only : dropped whole
+					entry[1] = select_block_rows(block, [])
+					entry[2] = {}
+					emptied = True
+				else : # dropping from the oldest entries : the first matching rows of this block
+					dropped = min(count, excess)
+					keep = []
+					for j, rule in enumerate(block["rule"]) :
+						if dropped > 0 and rule_categories[rule] == category : dropped -= 1
+						else : keep.append(j)
+					entry[1] = select_block_rows(block, keep)
+					count = n - len(keep)
+					counts[category] -= count
+					if counts[category] == 0 : del counts[category]
+				self.rows -= count
+				self.category_rows[category] -= count
+				self.dropped[category] = self.dropped.get(category, 0) + count
+			if self.rows <= self.max_rows : break
+		if emptied :
+			blocks = self.blocks
+			self.blocks = collections.deque()
+			for entry in blocks :
+				if entry[2] : self.blocks.append(entry)
+				elif entry[3] : self.defer_callbacks(len(self.blocks), entry[3])
+
+	# waits for a batch to be due, then returns its blocks (at most batch_rows entries, the oldest ones) and the queue statistics before it was taken (see get_stats).
+	# the batch is in flight until task_done() is called
+	def get_blocks(self) :
+		with self.cond :
+			while True :
+				if self.rows >= self.flush_rows : break
+				timeouts = []
+				if self.rows > 0 : timeouts.append(self.blocks[0][0] + self.max_latency - time.monotonic())
+				if self.held : timeouts.append(self.held_until - time.monotonic())
+				if not timeouts : self.cond.wait()
+				elif min(timeouts) <= 0 : break
+				else : self.cond.wait(min(timeouts))
+			stats = self.get_stats()
+			# held entries come first : they were queued before
+			held = self.held
+			self.held = []
+			self.held_rows = 0
+			r = [entry[1] for entry in held]
+			self.in_flight_entries.extend(held)
+			rows = 0
+			while self.blocks and rows < self.batch_rows :
+				entry = self.blocks[0]
+				put_time, block, counts, callbacks = entry
+				n = block_size(block)
+				if rows + n > self.batch_rows : # the rest of the block waits for the next batch, with its callbacks
+					k = self.batch_rows - rows
+					rest = select_block_rows(block, range(k, n))
+					block = select_block_rows(block, range(k))
+					entry[1] = rest
+					entry[2] = count_categories(rest)
+					entry = [put_time, block, count_categories(block), []]
+					n = k
+				else :
+					self.blocks.popleft()
+				self.add_category_rows(entry[2], -1)
+				self.in_flight_entries.append(entry)
+				r.append(block)
+				rows += n
+			self.rows -= rows
+			self.in_flight += 1
+			if self.hold_seconds : r = self.hold_newest_seconds()
+			elif self.held_seconds : self.held_seconds = {}
+			return r, stats
+
+	# moves the entries of the newest second of each session owner from the batch in flight to held entries, returns the blocks left in the batch
+	def hold_newest_seconds(self) :
+		newest = {} # session owner -> newest second
+		for entry in self.in_flight_entries :
+			for owner, t in zip(entry[1]["owner"], entry[1]["time"]) :
+				if t > newest.get(owner, t - 1) : newest[owner] = t
+		now = time.monotonic()
+		held_seconds = {}
+		for owner, t in newest.items() :
+			second, since = self.held_seconds.get(owner, (None, now))
+			if second != t : since = now
+			if now - since < self.hold_time : held_seconds[owner] = (t, since) # else held long enough, sent as is
+		self.held_seconds = held_seconds
+		if not held_seconds : return [entry[1] for entry in self.in_flight_entries]
+		self.held_until = min(since for t, since in held_seconds.values()) + self.hold_time
+		entries = self.in_flight_entries
+		self.in_flight_entries = []
+		for entry in entries :
+			put_time, block, counts, callbacks = entry
+			held_indexes, sent_indexes = [], []
+			for i, (owner, t) in enumerate(zip(block["owner"], block["time"])) :
+				if owner in held_seconds and held_seconds[owner][0] == t : held_indexes.append(i)
+				else : sent_indexes.append(i)
+			if not held_indexes :
+				self.in_flight_entries.append(entry)
+				continue
+			# callbacks wait for the held entries
+			held_block = select_block_rows(block, held_indexes) if sent_indexes else block
+			self.held.append([put_time, held_block, count_categories(held_block), callbacks])
+			self.held_rows += len(held_indexes)
+			if sent_indexes :
+				sent_block = select_block_rows(block, sent_indexes)
+				self.in_flight_entries.append([put_time, sent_block, count_categories(sent_block), []])
+		return [entry[1] for entry in self.in_flight_entries]
+
+	# to be called by the sender once done with the batch returned by get_blocks() : on_sent callbacks of its blocks are called if it was sent,
+	# else its blocks are queued again, first, for the next batch (the sender must leave them unchanged)
+	def task_done(self, sent = True) :
+		callbacks = []
+		with self.cond :
+			if self.in_flight == 0 : return
+			self.in_flight -= 1
+			entries = self.in_flight_entries
+			self.in_flight_entries = []
+			if sent :
+				for entry in entries : callbacks.extend(entry[3])
+			else :
+				for entry in reversed(entries) :
+					self.blocks.appendleft(entry)
+					self.rows += block_size(entry[1])
+					self.add_category_rows(entry[2], 1)
+				if self.rows > self.max_rows : self.drop_overflow()
+				self.cond.notify()
+			self.sent_cond.notify_all()
+		for callback in callbacks : callback()
+
+	# waits for the queue to be empty and the batch in flight to be sent, returns False on timeout
+	def join(self, timeout = None) :
+		with self.sent_cond :
+			return self.sent_cond.wait_for(lambda : self.rows == 0 and not self.held and self.in_flight == 0, timeout)
+
+	# queued entries count (held ones included), and dropped entries count by rule category
+	def get_stats(self) :
+		with self.cond :
+			return {"depth" : self.rows + self.held_rows, "dropped" : dict(self.dropped)}
+
+	def __len__(self) :
+		with self.cond : return self.rows + self.held_rows
+
+	def __init__(self, flush_rows = None, max_latency = None, max_rows = None, drop_categories = None, batch_rows = None) :
+		if flush_rows is not None : self.flush_rows = flush_rows
+		if max_latency is not None : self.max_latency = max_latency
+		if max_rows is not None : self.max_rows = max_rows
+		if drop_categories is not None : self.drop_categories = drop_categories
+		if batch_rows is not None : self.batch_rows = batch_rows
+		self.lock = threading.RLock()
+		self.cond = threading.Condition(self.lock) # notified when blocks are queued
+		self.sent_cond = threading.Condition(self.lock) # notified when a batch was sent
+		self.blocks = collections.deque() # [time queued, block, {rule category -> entries count}, on_sent callbacks]
+		self.rows = 0
+		self.category_rows = {} # rule category -> queued entries count
+		self.dropped = {} # rule category -> dropped entries count
+		self.in_flight = 0 # batches returned by get_blocks() and not sent yet
+		self.in_flight_entries = [] # entries of the batch in flight, as queued
+		self.hold_seconds = False
+		self.held = [] # entries held back, as queued (see hold_newest_seconds)
+		self.held_rows = 0
+		self.held_seconds = {} # session owner -> (game second held back, monotonic time since)
+		self.held_until = 0 # monotonic time the first held entries are due
@@ -4,19 +4,16 @@
 # Author : Tnemelc Abramovich
 
 # internal dependencies
-from MedusaStatusInfo import make_status_info
-from MedusaParser import MedusaParser, recursive_merge
-from MedusaGameTime import GameTime
+from MedusaParser import block_symbol_columns, block_columns_no_log_str, block_aggregate_columns, rule_table
+from MedusaSymbolTable import SymbolTable, SymbolMap
+from MedusaWire import wire_versions, decode_collection, WireFormatError
 from MedusaWorker import MedusaWorkerThread
 
 # system and os
 import sys
+import signal
 
 
-# time management
-import datetime
-import time
-
 # concurrency management
 import queue
 import subprocess
@@ -28,7 +25,6 @@ import eventlet
 #from aiohttp import web
 
 # output and formatting
-import json
 import pprint
 
 # monkeypatch
@@ -60,6 +56,38 @@ class MedusaBroadcaster(socketio.Namespace) :
 		self.debug = debug
 		
 
+# returns why symbols are not [first symbol id, [names]] (see MedusaSymbolTable.SymbolMap), None if they are
+def check_symbols(symbols) :
+	if not isinstance(symbols, (list, tuple)) or len(symbols) != 2 : return "malformed symbols"
+	start, names = symbols
+	if not isinstance(start, int) or start < 1 or not isinstance(names, list) : return "malformed symbols"
+	if not all(isinstance(name, str) for name in names) : return "symbol names are not strings"
+	return None
+
+# returns why col is not a block of log entries the worker can merge, None if it is :
+# every log entry column (aggregate columns both or none), of the same length, rule ids and symbol ids (below symbols_count) in range
+def check_collection(col, symbols_count) :
+	missing = [c for c in block_columns_no_log_str if not c in col]
+	if missing : return "missing columns " + ", ".join(missing)
+	aggregate_columns = [c for c in block_aggregate_columns if c in col]
+	if aggregate_columns and len(aggregate_columns) != len(block_aggregate_columns) : return "incomplete aggregate columns"
+	unknown = [c for c in col if not c in block_columns_no_log_str + block_aggregate_columns + ["log_str"]]
+	if unknown : return "unknown columns " + ", ".join(str(c) for c in unknown)
+	try :
+		n = len(col["rule"])
+		for c, column in col.items() :
+			if len(column) != n : return "column " + c + " has " + str(len(column)) + " rows instead of " + str(n)
+		if n == 0 : return None
+		for c, column in col.items() :
+			if c == "log_str" : continue
+			lo, hi = min(column), max(column)
+			if not isinstance(lo, int) or not isinstance(hi, int) : return "column " + c + " does not hold integers"
+			if c == "rule" and (lo < 0 or hi >= len(rule_table)) : return "unknown rule ids"
+			if c in block_symbol_columns and (lo < 0 or hi >= symbols_count) : return "unknown symbol ids in column " + c
+	except TypeError :
+		return "malformed columns"
+	return None
+
 # MedusaCollector class-based namespace and event handlers
 # Connection and event reciever for collecting parsed log information.
 # Instances of the MedusaClient connect to an instance of MedusaCollector to send parsed logs to the server
@@ -68,30 +96,108 @@ class MedusaCollector(socketio.Namespace) :
 
 	def on_connect(self, sid, environ):
 		print("MedusaCollector : " + str(sid) + " connected")
+		# raw log lines are only needed for writing replay logs
+		# clients supporting one of the wire format versions send binary collections (see MedusaWire)
+		# clients catching up on gamelogs written while they were not running skip log entries older than persistance
+		self.emit("collector_config", {"log_str" : self.replay_logs, "wire_versions" : wire_versions, "persistance" : self.persistance}, room=sid)
 	def on_disconnect(self, sid):
 		print("MedusaCollector : " + str(sid) + " disconnected")
+		self.parser_stats.pop(sid, None)
+		self.queue_stats.pop(sid, None)
+		self.symbol_maps.pop(sid, None)
 
 
-	# 'log_entries_col' event handler
+	# 'log_entries_col' event handler : json encoded collection
 	def on_log_entries_col(self, sid, col) :
 		if self.debug : print("on_log_entries_col : recieved new collection : ")
 		if self.debug : pprint.pprint(col)
+		self.collect(sid, col)
+
+	# 'log_entries_bin' event handler : binary encoded collection (see MedusaWire)
+	def on_log_entries_bin(self, sid, data) :
+		try :
+			col = decode_collection(data)
+		except WireFormatError as e :
+			print("Warning : MedusaCollector : dropping collection from " + str(sid) + " : " + str(e))
+			return
+		if self.debug : print("on_log_entries_bin : recieved new collection (" + str(len(data)) + " bytes) : ")
+		if self.debug : pprint.pprint(col)
+		self.collect(sid, col)
+
+	def collect(self, sid, col) :
+		if not isinstance(col, dict) :
+			print("Warning : MedusaCollector : dropping collection from " + str(sid) + " : not a collection")
+			return
+		# parser statistics are not log entries : keep the latest ones for each client
+		parser_stats = col.pop("parser_stats", None)
+		if isinstance(parser_stats, dict) : self.parser_stats[sid] = parser_stats
+		# client send queue depth and dropped entries, as well
+		queue_stats = col.pop("queue_stats", None)
+		if isinstance(queue_stats, dict) :
+			if queue_stats.get("dropped") != self.queue_stats.get(sid, {}).get("dropped", {}) :
+				print("Warning : MedusaCollector : " + str(sid) + " send queue overflow, dropped entries : " + str(queue_stats.get("dropped")))
+			self.queue_stats[sid] = queue_stats
+		# translate client symbol ids into server symbol ids
+		if not sid in self.symbol_maps : self.symbol_maps[sid] = SymbolMap(self.symbol_table)
+		symbol_map = self.symbol_maps[sid]
+		symbols = col.pop("symbols", None)
+		error = check_symbols(symbols) if symbols is not None else None
+		if error is None :
+			if symbols is not None : symbol_map.add_names(*symbols)
+			error = check_collection(col, len(symbol_map.local_ids))
+		if error is not None : # a single bad collection must not stop the worker
+			print("Warning : MedusaCollector : dropping collection from " + str(sid) + " : " + error)
+			return
+		for c in block_symbol_columns :
+			if c in col : col[c] = symbol_map.map_column(col[c])
 		# queue recieved log entries
 		self.shared_recv_queue.put(col)
 		
+	# latest parser and send queue statistics of every connected client, as {client sid : {"parser_stats" : ..., "queue_stats" : ...}}
+	def get_client_stats(self) :
+		return {sid : {"parser_stats" : self.parser_stats.get(sid), "queue_stats" : self.queue_stats.get(sid)} for sid in set(self.parser_stats) | set(self.queue_stats)}
+
+	def print_client_stats(self) :
+		for sid, stats in self.get_client_stats().items() :
+			print("MedusaCollector : client " + str(sid) + " send queue statistics : " + str(stats["queue_stats"]))
+			for session_owner, rule_stats in (stats["parser_stats"] or {}).items() :
+				print("  " + str(session_owner) + " : " + ", ".join(rule_name + " " + str(s["hits"]) + "/" + str(s["attempts"]) for rule_name, s in sorted(rule_stats.items())))
+
+	# 'client_stats' event handler : statistics of every client are returned to the caller (e.g socketio.Client.call("client_stats", namespace = "/medusacollector"))
+	def on_client_stats(self, sid) :
+		return self.get_client_stats()
+
 	# 'strmsg' event handler
 	def on_strmsg(self, sid, msg) :
 		print("MedusaServer : got message from " + self.namespace.connected_clients[sid].client_name + " : " + msg)
 	
-	def __init__(self, shared_recv_queue, debug = False):
+	def __init__(self, shared_recv_queue, symbol_table, replay_logs = False, persistance = 15, debug = False):
 		super().__init__('/medusacollector')
 		self.shared_recv_queue = shared_recv_queue
+		self.symbol_table = symbol_table
+		self.symbol_maps = {} # client sid -> SymbolMap
+		self.replay_logs = replay_logs
+		self.persistance = persistance # seconds log entries are kept for (see MedusaWorker)
 		self.debug = debug
+		self.parser_stats = {} # client sid -> {session owner -> {rule name -> rule statistics}}
+		self.queue_stats = {} # client sid -> {"depth" : queued entries count, "dropped" : {rule category -> dropped entries count}}
 
 
 
 class MedusaServer :
 
+	# client statistics are dumped on SIGUSR1 ("kill -USR1 <pid>"), where available
+	def setup_stats_signal(self) :
+		if not hasattr(signal, "SIGUSR1") : return
+		previous_handler = signal.getsignal(signal.SIGUSR1)
+		def on_signal(signum, frame) :
+			self.collector.print_client_stats()
+			if callable(previous_handler) : previous_handler(signum, frame)
+		try :
+			signal.signal(signal.SIGUSR1, on_signal)
+		except ValueError : # not the main thread
+			print("Warning : MedusaServer : could not set up client statistics dump on SIGUSR1")
+
 	def serve(self) :
 		# start main service thread using eventlet as a straightforward wsgi
 		print("MedusaServer : service starting up on thread " +  str(threading.get_ident()))
@@ -99,12 +205,13 @@ class MedusaServer :
 		#web.run_app(self.webapp, host = self.bind_addr, port = self.bind_port)
 
 	
-	def __init__(self, bind_addr = "0.0.0.0", bind_port = 1877, redis_addr = 'localhost', redis_port=6379, replay_logs_output_filename = None, log_entries_persistance_duration = 15, debug = False) :
+	def __init__(self, bind_addr = "0.0.0.0", bind_port = 1877, redis_addr = 'localhost', redis_port=6379, replay_logs_output_filename = None, log_entries_persistance_duration = 15, status_windows = (5, 15, 60), incremental_status = True, debug = False) :
 		print ("New MedusaServer")
 		self.debug = debug
 		self.eve_time_timedelta = None
 
 		self.shared_recv_queue = queue.Queue()
+		self.symbol_table = SymbolTable() # names of every collected log entry, shared by the collector and the worker
 		
 		# init redis manager
 		self.redis_addr = redis_addr
@@ -124,13 +231,14 @@ class MedusaServer :
 		self.socketio_server.register_namespace(self.broadcaster)
 		
 		# start worker process
-		self.worker_thread = threading.Thread(target=MedusaWorkerThread, args=(self.shared_recv_queue, str(self.redis_addr), str(self.redis_port)), kwargs={"debug":self.debug})
+		self.worker_thread = threading.Thread(target=MedusaWorkerThread, args=(self.shared_recv_queue, self.symbol_table, str(self.redis_addr), str(self.redis_port)), kwargs={"replay_output_fname":replay_logs_output_filename, "persistance":log_entries_persistance_duration, "status_windows":status_windows, "incremental_status":incremental_status, "debug":self.debug})
 		self.worker_thread.daemon = True
 		self.worker_thread.start()
 		
 		# init collector namespace
-		self.collector = MedusaCollector(self.shared_recv_queue)
+		self.collector = MedusaCollector(self.shared_recv_queue, self.symbol_table, replay_logs = replay_logs_output_filename is not None, persistance = log_entries_persistance_duration, debug = self.debug)
 		self.socketio_server.register_namespace(self.collector)
+		self.setup_stats_signal()
 		
 		# init webapp
 		#self.webapp = web.Application()
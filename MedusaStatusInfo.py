@@ -2,195 +2,186 @@
 # This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
 # Author : Tnemelc Abramovich
 
-# generates a status_info dict from a logs_collection dict.
-# A status_info dict is a simpler object in that it has inherently less entries than a logs_collection dict.
+# internal dependencies
+from MedusaParser import rule_ids, block_size
+from MedusaSymbolTable import no_symbol
+
+# metric registry : the status_info updates made by the log entries of each parser rule (see MedusaParser.rule_table),
+# as ([(pilot field, amount field, metric, reduction)], pilot fields whose ship type the entries tell)
+# pilot field : "src" or "target" for a character metric, None for a total metric
+# amount field : "amount", or "max" for the largest single amount (of aggregated entries, see MedusaParser.aggregate_block), None for flags
+# reduction : "sum" of amounts per second over dps_window, "max" of amounts, "flag" set by any entry
+# src and target are already normalized by the parser : the session owner is the target of _in rules and the src of _out rules.
+def damage_metrics(total) :
+	return [("src", "amount", "dps_out", "sum"), ("src", "max", "alpha_out", "max"),
+		("target", "amount", "dps_in", "sum"), ("target", "max", "alpha_in", "max"), (None, "amount", total, "sum")]
+def transfer_metrics(metric_out, metric_in, total) :
+	return [("src", "amount", metric_out, "sum"), ("target", "amount", metric_in, "sum"), (None, "amount", total, "sum")]
+def flag_metrics(target_flag, src_flag) :
+	return [("target", None, target_flag, "flag"), ("src", None, src_flag, "flag")]
+metric_registry = {
+	"weapon_cycle_out" : (damage_metrics("dps_out"), ["target"]),
+	"weapon_cycle_in" : (damage_metrics("dps_in"), ["src"]),
+	"neut_out" : (transfer_metrics("neut_out", "neut_in", "neut_out"), ["target"]),
+	"neut_in" : (transfer_metrics("neut_out", "neut_in", "neut_in"), ["src"]),
+	"nos_out" : (transfer_metrics("nos_out", "nos_in", "nos_out"), ["target"]),
+	"nos_in" : (transfer_metrics("nos_out", "nos_in", "nos_in"), ["src"]),
+	"remote_shield_out" : (transfer_metrics("hps_out", "hps_in", "reps_out"), ["target"]),
+	"remote_shield_in" : (transfer_metrics("hps_out", "hps_in", "reps_in"), ["src"]),
+	"remote_armor_out" : (transfer_metrics("hps_out", "hps_in", "reps_out"), ["target"]),
+	"remote_armor_in" : (transfer_metrics("hps_out", "hps_in", "reps_in"), ["src"]),
+	"remote_hull_out" : (transfer_metrics("hps_out", "hps_in", "reps_out"), ["target"]),
+	"remote_hull_in" : (transfer_metrics("hps_out", "hps_in", "reps_in"), ["src"]),
+	"remote_capacitor_out" : (transfer_metrics("remote_capacitor_out", "remote_capacitor_in", "cap_transfer_out"), ["target"]),
+	"remote_capacitor_in" : (transfer_metrics("remote_capacitor_out", "remote_capacitor_in", "cap_transfer_in"), ["src"]),
+	"scramble_attempt" : (flag_metrics("scrambled", "scrambling"), ["target", "src"]),
+	"disruption_attempt" : (flag_metrics("pointed", "pointing"), ["target", "src"]),
+}
+# total metrics, always present in status_info
+total_metrics = ['dps_in', 'dps_out', 'neut_in', 'neut_out', 'nos_in', 'nos_out', 'reps_in', 'reps_out', 'cap_transfer_in', 'cap_transfer_out']
+# reduction of every character metric
+metric_reductions = {metric : reduction for updates, ship_fields in metric_registry.values() for pilot_field, amount_field, metric, reduction in updates if pilot_field is not None}
+
+# registry entry of every rule id, None for rules without status_info updates
+def registry_by_rule_id() :
+	r = [None] * len(rule_ids)
+	for rule_name, entry in metric_registry.items() : r[rule_ids[rule_name]] = entry
+	return r
+metric_registry_by_rule_id = registry_by_rule_id()
+
+# optional dependencies : numpy speeds up status info for large logs collections (see make_status_info_vectorized)
+try :
+	import numpy
+except ImportError :
+	numpy = None
+
+# logs collections of at least this many log entries are aggregated by make_status_info_vectorized, when numpy is available
+vectorize_min_rows = 5000
+
+# generates a status_info dict from a logs_collection columnar event block (see MedusaParser.block_columns).
+# A status_info dict is a simpler object in that it has inherently less entries than a logs_collection block.
 # As such, it is lighter and more suited for sharing, typically though the network and to a web server in charge of displaying the information.
 # It aggregates informations in the provided log collection on a per-character basis, including incoming and outgoing dps, remote assistance, capacitor warfare, ewar...
 # It is designed to be a convenient way to sum up key information for each active members and enemies appearing in the users games logs.
-def make_status_info(logs_collection, dps_window, gametime) :
-	# main status_info structure
+# Metrics are those of metric_registry, computed in a single pass over the log entries.
+# If the logs collection holds symbol ids (see MedusaSymbolTable), symbol_table is used to name characters and ship types.
+def make_status_info(logs_collection, dps_window, gametime, symbol_table = None) :
+	if numpy is not None and symbol_table is not None and block_size(logs_collection) >= vectorize_min_rows :
+		return make_status_info_vectorized(logs_collection, dps_window, gametime, symbol_table)
+
+	characters = {}
+	totals = {metric : 0 for metric in total_metrics}
+	accumulate_status(logs_collection, characters, totals)
+
+	# sums per second
+	for character in characters.values() :
+		for metric, value in character.items() :
+			if metric_reductions.get(metric) == "sum" : character[metric] = value / dps_window
+
+	return build_status_info(gametime, characters, {metric : value / dps_window for metric, value in totals.items()}, symbol_table)
+
+# single pass of make_status_info over the log entries of logs_collection, updating characters ({pilot : {metric : value}}) and totals ({total metric : value}) in place :
+# sums are amounts sums, not divided by any window yet
+def accumulate_status(logs_collection, characters, totals) :
+	fields = {
+		"src" : logs_collection["src"],
+		"target" : logs_collection["target"],
+		"amount" : logs_collection["amount"],
+		"max" : logs_collection["max"] if "max" in logs_collection else logs_collection["amount"], # aggregated rows : largest single amount
+	}
+	ship_fields = {"src" : logs_collection["src_ship"], "target" : logs_collection["target_ship"]}
+	# registry entries of the rules, with their fields resolved to logs collection columns
+	column_updates = [None] * len(metric_registry_by_rule_id)
+	for rule_id, entry in enumerate(metric_registry_by_rule_id) :
+		if entry is None : continue
+		updates, ship_pilot_fields = entry
+		column_updates[rule_id] = ([(fields[pilot_field] if pilot_field is not None else None, fields[amount_field] if amount_field is not None else None, metric, reduction)
+			for pilot_field, amount_field, metric, reduction in updates], [(fields[f], ship_fields[f]) for f in ship_pilot_fields])
+
+	for i, rule_id in enumerate(logs_collection["rule"]) :
+		entry = column_updates[rule_id]
+		if entry is None : continue
+		updates, ship_columns = entry
+		for pilots, values, metric, reduction in updates :
+			value = values[i] if values is not None else True
+			if pilots is None :
+				totals[metric] += value
+				continue
+			pilot = pilots[i]
+			character = characters.get(pilot)
+			if character is None : character = characters[pilot] = {}
+			if reduction == "sum" : character[metric] = character.get(metric, 0) + value
+			elif reduction == "max" : character[metric] = max(character.get(metric, 0), value)
+			else : character[metric] = True
+		for pilots, ships in ship_columns :
+			ship_type = ships[i]
+			if ship_type is not None and ship_type != no_symbol : characters.setdefault(pilots[i], {})["ship_type"] = ship_type
+
+# status_info dict of aggregated characters and totals, naming characters and ship types with symbol_table if given, only once aggregated
+def build_status_info(gametime, characters, totals, symbol_table = None) :
 	status_info = {}
 	status_info["date"] = gametime.isoformat(timespec='seconds')
-	status_info["characters"] = {}
-	status_info["total"] = {
-		'dps_in': 0,
-		'dps_out': 0,
-		'neut_in' : 0,
-		'neut_out' : 0,
-		'nos_in' : 0,
-		'nos_out' : 0,
-		'reps_in' : 0,
-		'reps_out' : 0,
-		'cap_transfer_in' : 0,
-		'cap_transfer_out' : 0
-	}
-	
-	def add_ship_type(status_info, pilot, ship_type) : 
-		if ship_type is not None :
-			status_info['characters'][pilot]["ship_type"] = ship_type
-
-	# dps and alpha
-	
-	def add_damage(status_info, src_pilot, target_pilot, weapon_damage) :
-		weapon_damage = int(weapon_damage)
-		if not src_pilot in status_info['characters'] : status_info['characters'][src_pilot] = {}
-		if not 'dps_out' in status_info['characters'][src_pilot] : status_info['characters'][src_pilot]['dps_out'] = 0
-		status_info['characters'][src_pilot]['dps_out'] += weapon_damage / dps_window
-		if not 'alpha_out' in status_info['characters'][src_pilot] : status_info['characters'][src_pilot]['alpha_out'] = 0
-		status_info['characters'][src_pilot]['alpha_out'] = max(status_info['characters'][src_pilot]['alpha_out'], weapon_damage)
-		
-		if not target_pilot in status_info['characters'] : status_info['characters'][target_pilot] = {}
-		if not 'dps_in' in status_info['characters'][target_pilot] : status_info['characters'][target_pilot]['dps_in'] = 0
-		status_info['characters'][target_pilot]['dps_in'] += weapon_damage / dps_window
-		if not 'alpha_in' in status_info['characters'][target_pilot] : status_info['characters'][target_pilot]['alpha_in'] = 0
-		status_info['characters'][target_pilot]['alpha_in'] = max(status_info['characters'][target_pilot]['alpha_in'], weapon_damage)
-	
-	if 'dps' in logs_collection:
-		# dps out
-		if 'weapon_cycle_out' in logs_collection['dps'] :
-			for e in logs_collection['dps']['weapon_cycle_out'] :
-				add_damage(status_info, e["session_owner"], e["target_pilot"], e["weapon_damage"])
-				add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				status_info['total']['dps_out'] += int(e['weapon_damage']) / dps_window
-		
-		# dps in
-		if 'weapon_cycle_in' in logs_collection['dps'] : 
-			for e in logs_collection['dps']['weapon_cycle_in'] :
-				add_damage(status_info, e["src_pilot"], e["session_owner"], e["weapon_damage"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['dps_in'] += int(e['weapon_damage']) / dps_window
-	
-	def add_neut(status_info, src_pilot, target_pilot, neut_amount) :
-		neut_amount = int(neut_amount)
-		if not src_pilot in status_info['characters'] : status_info['characters'][src_pilot] = {}
-		if not 'neut_out' in status_info['characters'][src_pilot] : status_info['characters'][src_pilot]['neut_out'] = 0
-		status_info['characters'][src_pilot]['neut_out'] += neut_amount / dps_window
-
-		if not target_pilot in status_info['characters'] : status_info['characters'][target_pilot] = {}
-		if not 'neut_in' in status_info['characters'][target_pilot] : status_info['characters'][target_pilot]['neut_in'] = 0
-		status_info['characters'][target_pilot]['neut_in'] += neut_amount / dps_window
-	
-	def add_nos(status_info, src_pilot, target_pilot, nos_amount) :
-		nos_amount = int(nos_amount)
-		if not src_pilot in status_info['characters'] : status_info['characters'][src_pilot] = {}
-		if not 'nos_out' in status_info['characters'][src_pilot] : status_info['characters'][src_pilot]['nos_out'] = 0
-		status_info['characters'][src_pilot]['nos_out'] += nos_amount / dps_window
-
-		if not target_pilot in status_info['characters'] : status_info['characters'][target_pilot] = {}
-		if not 'nos_in' in status_info['characters'][target_pilot] : status_info['characters'][target_pilot]['nos_in'] = 0
-		status_info['characters'][target_pilot]['nos_in'] += nos_amount / dps_window
-
-	if 'neut' in logs_collection:
-		if 'neut_out' in logs_collection['neut'] :
-			for e in logs_collection['neut']['neut_out'] :
-				add_neut(status_info, e["session_owner"], e["target_pilot"], e["neut_amount"])
-				add_ship_type(status_info, e["target_pilot"], e["target_ship_type"])
-				status_info['total']['neut_out'] += int(e['neut_amount']) / dps_window
-		if 'neut_in' in logs_collection['neut'] :
-			for e in logs_collection['neut']['neut_in'] :
-				add_neut(status_info, e["src_pilot"], e["session_owner"], e["neut_amount"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['neut_in'] += int(e['neut_amount']) / dps_window
-		
-		if 'nos_out' in logs_collection['neut'] :
-			for e in logs_collection['neut']['nos_out'] :
-				add_nos(status_info, e["session_owner"], e["target_pilot"], e["nos_amount"])
-				add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				status_info['total']['nos_out'] += int(e['nos_amount']) / dps_window
-		if 'nos_in' in logs_collection['neut'] :
-			for e in logs_collection['neut']['nos_in'] :
-				add_nos(status_info, e["src_pilot"], e["session_owner"], e["nos_amount"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['nos_in'] += int(e['nos_amount']) / dps_window
-			
-	
-	# remote repair
-	def add_remote_repair(status_info, src_pilot, target_pilot, repair_amount) :
-		repair_amount = int(repair_amount)
-		if not src_pilot in status_info['characters'] : status_info['characters'][src_pilot] = {}
-		if not 'hps_out' in status_info['characters'][src_pilot] : status_info['characters'][src_pilot]['hps_out'] = 0
-		status_info['characters'][src_pilot]['hps_out'] += repair_amount / dps_window
-		if not target_pilot in status_info['characters'] : status_info['characters'][target_pilot] = {}
-		if not 'hps_in' in status_info['characters'][target_pilot] : status_info['characters'][target_pilot]['hps_in'] = 0
-		status_info['characters'][target_pilot]['hps_in'] += repair_amount / dps_window
-	
-	def add_remote_capacitor(status_info, src_pilot, target_pilot, energy_amount) :
-		energy_amount = int(energy_amount)
-		if not src_pilot in status_info['characters'] : status_info['characters'][src_pilot] = {}
-		if not 'remote_capacitor_out' in status_info['characters'][src_pilot] : status_info['characters'][src_pilot]['remote_capacitor_out'] = 0
-		status_info['characters'][src_pilot]['remote_capacitor_out'] += energy_amount / dps_window
-		if not target_pilot in status_info['characters'] : status_info['characters'][target_pilot] = {}
-		if not 'remote_capacitor_in' in status_info['characters'][target_pilot] : status_info['characters'][target_pilot]['remote_capacitor_in'] = 0
-		status_info['characters'][target_pilot]['remote_capacitor_in'] += energy_amount / dps_window
-	
-	# remote repair out
-	if 'remote_assist' in logs_collection : 
-		if 'remote_shield_out' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_shield_out'] :
-				add_remote_repair(status_info, e["src_pilot"], e["target_pilot"], e["remote_shield_amount"])
-				add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				status_info['total']['reps_out'] += int(e['remote_shield_amount']) / dps_window
-		if 'remote_shield_in' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_shield_in'] :
-				add_remote_repair(status_info, e["src_pilot"], e["target_pilot"], e["remote_shield_amount"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['reps_in'] += int(e['remote_shield_amount']) / dps_window
-		
-		if 'remote_armor_out' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_armor_out'] :
-				add_remote_repair(status_info, e["src_pilot"], e["target_pilot"], e["remote_armor_amount"])
-				add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				status_info['total']['reps_out'] += int(e['remote_armor_amount']) / dps_window
-		if 'remote_armor_in' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_armor_in'] :
-				add_remote_repair(status_info, e["src_pilot"], e["target_pilot"], e["remote_armor_amount"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['reps_in'] += int(e['remote_armor_amount']) / dps_window
-		
-		if 'remote_hull_out' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_hull_out'] :
-				add_remote_repair(status_info, e["src_pilot"], e["target_pilot"], e["remote_hull_amount"])
-				add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				status_info['total']['reps_out'] += int(e['remote_hull_amount']) / dps_window
-		if 'remote_hull_in' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_hull_in'] :
-				add_remote_repair(status_info, e["src_pilot"], e["target_pilot"], e["remote_hull_amount"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['reps_in'] += int(e['remote_hull_amount']) / dps_window
-		
-		if 'remote_capacitor_out' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_capacitor_out'] :
-				add_remote_capacitor(status_info, e["src_pilot"], e["target_pilot"], e["energy_amount"])
-				add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				status_info['total']['cap_transfer_out'] += int(e['energy_amount'])
-		if 'remote_capacitor_in' in logs_collection['remote_assist'] :
-			for e in logs_collection['remote_assist']['remote_capacitor_in'] :
-				add_remote_capacitor(status_info, e["src_pilot"], e["target_pilot"], e["energy_amount"])
-				add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-				status_info['total']['cap_transfer_in'] += int(e['energy_amount']) / dps_window
-		
-	
-	# remote repair in
-	# ignored since already accounted through remote repair_out as long as all logis use the client
-
-	# ewar
-	if 'ewar' in logs_collection: 
-		if 'scramble_attempt' in logs_collection['ewar']:
-			for e in logs_collection['ewar']['scramble_attempt'] :
-				if not e['target_pilot'] in status_info["characters"] : status_info['characters'][e['target_pilot']] = {}
-				status_info['characters'][e['target_pilot']]["scrambled"] = True
-				if "target_ship_type" in e : add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-
-				if not e['src_pilot'] in status_info["characters"] : status_info['characters'][e['src_pilot']] = {}
-				status_info['characters'][e['src_pilot']]["scrambling"] = True
-				if "src_ship_type" in e : add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-		if 'disruption_attempt' in logs_collection['ewar']:
-			for e in logs_collection['ewar']['disruption_attempt'] :
-				if not e['target_pilot'] in status_info["characters"] : status_info['characters'][e['target_pilot']] = {}
-				status_info['characters'][e['target_pilot']]["pointed"] = True
-				if "target_ship_type" in e : add_ship_type(status_info, e["target_pilot"],e["target_ship_type"])
-				if not e['src_pilot'] in status_info["characters"] : status_info['characters'][e['src_pilot']] = {}
-				status_info['characters'][e['src_pilot']]["pointing"] = True
-				if "src_ship_type" in e : add_ship_type(status_info, e["src_pilot"],e["src_ship_type"])
-	
+	status_info["characters"] = name_characters(characters, symbol_table)
+	status_info["total"] = totals
 	return status_info
+
+# characters keyed by name, their ship types named too (in place) : nothing to do without symbol_table
+def name_characters(characters, symbol_table) :
+	if symbol_table is None : return characters
+	named_characters = {}
+	for pilot, character in characters.items() :
+		if "ship_type" in character : character["ship_type"] = symbol_table.lookup(character["ship_type"])
+		named_characters[symbol_table.lookup(pilot)] = character
+	return named_characters
+
+# make_status_info for logs collections holding symbol ids, computed with numpy grouped reductions instead of a python loop over every entry :
+# the entries of each character metric are gathered from every rule updating it, grouped by character, then summed or maxed at once.
+def make_status_info_vectorized(logs_collection, dps_window, gametime, symbol_table) :
+	totals = {metric : 0 for metric in total_metrics}
+
+	rule = numpy.asarray(logs_collection["rule"])
+	fields = {c : numpy.asarray(logs_collection[c], dtype = numpy.int64) for c in ["src", "target", "amount"]}
+	fields["max"] = numpy.asarray(logs_collection["max"], dtype = numpy.int64) if "max" in logs_collection else fields["amount"]
+	ship_fields = {c : numpy.asarray(logs_collection[c + "_ship"], dtype = numpy.int64) for c in ["src", "target"]}
+
+	metric_parts = {} # character metric -> list of (pilots, amounts) of each rule updating it
+	ship_parts = [] # (ordering keys, pilots, ship types) : entries in row order, then ship fields order
+	for rule_name, (updates, ship_pilot_fields) in metric_registry.items() :
+		rows = numpy.flatnonzero(rule == rule_ids[rule_name])
+		if len(rows) == 0 : continue
+		for pilot_field, amount_field, metric, reduction in updates :
+			values = fields[amount_field][rows] if amount_field is not None else None
+			if pilot_field is None : totals[metric] += int(values.sum())
+			else : metric_parts.setdefault(metric, []).append((fields[pilot_field][rows], values))
+		for k, pilot_field in enumerate(ship_pilot_fields) :
+			ship_parts.append((rows * 2 + k, fields[pilot_field][rows], ship_fields[pilot_field][rows]))
+
+	characters = {}
+	for metric, parts in metric_parts.items() :
+		reduction = metric_reductions[metric]
+		pilots, inverse = numpy.unique(numpy.concatenate([p[0] for p in parts]), return_inverse = True)
+		if reduction == "sum" :
+			values = (numpy.bincount(inverse, weights = numpy.concatenate([p[1] for p in parts]), minlength = len(pilots)) / dps_window).tolist()
+		elif reduction == "max" :
+			values = numpy.zeros(len(pilots), dtype = numpy.int64)
+			numpy.maximum.at(values, inverse, numpy.concatenate([p[1] for p in parts]))
+			values = values.tolist()
+		else :
+			values = [True] * len(pilots)
+		for pilot, value in zip(pilots.tolist(), values) :
+			character = characters.get(pilot)
+			if character is None : character = characters[pilot] = {}
+			character[metric] = value
+
+	# last known ship type of each character
+	if ship_parts :
+		order = numpy.argsort(numpy.concatenate([p[0] for p in ship_parts]), kind = "stable")
+		pilots = numpy.concatenate([p[1] for p in ship_parts])[order]
+		ships = numpy.concatenate([p[2] for p in ship_parts])[order]
+		known = ships != no_symbol
+		pilots, ships = pilots[known][::-1], ships[known][::-1]
+		last_pilots, first_reversed = numpy.unique(pilots, return_index = True)
+		for pilot, ship_type in zip(last_pilots.tolist(), ships[first_reversed].tolist()) :
+			characters.setdefault(pilot, {})["ship_type"] = ship_type
+
+	return build_status_info(gametime, characters, {metric : value / dps_window for metric, value in totals.items()}, symbol_table)
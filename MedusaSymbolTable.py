@@ -0,0 +1,63 @@
+# Medusa symbol table
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# system and os
+import threading
+
+# symbol id of None (missing pilot, ship type, weapon...), the same in every symbol table
+no_symbol = 0
+
+# Interning symbol table : maps names (pilots, ship types, weapons, hit types...) to small integer ids.
+# Parsers store symbol ids in event blocks instead of names, names are only looked up again when building status info.
+# Ids are allocated in order and never released, so that a table can be shared incrementally :
+# names_since(n) returns every name allocated an id >= n, and a SymbolMap replays them into another table.
+class SymbolTable :
+
+	# returns the symbol id of name, allocating a new one if needed
+	def intern(self, name) :
+		try :
+			return self.ids[name]
+		except KeyError :
+			pass
+		with self.lock : # several parser threads may share a symbol table
+			symbol_id = self.ids.get(name)
+			if symbol_id is None :
+				symbol_id = len(self.names)
+				self.names.append(name)
+				self.ids[name] = symbol_id
+		return symbol_id
+
+	def lookup(self, symbol_id) :
+		return self.names[symbol_id]
+
+	def names_since(self, start) :
+		return self.names[start:]
+
+	def __len__(self) :
+		return len(self.names)
+
+	def __init__(self) :
+		self.names = [None] # symbol id -> name
+		self.ids = {None : no_symbol} # name -> symbol id
+		self.lock = threading.Lock()
+
+# Translates symbol ids of a remote symbol table (typically a client's) into ids of a local symbol table.
+class SymbolMap :
+
+	# register names allocated ids start, start + 1... in the remote table
+	def add_names(self, start, names) :
+		if start > len(self.local_ids) :
+			print("SymbolMap : Warning : missing remote symbols " + str(len(self.local_ids)) + " to " + str(start - 1))
+			self.local_ids.extend([no_symbol] * (start - len(self.local_ids)))
+		del self.local_ids[start:] # names sent again replace the previous ones
+		self.local_ids.extend(self.symbol_table.intern(name) for name in names)
+
+	# returns a list of local symbol ids from a column of remote symbol ids
+	def map_column(self, column) :
+		local_ids = self.local_ids
+		return [local_ids[symbol_id] for symbol_id in column]
+
+	def __init__(self, symbol_table) :
+		self.symbol_table = symbol_table
+		self.local_ids = [no_symbol] # remote symbol id -> local symbol id
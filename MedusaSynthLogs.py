@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+# Medusa synthetic gamelogs generator
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# Writes realistic Eve Online gamelogs, for every rule of MedusaParser and every agent format it supports :
+# the three AgentParser presets and overview-derived formats (see overview_label_orders).
+# Lines are generated along with the rule and pilots they are expected to be parsed into, so that the parser can be checked against them.
+
+# internal dependencies
+from MedusaParser import AgentParser
+
+# system and os
+import sys
+
+# time management
+import datetime
+
+# generation
+import random
+
+# names and modules
+first_names = ["Tnemelc", "Raoul", "Marco", "Ishmael", "Kira", "Vex", "Aria", "Doran", "Lyra", "Jax", "Selene", "Orin", "Nyx", "Talos", "Mira", "Kaelen"]
+last_names = ["Abramovich", "Fontenaille", "Kador", "Sarum", "Tash-Murkon", "Ardishapur", "Vherokior", "Sebiestor", "Brutor", "Achura", "Khanid", "Intaki", "Gallente", "Deteis"]
+corp_tickers = ["BAG8", "2MHS", "EVIL", "BADC", "XENA", "-A-", "GOON", "SNGF", "TEST", "BRAVE"]
+alliance_tickers = ["XENA", "EVIL", "CONDI", "PL", "NC", "FRT", "INIT"]
+ship_types = ["Ishkur", "Rifter", "Armageddon", "Dominix", "Bhaalgorn", "Curse", "Scimitar", "Guardian", "Basilisk", "Caracal Navy Issue", "Vedmak", "Loki", "Sabre", "Megathron Navy Issue"]
+ship_names = ["Baguette Launcher", "Pew Pew", "Shiny Thing", "Not A Bait", "Ship-1"]
+hit_types = ["Hits", "Penetrates", "Smashes", "Wrecks", "Glances Off", "Grazes", "Barely Scratches"]
+weapons = {
+	"weapon" : ["Garde II", "200mm AutoCannon II", "Small Focused Pulse Laser II", "425mm AutoCannon II", "Heavy Missile Launcher II", "Light Electron Blaster II", "Mega Pulse Laser II"],
+	"neut" : ["Heavy Energy Neutralizer II", "Standup Heavy Energy Neutralizer II", "Corpus X-Type Heavy Energy Neutralizer"],
+	"nos" : ["Corpus X-Type Heavy Energy Nosferatu", "Heavy Energy Nosferatu II"],
+	"remote_shield" : ["Large Remote Shield Booster II", "Medium Remote Shield Booster II"],
+	"remote_armor" : ["Large Remote Armor Repairer II", "A-Type Medium Remote Armor Repairer"],
+	"remote_hull" : ["Large Remote Hull Repairer II"],
+	"remote_capacitor" : ["Large Remote Capacitor Transmitter II"],
+}
+command_bursts = ["", "Shield Command Burst II", "Armor Command Burst II", "Skirmish Command Burst II"]
+
+# rule name -> (entry type, line template, weapon kind, amount range)
+# {src} and {target} are formatted agents, or "you" when the listener is the other end
+rule_templates = {
+	"weapon_cycle_out" : ("combat", "<color=0xff00ffff><b>{amount}</b> <color=0x77ffffff><font size=10>to</font> <b><color=0xffffffff>{target}</b><font size=10><color=0x77ffffff> - {weapon}{hit}", "weapon", (10, 3000)),
+	"weapon_cycle_in" : ("combat", "<color=0xffcc0000><b>{amount}</b> <color=0x77ffffff><font size=10>from</font> <b><color=0xffffffff>{src}</b><font size=10><color=0x77ffffff> - {weapon}{hit}", "weapon", (10, 3000)),
+	"neut_out" : ("combat", "<color=0xff7fffff><b>{amount} GJ</b><color=0x77ffffff><font size=10> energy neutralized </font><b><color=0xffffffff>{target}</b><color=0x77ffffff><font size=10> - {weapon}</font>", "neut", (50, 2000)),
+	"neut_in" : ("combat", "<color=0xffe57f7f><b>{amount} GJ</b><color=0x77ffffff><font size=10> energy neutralized </font><b><color=0xffffffff>{src}</b><color=0x77ffffff><font size=10> - {weapon}</font>", "neut", (50, 2000)),
+	"nos_out" : ("combat", "<color=0xff7fffff><b>+{amount} GJ</b><color=0x77ffffff><font size=10> energy drained from </font><b><color=0xffffffff>{target}</b><color=0x77ffffff><font size=10> - {weapon}</font>", "nos", (5, 200)),
+	"nos_in" : ("combat", "<color=0xffe57f7f><b>-{amount} GJ</b><color=0x77ffffff><font size=10> energy drained to </font><b><color=0xffffffff>{src}</b><color=0x77ffffff><font size=10> - {weapon}</font>", "nos", (5, 200)),
+	"scramble_attempt" : ("combat", "<color=0xffffffff><b>Warp scramble attempt</b> <color=0x77ffffff><font size=10>from</font> <color=0xffffffff><b>{src}</b> <color=0x77ffffff><font size=10>to <b><color=0xffffffff>{target}</b>", None, None),
+	"disruption_attempt" : ("combat", "<color=0xffffffff><b>Warp disruption attempt</b> <color=0x77ffffff><font size=10>from</font> <color=0xffffffff><b>{src}</b> <color=0x77ffffff><font size=10>to <b><color=0xffffffff>{target}</b>", None, None),
+	"remote_shield_out" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote shield boosted to </font><b><color=0xffffffff>{target}</b><color=0x77ffffff><font size=10> - {weapon}</font>", "remote_shield", (100, 800)),
+	"remote_shield_in" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote shield boosted by </font><b><color=0xffffffff>{src}</b><color=0x77ffffff><font size=10> - {weapon}</font>", "remote_shield", (100, 800)),
+	"remote_armor_out" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote armor repaired to </font><b><color=0xffffffff>{target}</b><color=0x77ffffff><font size=10> <color=0x77ffffff><font size=10> - {weapon}</font></font>", "remote_armor", (100, 800)),
+	"remote_armor_in" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote armor repaired by </font><b><color=0xffffffff>{src}</b><color=0x77ffffff><font size=10> <color=0x77ffffff><font size=10> - {weapon}</font></font>", "remote_armor", (100, 800)),
+	"remote_hull_out" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote hull repaired to </font><b><color=0xffffffff>{target}</b><color=0x77ffffff><font size=10> <color=0x77ffffff><font size=10> - {weapon}</font></font>", "remote_hull", (50, 300)),
+	"remote_hull_in" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote hull repaired by </font><b><color=0xffffffff>{src}</b><color=0x77ffffff><font size=10> <color=0x77ffffff><font size=10> - {weapon}</font></font>", "remote_hull", (50, 300)),
+	"remote_capacitor_out" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote capacitor transmitted to </font><b><color=0xffffffff>{target}</b><color=0x77ffffff><font size=10> <color=0x77ffffff><font size=10> - {weapon}</font></font>", "remote_capacitor", (100, 500)),
+	"remote_capacitor_in" : ("combat", "<color=0xffccff66><b>{amount}</b><color=0x77ffffff><font size=10> remote capacitor transmitted by </font><b><color=0xffffffff>{src}</b><color=0x77ffffff><font size=10> <color=0x77ffffff><font size=10> - {weapon}</font></font>", "remote_capacitor", (100, 500)),
+	"command_burst" : ("notify", "<b>{burst}</b> has applied bonuses to <b>{amount}</b> fleet members.", None, (1, 255)),
+}
+
+# lines no rule but "message" is interested in
+noise_templates = [
+	("combat", "Your group of {weapon} misses {pilot} completely - {weapon}"),
+	("combat", "{pilot} misses you completely - {weapon}"),
+	("notify", "Your cloak deactivates due to a pulse from a Mobile Observatory."),
+	("notify", "The following items were added to your cargo : <b>Nanite Repair Paste</b>"),
+	("hint", "Attempting to join a channel"),
+	("question", "Are you sure you want to jump to <b>1DQ1-A</b> ?"),
+	("None", "Jumping from <b>J5A-IX</b> to <b>1DQ1-A</b>"),
+]
+
+# rule weights of the generated line mix, by pilot profile ("noise" stands for lines matched by the "other" rule only)
+profiles = {
+	"dps" : {"weapon_cycle_out" : 40, "weapon_cycle_in" : 15, "neut_in" : 3, "nos_in" : 1, "scramble_attempt" : 2, "disruption_attempt" : 2, "remote_shield_in" : 3, "remote_armor_in" : 4, "remote_capacitor_in" : 1, "command_burst" : 1, "noise" : 10},
+	"logi" : {"remote_shield_out" : 15, "remote_armor_out" : 30, "remote_hull_out" : 3, "remote_capacitor_out" : 10, "remote_armor_in" : 5, "remote_capacitor_in" : 5, "weapon_cycle_in" : 10, "neut_in" : 5, "command_burst" : 1, "noise" : 10},
+	"mixed" : dict([(rule_name, 5) for rule_name in rule_templates.keys()] + [("noise", 10)]),
+}
+
+# overview label elements (see AgentParser.get_LabelOrder_from_overview)
+def label_element(element_type, pre = "", post = "", bold = False, italic = False, underline = False, color = None, fontsize = None, state = 1) :
+	return {"type" : element_type, "pre" : pre, "post" : post, "bold" : bold, "italic" : italic, "underline" : underline, "color" : color, "fontsize" : fontsize, "state" : state}
+
+# a few overview ship label setups, from plain text to heavily styled ones
+overview_label_orders = {
+	"overview_plain" : [
+		label_element("corporation", "[", "] "),
+		label_element("pilot name"),
+		label_element("alliance", " <", ">"),
+		label_element("ship type", " (", ")"),
+	],
+	"overview_styled" : [
+		label_element("pilot name", bold = True, color = [1.0, 1.0, 1.0, 1.0]),
+		label_element("corporation", " [", "]", fontsize = 8),
+		label_element("alliance", " <", ">", italic = True, fontsize = 8, color = [0.5, 0.5, 1.0, 1.0]),
+		label_element(None, " - "),
+		label_element("ship type", underline = True),
+	],
+	"overview_linebreak" : [
+		label_element("ship type", "", "", bold = True),
+		label_element("linebrak"),
+		label_element("corporation", "[", "]", color = [1.0, 0.5, 0.0, 1.0]),
+		label_element("pilot name", " "),
+	],
+}
+
+agent_formats = ["preset1", "preset2", "preset3"] + list(overview_label_orders.keys())
+
+# returns the agent regexp of agent_format, as expected by AgentParser
+def agent_format_re(agent_format) :
+	if agent_format in overview_label_orders : return AgentParser.labelOrder_to_agent_re(overview_label_orders[agent_format])
+	return getattr(AgentParser, agent_format)
+
+def escape_text(text) :
+	return text.replace("<", "&lt;").replace(">", "&gt;")
+
+def format_label_element(element, value) :
+	if element["type"] == "linebrak" : return " "
+	if element["type"] is None : return escape_text(element["pre"])
+	if not value : return "" # no corporation or alliance, the element is not displayed
+	r = ""
+	if element["fontsize"] : r += "<font size=" + str(element["fontsize"]) + ">"
+	if element["color"] : r += "<color=0x" + "".join("{:02x}".format(int(c * 255)) for c in element["color"][3:] + element["color"][:3]) + ">"
+	r += escape_text(element["pre"])
+	if element["bold"] : r += "<b>"
+	if element["italic"] : r += "<i>"
+	if element["underline"] : r += "<u>"
+	r += value
+	if element["underline"] : r += "</u>"
+	if element["italic"] : r += "</i>"
+	if element["bold"] : r += "</b>"
+	r += escape_text(element["post"])
+	if element["color"] : r += "</color>"
+	if element["fontsize"] : r += "</font>"
+	return r
+
+# formats agent as displayed in gamelogs for agent_format
+def format_agent(agent, agent_format) :
+	if agent_format == "preset1" :
+		r = agent["ship type"] + " "
+		if agent["alliance"] : r += "&lt;" + agent["alliance"] + "&gt;"
+		return r + "[" + agent["corporation"] + "] " + agent["pilot name"] + " "
+	if agent_format == "preset2" :
+		r = agent["pilot name"] + " [" + agent["corporation"]
+		if agent["alliance"] : r += "," + agent["alliance"]
+		return r + "]"
+	if agent_format == "preset3" :
+		r = " [" + agent["corporation"] + "]" + agent["pilot name"]
+		if agent["alliance"] : r += "&lt;" + agent["alliance"] + "&gt;"
+		return r
+	return "".join(format_label_element(element, agent.get(element["type"])) for element in overview_label_orders[agent_format])
+
+# damage lines do not depend on the overview
+def format_damage_agent(agent) :
+	return agent["pilot name"] + "[" + agent["corporation"] + "](" + agent["ship type"] + ")"
+
+# Generates gamelog lines for a single listener, in a fight involving fight_size pilots (listener included)
+class SynthLogsGenerator :
+
+	def make_agent(self, pilot_name) :
+		return {
+			"pilot name" : pilot_name,
+			"corporation" : self.rng.choice(corp_tickers),
+			"alliance" : self.rng.choice(alliance_tickers) if self.rng.random() < 0.7 else None,
+			"ship type" : self.rng.choice(ship_types),
+			"ship name" : self.rng.choice(ship_names),
+		}
+
+	def make_pilot_names(self, count) :
+		names = set([self.listener])
+		while len(names) < count + 1 :
+			names.add(self.rng.choice(first_names) + " " + self.rng.choice(last_names) + ("" if self.rng.random() < 0.8 else " " + str(self.rng.randint(1, 99))))
+		names.discard(self.listener)
+		return sorted(names)
+
+	def format_time(self, t) :
+		return "[ {:04}.{:02}.{:02} {:02}:{:02}:{:02} ]".format(t.year, t.month, t.day, t.hour, t.minute, t.second)
+
+	# returns (log line, rule name, src pilot, target pilot), pilots being None when not relevant
+	def make_line(self, t) :
+		rule_name = self.rng.choices(self.rule_names, self.rule_weights)[0]
+		other = self.rng.choice(self.agents)
+		if rule_name == "noise" :
+			entry_type, template = self.rng.choice(noise_templates)
+			body = template.format(weapon = self.rng.choice(weapons["weapon"]), pilot = other["pilot name"])
+			return self.format_time(t) + " (" + entry_type + ") " + body, "message", None, None
+		entry_type, template, weapon_kind, amount_range = rule_templates[rule_name]
+		fields = {}
+		if amount_range is not None : fields["amount"] = self.rng.randint(*amount_range)
+		if weapon_kind is not None : fields["weapon"] = self.rng.choice(weapons[weapon_kind])
+		fields["hit"] = " - " + self.rng.choice(hit_types) if self.rng.random() < 0.8 else ""
+		fields["burst"] = self.rng.choice(command_bursts)
+		src = target = None
+		if rule_name.startswith("weapon_cycle") :
+			fields["src"] = fields["target"] = format_damage_agent(other)
+		else :
+			fields["src"] = fields["target"] = format_agent(other, self.agent_format)
+		if rule_name.endswith("_out") : src, target = self.listener, other["pilot name"]
+		elif rule_name.endswith("_in") : src, target = other["pilot name"], self.listener
+		elif rule_name in ["scramble_attempt", "disruption_attempt"] :
+			if self.rng.random() < 0.5 :
+				fields["src"] = "you"
+				src, target = self.listener, other["pilot name"]
+			else :
+				fields["target"] = "</font>you!"
+				src, target = other["pilot name"], self.listener
+		return self.format_time(t) + " (" + entry_type + ") " + template.format(**fields), rule_name, src, target
+
+	# yields (log line, rule name, src pilot, target pilot) for line_count lines, lines_per_second lines each game second
+	def generate(self, line_count) :
+		t = self.start_time
+		for i in range(line_count) :
+			if i > 0 and i % self.lines_per_second == 0 : t += datetime.timedelta(seconds = 1)
+			yield self.make_line(t)
+
+	def header(self) :
+		return ("------------------------------------------------------------\n" +
+			"  Gamelog\n" +
+			"  Listener: " + self.listener + "\n" +
+			"  Session Started: " + self.format_time(self.start_time)[2:-2] + "\n" +
+			"------------------------------------------------------------\n")
+
+	# writes a complete gamelog file, as found in the Gamelogs directory
+	def write_gamelog(self, fname, line_count) :
+		with open(fname, "w", encoding = "utf8") as f :
+			f.write(self.header())
+			for line, rule_name, src, target in self.generate(line_count) :
+				f.write(line + "\n")
+
+	def __init__(self, listener = "Tnemelc Abramovich", agent_format = "preset1", fight_size = 20, profile = "mixed", lines_per_second = 20, start_time = datetime.datetime(2020, 7, 11, 9, 44, 0), seed = 0) :
+		self.rng = random.Random(seed)
+		self.listener = listener
+		self.agent_format = agent_format
+		self.lines_per_second = lines_per_second
+		self.start_time = start_time
+		self.agents = [self.make_agent(name) for name in self.make_pilot_names(max(fight_size - 1, 1))]
+		self.rule_names = list(profiles[profile].keys())
+		self.rule_weights = list(profiles[profile].values())
+
+
+if __name__ == "__main__" :
+
+	output_fname = None
+	line_count = 10000
+	listener = "Tnemelc Abramovich"
+	agent_format = "preset1"
+	fight_size = 20
+	profile = "mixed"
+	lines_per_second = 20
+	seed = 0
+
+	for i in range(len(sys.argv)) :
+		if sys.argv[i] == "-o" or sys.argv[i] == "--output" : output_fname = sys.argv[i+1]
+		if sys.argv[i] == "-n" or sys.argv[i] == "--lines" : line_count = int(sys.argv[i+1])
+		if sys.argv[i] == "-l" or sys.argv[i] == "--listener" : listener = sys.argv[i+1]
+		if sys.argv[i] == "-f" or sys.argv[i] == "--format" : agent_format = sys.argv[i+1]
+		if sys.argv[i] == "-s" or sys.argv[i] == "--fight-size" : fight_size = int(sys.argv[i+1])
+		if sys.argv[i] == "-p" or sys.argv[i] == "--profile" : profile = sys.argv[i+1]
+		if sys.argv[i] == "-r" or sys.argv[i] == "--rate" : lines_per_second = int(sys.argv[i+1])
+		if sys.argv[i] == "--seed" : seed = int(sys.argv[i+1])
+
+	if output_fname is None or not agent_format in agent_formats or not profile in profiles :
+		print("usage : MedusaSynthLogs.py -o <filename> [-n <lines>] [-l <listener>] [-f <format>] [-s <fight size>] [-p <profile>] [-r <lines per second>] [--seed <seed>]")
+		print("  formats : " + ", ".join(agent_formats))
+		print("  profiles : " + ", ".join(profiles.keys()))
+		sys.exit(1)
+
+	generator = SynthLogsGenerator(listener, agent_format, fight_size, profile, lines_per_second, seed = seed)
+	generator.write_gamelog(output_fname, line_count)
+	print("wrote " + str(line_count) + " lines to " + output_fname)
@@ -0,0 +1,205 @@
+# Medusa gamelogs tailer
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# system and os
+import os
+import sys
+import struct
+import select
+import ctypes
+import ctypes.util
+import traceback
+
+# time management
+import time
+
+# concurrency management
+import threading
+
+# inotify constants (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+inotify_event_header = struct.Struct("iIII") # wd, mask, cookie, len, followed by len bytes of name
+
+# Reads the lines appended to a file since last read.
+# New bytes are read in large blocks and decoded in bulk : a line is only returned once complete,
+# the unfinished tail of the file (e.g a line half flushed by the game) is kept for the next read.
+class TailReader :
+	read_block_size = 1 << 20
+
+	# returns the list of complete lines appended since last read, without line terminators
+	def read_lines(self) :
+		if os.fstat(self.fd).st_size < self.position : # truncated or replaced : start over
+			os.lseek(self.fd, 0, os.SEEK_SET)
+			self.position = 0
+			self.pending = b""
+		blocks = [self.pending]
+		while True :
+			block = os.read(self.fd, TailReader.read_block_size)
+			if not block : break
+			self.position += len(block)
+			blocks.append(block)
+		data = b"".join(blocks)
+		end = data.rfind(b"\n") + 1 # utf-8 multibyte sequences never contain "\n" : complete lines are always decodable
+		self.pending = data[end:]
+		if end == 0 : return []
+		text = data[:end].decode("utf-8", errors = "replace")
+		if "\r" in text : text = text.replace("\r\n", "\n")
+		return text[:-1].split("\n")
+
+	def close(self) :
+		os.close(self.fd)
+
+	# offset of the first line not returned yet (see OffsetCheckpoints)
+	def get_line_offset(self) :
+		return self.position - len(self.pending)
+
+	# from_end : only read what is appended from now on
+	# offset : start reading at this offset instead, e.g where a previous reader stopped (see get_line_offset)
+	def __init__(self, fname, from_end = True, offset = None) :
+		self.fname = fname
+		self.fd = os.open(fname, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+		self.inode = os.fstat(self.fd).st_ino
+		if offset is not None : self.position = os.lseek(self.fd, offset, os.SEEK_SET)
+		else : self.position = os.lseek(self.fd, 0, os.SEEK_END) if from_end else 0
+		self.pending = b""
+
+# Watches every active gamelog file from a single thread, calling their on_change() callback whenever they grow.
+# On Linux, files are watched through inotify, and on_change() is called as soon as the file is written.
+# Elsewhere (or when inotify is unavailable, e.g watch limit reached), file sizes and mtimes are polled every poll_interval seconds.
+# Either way, only files that changed are read, and the tailer thread sleeps when nothing happens.
+# Directories can be watched as well, for new files : on_change(name) is called with the name of every file created,
+# or with None when the directory changed in some unknown way (polling, lost events).
+class Tailer :
+	poll_interval = 0.2 # seconds between polls of files that are not watched through inotify
+	idle_timeout = 1. # seconds the tailer thread waits for inotify events, when no file is polled
+
+	class WatchedFile :
+		def __init__(self, fname, on_change, directory = False) :
+			self.fname = fname
+			self.on_change = on_change
+			self.directory = directory
+			self.wd = None # inotify watch descriptor, None if polled
+			self.stat = self.get_stat()
+
+		def get_stat(self) :
+			try :
+				st = os.stat(self.fname)
+				return (st.st_size, st.st_mtime_ns)
+			except OSError :
+				return None
+
+	# returns the inotify file descriptor, or None if inotify is not available on this system
+	def init_inotify(self) :
+		if not sys.platform.startswith("linux") : return None
+		try :
+			self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno = True)
+			fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		except (OSError, AttributeError) :
+			return None
+		if fd < 0 :
+			print("Warning : Tailer : inotify_init1 failed (errno " + str(ctypes.get_errno()) + "), polling files instead")
+			return None
+		return fd
+
+	def watch(self, fname, on_change) :
+		self.add_watch(Tailer.WatchedFile(fname, on_change), IN_MODIFY)
+
+	def watch_directory(self, dirpath, on_change) :
+		self.add_watch(Tailer.WatchedFile(dirpath, on_change, directory = True), IN_CREATE | IN_MOVED_TO)
+
+	def add_watch(self, watched_file, mask) :
+		fname = watched_file.fname
+		with self.lock :
+			self.watched_files[fname] = watched_file
+			if self.inotify_fd is not None :
+				wd = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(fname), mask)
+				if wd >= 0 :
+					watched_file.wd = wd
+					self.watch_descriptors[wd] = watched_file
+				else :
+					print("Warning : Tailer : inotify_add_watch failed for " + fname + " (errno " + str(ctypes.get_errno()) + "), polling it instead")
+		if self.debug : print("Tailer : watching " + fname + (" (inotify)" if watched_file.wd is not None else " (polling)"))
+
+	def unwatch(self, fname) :
+		with self.lock :
+			watched_file = self.watched_files.pop(fname, None)
+			if watched_file is None or watched_file.wd is None : return
+			self.watch_descriptors.pop(watched_file.wd, None)
+			self.libc.inotify_rm_watch(self.inotify_fd, watched_file.wd)
+
+	# returns the watched files reported as modified by pending inotify events, with the names of files created in watched directories
+	# {watched file : list of created file names, or [None] if unknown}
+	def read_inotify_events(self) :
+		changed = {}
+		while True :
+			try :
+				buf = os.read(self.inotify_fd, 65536)
+			except BlockingIOError :
+				break
+			offset = 0
+			while offset < len(buf) :
+				wd, mask, cookie, name_len = inotify_event_header.unpack_from(buf, offset)
+				name = buf[offset + inotify_event_header.size : offset + inotify_event_header.size + name_len].rstrip(b"\0")
+				offset += inotify_event_header.size + name_len
+				if mask & IN_Q_OVERFLOW : # events were lost : check every file
+					with self.lock :
+						for watched_file in self.watched_files.values() : changed.setdefault(watched_file, []).append(None)
+				elif not mask & IN_IGNORED :
+					watched_file = self.watch_descriptors.get(wd)
+					if watched_file is not None : changed.setdefault(watched_file, []).append(os.fsdecode(name) if name else None)
+		return changed
+
+	# returns the polled files whose size or mtime changed since last poll (see read_inotify_events)
+	def poll_files(self) :
+		changed = {}
+		with self.lock : polled = [watched_file for watched_file in self.watched_files.values() if watched_file.wd is None]
+		for watched_file in polled :
+			stat = watched_file.get_stat()
+			if stat != watched_file.stat :
+				watched_file.stat = stat
+				changed[watched_file] = [None]
+		return changed
+
+	def has_polled_files(self) :
+		with self.lock : return any(watched_file.wd is None for watched_file in self.watched_files.values())
+
+	def run(self) :
+		print("thread " + str(threading.get_ident()) + " entering tailer loop (" + ("inotify" if self.inotify_fd is not None else "polling") + ")")
+		while True :
+			changed = {}
+			if self.inotify_fd is not None :
+				ready, w, x = select.select([self.inotify_fd], [], [], Tailer.poll_interval if self.has_polled_files() else Tailer.idle_timeout)
+				if ready : changed.update(self.read_inotify_events())
+			else :
+				time.sleep(Tailer.poll_interval)
+			changed.update(self.poll_files())
+			for watched_file, names in changed.items() :
+				if self.watched_files.get(watched_file.fname) is not watched_file : continue # unwatched meanwhile
+				try :
+					if not watched_file.directory : watched_file.on_change()
+					elif None in names : watched_file.on_change(None)
+					else :
+						for name in names : watched_file.on_change(name)
+				except Exception : # keep tailing the other files, but tell what went wrong
+					print("Warning : Tailer : error while reading " + watched_file.fname + " : " + repr(sys.exc_info()[1]))
+					traceback.print_exc()
+
+	def start(self) :
+		t = threading.Thread(target=self.run, name="tailer")
+		t.daemon = True
+		t.start()
+		return t
+
+	def __init__(self, debug = False) :
+		self.debug = debug
+		self.lock = threading.Lock()
+		self.watched_files = {} # file name -> WatchedFile
+		self.watch_descriptors = {} # inotify watch descriptor -> WatchedFile
+		self.inotify_fd = self.init_inotify()
@@ -0,0 +1,147 @@
+# Medusa wire format
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import block_size
+
+# system and os
+import sys
+
+# data layout
+import array
+import struct
+import itertools
+
+# output and formatting
+import json
+
+# Binary encoding of the log entries collections sent by clients (see MedusaParser.block_columns), as an alternative to JSON.
+# The server lists the versions it can decode in its collector_config event, the client picks the highest one it can encode.
+# Names travel once per connection, through the symbols of the collection (see MedusaSymbolTable) : name columns only hold ids.
+#
+# version 1 :
+#   magic "MDW", version (1 byte), row count (uint32)
+#   then a sequence of fields : field id (1 byte), followed by field data
+#     integer column : item size (1 byte : 1, 2, 4 or 8), then row count signed little endian integers of that size
+#     time column : first time (int64), then the deltas between consecutive times as an integer column
+#     strings (log_str, symbol names) : byte size (uint32), then the utf-8 encoded strings, separated by "\0"
+#     symbols : first symbol id (uint32), symbol names count (uint32), then names as strings
+#     extra : any other item of the collection (e.g parser statistics), as a json encoded string
+#   field 255 ends the collection
+wire_magic = b"MDW"
+wire_versions = [1]
+
+# field ids of version 1 : never reorder, only append
+wire_columns_v1 = ["rule", "time", "src", "target", "amount", "weapon", "hit", "src_ship", "target_ship", "owner", "log_str", "hits", "max"]
+wire_field_symbols = 200
+wire_field_extra = 201
+wire_field_end = 255
+wire_string_columns = ["log_str"]
+
+header_struct = struct.Struct("<3sBI")
+uint32_struct = struct.Struct("<I")
+int64_struct = struct.Struct("<q")
+int_typecodes = {1 : "b", 2 : "h", 4 : "i", 8 : "q"}
+
+class WireFormatError(Exception) :
+	"""Exception : data is not a collection in a known wire format"""
+	pass
+
+# smallest signed integer typecode holding every value
+def get_int_typecode(values) :
+	if len(values) == 0 : return "b"
+	lo, hi = min(values), max(values)
+	for size, typecode in sorted(int_typecodes.items()) :
+		if -(1 << (8 * size - 1)) <= lo and hi < (1 << (8 * size - 1)) : return typecode
+	raise OverflowError("integer column values do not fit in 64 bits")
+
+def encode_ints(values) :
+	a = array.array(get_int_typecode(values), values)
+	if sys.byteorder == "big" : a.byteswap()
+	return bytes([a.itemsize]) + a.tobytes()
+
+# returns (list of integers, offset after them)
+def decode_ints(data, offset, count) :
+	size = data[offset]
+	if not size in int_typecodes : raise WireFormatError("bad integer size " + str(size))
+	end = offset + 1 + size * count
+	a = array.array(int_typecodes[size])
+	a.frombytes(data[offset + 1 : end])
+	if len(a) != count : raise WireFormatError("truncated integer column")
+	if sys.byteorder == "big" : a.byteswap()
+	return a.tolist(), end
+
+def encode_strings(values) :
+	encoded = "\0".join(values).encode("utf-8")
+	return uint32_struct.pack(len(encoded)) + encoded
+
+# returns (list of strings, offset after them)
+def decode_strings(data, offset, count) :
+	size, = uint32_struct.unpack_from(data, offset)
+	offset += uint32_struct.size
+	r = data[offset : offset + size].decode("utf-8").split("\0") if count > 0 else []
+	if len(r) != count : raise WireFormatError("bad strings count")
+	return r, offset + size
+
+def encode_times(values) :
+	if len(values) == 0 : return int64_struct.pack(0) + encode_ints([])
+	return int64_struct.pack(values[0]) + encode_ints([b - a for a, b in zip(values, itertools.islice(values, 1, None))])
+
+def decode_times(data, offset, count) :
+	first, = int64_struct.unpack_from(data, offset)
+	deltas, offset = decode_ints(data, offset + int64_struct.size, max(count - 1, 0))
+	if count == 0 : return [], offset
+	return list(itertools.accumulate(deltas, initial = first)), offset
+
+# returns the binary encoding of a log entries collection : columns, symbols and any other json serializable items
+def encode_collection(col, version = 1) :
+	if not version in wire_versions : raise WireFormatError("unknown wire format version " + str(version))
+	n = block_size(col)
+	parts = [header_struct.pack(wire_magic, version, n)]
+	extra = {}
+	for k, v in col.items() :
+		if k in wire_columns_v1 :
+			if len(v) != n : raise WireFormatError("column " + k + " has " + str(len(v)) + " rows instead of " + str(n))
+			parts.append(bytes([wire_columns_v1.index(k)]))
+			if k == "time" : parts.append(encode_times(v))
+			elif k in wire_string_columns : parts.append(encode_strings(v))
+			else : parts.append(encode_ints(v))
+		elif k == "symbols" :
+			start, names = v
+			parts.append(bytes([wire_field_symbols]) + uint32_struct.pack(start) + uint32_struct.pack(len(names)) + encode_strings(names))
+		else :
+			extra[k] = v
+	if extra : parts.append(bytes([wire_field_extra]) + encode_strings([json.dumps(extra)]))
+	parts.append(bytes([wire_field_end]))
+	return b"".join(parts)
+
+# returns the log entries collection encoded in data, as sent by the client (columns as lists)
+def decode_collection(data) :
+	try :
+		magic, version, n = header_struct.unpack_from(data, 0)
+		if magic != wire_magic : raise WireFormatError("bad magic")
+		if not version in wire_versions : raise WireFormatError("unknown wire format version " + str(version))
+		offset = header_struct.size
+		col = {}
+		while True :
+			field = data[offset]
+			offset += 1
+			if field == wire_field_end : break
+			if field == wire_field_symbols :
+				start, count = struct.unpack_from("<II", data, offset)
+				names, offset = decode_strings(data, offset + 8, count)
+				col["symbols"] = [start, names]
+			elif field == wire_field_extra :
+				extra, offset = decode_strings(data, offset, 1)
+				col.update(json.loads(extra[0]))
+			elif field < len(wire_columns_v1) :
+				c = wire_columns_v1[field]
+				if c == "time" : col[c], offset = decode_times(data, offset, n)
+				elif c in wire_string_columns : col[c], offset = decode_strings(data, offset, n)
+				else : col[c], offset = decode_ints(data, offset, n)
+			else :
+				raise WireFormatError("unknown field " + str(field))
+	except (IndexError, struct.error, UnicodeDecodeError, ValueError) as e :
+		raise WireFormatError("truncated or corrupted collection : " + str(e))
+	return col
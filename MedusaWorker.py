@@ -3,12 +3,15 @@
 # Author : Tnemelc Abramovich																								 
 
 # internal dependencies
-from MedusaGameTime import GameTime
+from MedusaGameTime import GameTime, epoch_to_datetime
 from MedusaStatusInfo import make_status_info
+from MedusaAggregator import WindowAggregator, FightAggregator
+from MedusaEventStore import EventStore
 import MedusaParser
 
 # system and os
 import sys
+import traceback
 
 # time management
 import datetime
@@ -56,21 +59,15 @@ class MedusaWorker :
 				"error : could not open file " + self.replay_output_fname + " : " + sys.exc_info()[0] + ", disabling replay logs"
 				self.replay_output_fname = None
 
-		if self.replay_output is not None :
-			for e in col.values() :
-				for ee in e.values() :
-					for eee in ee :
-						print("[" + eee["session_owner"] + "]" + eee["log_str"], file=self.replay_output)
+		if self.replay_output is not None and "log_str" in col :
+			for owner, log_str in zip(col["owner"], col["log_str"]) :
+				if not log_str : continue # parsed before the server asked for raw log lines
+				print("[" + self.symbol_table.lookup(owner) + "]" + log_str.rstrip("\n"), file=self.replay_output)
 
    	# returns the least evetime apprearing in logs entries contained in the provided log collections
 	# useful for knowing roughly what is the actual time in eve, to the second-ish, based only on the logs recieved
 	def get_least_evetime(self, col) :
-		return max(list(map(lambda x : 
-			max(list(map( lambda xx : 
-				max(list(map( lambda xxx : GameTime.parse(xxx["time_str"], False)
-				, xx)))
-			, x.values())))
-		, col.values())))
+		return epoch_to_datetime(max(col["time"]))
 	
 
 	# pop every log collection recieved by the local reciever thread, merge them into main collection
@@ -83,11 +80,23 @@ class MedusaWorker :
 				if datetime.datetime.now() > timeout_datetime : break
 				time.sleep(0.2) # all work is done for now, we sure have time for a nap
 				continue
-			GameTime.update_ref(self.get_least_evetime(col))
-			self.dump_replay_logs(col)
-			MedusaParser.recursive_merge(col, self.main_collection)
+			try :
+				self.merge_collection(col)
+			except Exception : # collections are checked by the collector : keep merging the next ones anyway
+				print("Warning : MedusaWorker : could not merge collection : " + repr(sys.exc_info()[1]))
+				traceback.print_exc()
 			if datetime.datetime.now() > timeout_datetime : break
 
+	def merge_collection(self, col) :
+		if MedusaParser.block_size(col) == 0 : return
+		GameTime.update_ref(self.get_least_evetime(col))
+		self.dump_replay_logs(col)
+		col.pop("log_str", None) # raw log lines are not retained once dumped
+		if not "hits" in col : MedusaParser.add_aggregate_columns(col) # single entries and client aggregates are merged alike
+		col = self.main_collection.add_block(col) # late entries are dropped
+		if self.aggregator is not None : self.aggregator.add_block(col)
+		self.fight.add_block(col)
+
 
 
 	# main worker loop, orchestrate the job of merging collected client logs, building status information and broadcasting it.
@@ -96,14 +105,23 @@ class MedusaWorker :
 		# empty recieve queue and populate main collection
 		self.merge_recv_loop(datetime.datetime.now() + self.dt_status_refresh_period)
 
-		# filter out events that are older than persistance
-		persistance_limit = GameTime.now() - self.dt_persistance
-		for k in self.main_collection.keys() :
-			for kk in self.main_collection[k].keys() :
-				self.main_collection[k][kk] = list(filter(lambda x : MedusaParser.time_str_to_datetime(x["time_str"]) > persistance_limit, self.main_collection[k][kk]))
-
-		# make status info from the remaining info
-		status_info = make_status_info(self.main_collection, self.dps_window, GameTime.now())
+		# forget events that are older than persistance, or than the largest status window
+		now = GameTime.now_epoch()
+		persistance = int(self.dt_persistance.total_seconds())
+		self.main_collection.expire(now - max([persistance] + self.status_windows) + 1)
+
+		if self.aggregator is not None :
+			# status info from the aggregates of the last persistance seconds, and of each status window, updated as log entries were merged
+			status_info = self.aggregator.get_status_info(GameTime.now(), now)
+		else :
+			# make status info from the remaining info
+			status_info = make_status_info(self.main_collection.get_last(persistance, now), self.dps_window, GameTime.now(), self.symbol_table)
+			if self.status_windows :
+				status_info["windows"] = {}
+				for window in self.status_windows :
+					window_info = make_status_info(self.main_collection.get_last(window, now), window, GameTime.now(), self.symbol_table)
+					status_info["windows"][str(window)] = {"characters" : window_info["characters"], "total" : window_info["total"]}
+		status_info["fight"] = self.fight.get_status()
 
 		# broadcast new status info
 		self.send_status_info(status_info)
@@ -120,17 +138,25 @@ class MedusaWorker :
 			if end - start > 2*self.dt_status_refresh_period : 
 				print("Warning : seems like we are slower than target refresh rate here : main_upkeep took " + str((end - start).total_seconds()) + " seconds")
 
-	def __init__(self, shared_recv_queue, redis_host, redis_port, persistance = 15, dps_window = 15, replay_output_fname = None, status_refresh_period = 1, debug = False) :
+	# incremental_status : maintain status information as log entries are merged (see WindowAggregator), instead of building it from every retained log entry
+	# status_windows : seconds of the extra windows reported in status_info along the main one, fight_idle : seconds without log entries ending a fight (see FightAggregator)
+	def __init__(self, shared_recv_queue, symbol_table, redis_host, redis_port, persistance = 15, dps_window = 15, replay_output_fname = None, status_refresh_period = 1, incremental_status = True, status_windows = (5, 15, 60), fight_idle = 120, debug = False) :
 		self.shared_recv_queue = shared_recv_queue
+		self.symbol_table = symbol_table # names of the symbol ids found in collections
 		self.redis_host = redis_host
 		self.redis_port = redis_port
 		self.dt_persistance = datetime.timedelta(seconds = persistance)
 		self.dps_window = dps_window
 		self.replay_output_fname = replay_output_fname
 		self.dt_status_refresh_period = datetime.timedelta(seconds = status_refresh_period)
+		self.status_windows = list(status_windows)
 		self.debug = debug
 
-		self.main_collection = {}
+		# log entries of the last persistance seconds (or of the largest status window), by game time : entries up to persistance seconds late are accepted
+		# status info maintained as log entries are merged only needs late entries to be filtered out : entries are only retained to rebuild it
+		self.main_collection = EventStore(MedusaParser.block_columns_no_log_str + MedusaParser.block_aggregate_columns, persistance, retain = not incremental_status)
+		self.aggregator = WindowAggregator(persistance, dps_window, symbol_table, self.status_windows) if incremental_status else None
+		self.fight = FightAggregator(fight_idle, symbol_table) # totals of the whole current fight
 		self.replay_output = None
 		self.recv_queue = queue.Queue()
 
@@ -0,0 +1,10 @@
+# Medusa tests configuration
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# system and os
+import os
+import sys
+
+# Medusa modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,58 @@
+# Medusa aggregator tests
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaParser import MedusaParser, AgentParser, new_block, block_columns_no_log_str, recursive_merge, select_block_rows, add_aggregate_columns, aggregate_block
+from MedusaSymbolTable import SymbolTable
+from MedusaStatusInfo import make_status_info
+from MedusaAggregator import WindowAggregator
+from MedusaSynthLogs import SynthLogsGenerator, agent_format_re
+from MedusaGameTime import epoch_to_datetime
+
+# system and os
+import io
+import contextlib
+
+# testing
+import pytest
+
+# synthetic fight of a few characters, as a single block of single entries
+@pytest.fixture(scope = "module")
+def fight() :
+	symbol_table = SymbolTable()
+	block = new_block(block_columns_no_log_str)
+	for i, profile in enumerate(["dps", "logi", "mixed", "mixed"]) :
+		generator = SynthLogsGenerator(listener = "Pilot " + str(i), agent_format = "preset1", profile = profile, fight_size = 30, lines_per_second = 40, seed = i)
+		with contextlib.redirect_stdout(io.StringIO()) :
+			parser = MedusaParser(generator.listener, AgentParser(agent_re = agent_format_re("preset1")), symbol_table = symbol_table)
+			recursive_merge(parser.parse_many([line for line, *rest in generator.generate(4000)], keep_log_str = False), block)
+	return add_aggregate_columns(block), symbol_table
+
+# characters and totals with floats rounded. Ship types are the latest known ones for the aggregator, whatever the window : left out
+def rounded(characters, totals) :
+	def round_metrics(metrics) : return {k : round(v, 6) if isinstance(v, float) else v for k, v in metrics.items() if k != "ship_type"}
+	return {name : round_metrics(metrics) for name, metrics in characters.items()}, round_metrics(totals)
+
+# log entries are added second by second : the status of every window matches make_status_info over the log entries of that window
+@pytest.mark.parametrize("aggregated", [False, True])
+def test_windows_match_make_status_info(fight, aggregated) :
+	block, symbol_table = fight
+	times = block["time"]
+	start, end = min(times), max(times)
+	aggregator = WindowAggregator(15, 15, symbol_table, [5, 15, 60])
+	checks = 0
+	for now in range(start, end + 1) :
+		second = select_block_rows(block, [i for i, t in enumerate(times) if t == now])
+		aggregator.add_block(aggregate_block(second) if aggregated else second)
+		if (now - start) % 7 != 6 : continue
+		status_info = aggregator.get_status_info(epoch_to_datetime(now), now)
+		expected = make_status_info(select_block_rows(block, [i for i, t in enumerate(times) if now - 15 < t <= now]), 15, epoch_to_datetime(now), symbol_table)
+		assert status_info["date"] == expected["date"]
+		assert rounded(status_info["characters"], status_info["total"]) == rounded(expected["characters"], expected["total"])
+		for window in [5, 15, 60] :
+			expected = make_status_info(select_block_rows(block, [i for i, t in enumerate(times) if now - window < t <= now]), window, epoch_to_datetime(now), symbol_table)
+			window_info = status_info["windows"][str(window)]
+			assert rounded(window_info["characters"], window_info["total"]) == rounded(expected["characters"], expected["total"])
+		checks += 1
+	assert checks > 5
@@ -0,0 +1,78 @@
+# Medusa send queue tests
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaSendQueue import SendQueue, rule_categories
+from MedusaParser import new_block, block_columns_no_log_str, block_size, rule_table, rule_ids
+
+# a block of n entries of rule_name, timed from t
+def make_block(rule_name, n, t = 0) :
+	block = new_block(block_columns_no_log_str, typed = True, symbols = True)
+	for i in range(n) :
+		for c in block_columns_no_log_str : block[c].append(0)
+		block["rule"][-1] = rule_ids[rule_name]
+		block["time"][-1] = t + i
+	return block
+
+# a rule of category
+def category_rule(category) :
+	return [rule_name for rule_category, rule_name, amount_field in rule_table if rule_category == category][0]
+
+def queued_categories(queue) :
+	r = {}
+	for entry in queue.blocks :
+		for rule in entry[1]["rule"] : r[rule_categories[rule]] = r.get(rule_categories[rule], 0) + 1
+	return r
+
+def test_drop_order() :
+	queue = SendQueue(max_rows = 100, flush_rows = 10 ** 9, max_latency = 10, drop_categories = ["other", "neut", "remote_assist"])
+	for category in ["remote_assist", "neut", "other", "dps"] : queue.put(make_block(category_rule(category), 40))
+	# 160 entries : the 40 "other" ones go first, then the 20 oldest "neut" ones
+	assert len(queue) == 100
+	assert queue.get_stats()["dropped"] == {"other" : 40, "neut" : 20}
+	assert queued_categories(queue) == {"remote_assist" : 40, "neut" : 20, "dps" : 40}
+	# damage is never dropped : the queue grows beyond max_rows instead
+	queue.put(make_block(category_rule("dps"), 200))
+	assert queue.get_stats()["dropped"] == {"other" : 40, "neut" : 40, "remote_assist" : 40}
+	assert queued_categories(queue) == {"dps" : 240}
+	assert len(queue) == 240
+
+def test_drop_oldest_first() :
+	queue = SendQueue(max_rows = 50, flush_rows = 10 ** 9, max_latency = 10, drop_categories = ["neut"])
+	queue.put(make_block(category_rule("neut"), 40, 0))
+	queue.put(make_block(category_rule("neut"), 40, 100))
+	assert sorted(t for entry in queue.blocks for t in entry[1]["time"]) == list(range(30, 40)) + list(range(100, 140))
+
+def test_on_sent_taken_blocks_only() :
+	sent = []
+	queue = SendQueue(max_latency = 0, batch_rows = 100)
+	queue.put(make_block("weapon_cycle_out", 60), lambda : sent.append("a"))
+	queue.put(make_block("weapon_cycle_out", 0), lambda : sent.append("empty")) # nothing to send : waits for "a"
+	queue.put(make_block("weapon_cycle_out", 60), lambda : sent.append("b"))
+	blocks, stats = queue.get_blocks()
+	assert sum(block_size(block) for block in blocks) == 100 and stats["depth"] == 120
+	assert sent == [] # not sent yet
+	queue.task_done()
+	assert sent == ["a", "empty"] # "b" was only taken in part
+	blocks, stats = queue.get_blocks()
+	queue.task_done(sent = False) # not sent : queued again, callbacks kept
+	assert sent == ["a", "empty"] and len(queue) == 20
+	blocks, stats = queue.get_blocks()
+	assert sum(block_size(block) for block in blocks) == 20
+	queue.task_done()
+	assert sent == ["a", "empty", "b"]
+	queue.put(make_block("weapon_cycle_out", 0), lambda : sent.append("idle")) # nothing queued nor in flight : right away
+	assert sent == ["a", "empty", "b", "idle"]
+	assert queue.join(0)
+
+def test_on_sent_dropped_blocks() :
+	sent = []
+	queue = SendQueue(max_rows = 50, flush_rows = 10 ** 9, max_latency = 10, drop_categories = ["neut"])
+	queue.put(make_block("weapon_cycle_out", 50), lambda : sent.append("dps"))
+	queue.put(make_block(category_rule("neut"), 5), lambda : sent.append("neut")) # dropped whole : waits for "dps"
+	assert len(queue) == 50 and len(queue.blocks) == 1 and sent == []
+	queue.max_latency = 0
+	queue.get_blocks()
+	queue.task_done()
+	assert sent == ["dps", "neut"]
@@ -0,0 +1,74 @@
+# Medusa status info tests
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+import MedusaStatusInfo
+from MedusaParser import MedusaParser, AgentParser, new_block, block_columns_no_log_str, recursive_merge, aggregate_block, block_to_arrays, block_size, rule_ids
+from MedusaSymbolTable import SymbolTable
+from MedusaSynthLogs import SynthLogsGenerator, agent_format_re
+
+# system and os
+import io
+import contextlib
+
+# time management
+import datetime
+
+# testing
+import pytest
+
+gametime = datetime.datetime(2020, 7, 9, 11, 35, 20)
+
+# a few log entries of a session owner shooting at an enemy, shot back, scrambled, and repairing a friend
+def test_make_status_info() :
+	symbol_table = SymbolTable()
+	me, enemy, buddy, blaster, rifter = [symbol_table.intern(name) for name in ["Me", "Enemy", "Buddy", "Light Electron Blaster II", "Rifter"]]
+	block = new_block(block_columns_no_log_str)
+	def add_row(rule_name, t, src, target, amount, src_ship = 0, target_ship = 0) :
+		for c, value in zip(block_columns_no_log_str, [rule_ids[rule_name], t, src, target, amount, blaster, 0, src_ship, target_ship, me]) : block[c].append(value)
+	add_row("weapon_cycle_out", 100, me, enemy, 300, target_ship = rifter)
+	add_row("weapon_cycle_out", 101, me, enemy, 150)
+	add_row("weapon_cycle_in", 101, enemy, me, 90, src_ship = rifter)
+	add_row("remote_armor_out", 102, me, buddy, 200)
+	add_row("scramble_attempt", 102, enemy, me, 0)
+	status_info = MedusaStatusInfo.make_status_info(block, 15, gametime, symbol_table)
+	assert status_info["date"] == "2020-07-09T11:35:20"
+	assert status_info["characters"] == {
+		"Me" : {"dps_out" : 30., "alpha_out" : 300, "dps_in" : 6., "alpha_in" : 90, "hps_out" : 200 / 15, "scrambled" : True},
+		"Enemy" : {"dps_in" : 30., "alpha_in" : 300, "dps_out" : 6., "alpha_out" : 90, "scrambling" : True, "ship_type" : "Rifter"},
+		"Buddy" : {"hps_in" : 200 / 15},
+	}
+	assert status_info["total"] == {"dps_in" : 6., "dps_out" : 30., "neut_in" : 0., "neut_out" : 0., "nos_in" : 0., "nos_out" : 0.,
+	                                "reps_in" : 0., "reps_out" : 200 / 15, "cap_transfer_in" : 0., "cap_transfer_out" : 0.}
+
+# synthetic fight of a few characters of every profile, parsed into a single block
+@pytest.fixture(scope = "module")
+def fight() :
+	symbol_table = SymbolTable()
+	block = new_block(block_columns_no_log_str, typed = True, symbols = True)
+	for i, profile in enumerate(["dps", "logi", "mixed", "mixed", "dps", "logi"]) :
+		generator = SynthLogsGenerator(listener = "Pilot " + str(i), agent_format = "preset1", profile = profile, fight_size = 50, seed = i)
+		with contextlib.redirect_stdout(io.StringIO()) :
+			parser = MedusaParser(generator.listener, AgentParser(agent_re = agent_format_re("preset1")), symbol_table = symbol_table)
+			recursive_merge(parser.parse_many([line for line, *rest in generator.generate(2000)], keep_log_str = False), block)
+	return block, symbol_table
+
+# status info with floats rounded, the vectorized path summing in another order
+def rounded(status_info) :
+	def round_metrics(metrics) : return {k : round(v, 6) if isinstance(v, float) else v for k, v in metrics.items()}
+	return {"date" : status_info["date"], "total" : round_metrics(status_info["total"]),
+	        "characters" : {name : round_metrics(metrics) for name, metrics in status_info["characters"].items()}}
+
+@pytest.mark.parametrize("aggregated", [False, True])
+def test_vectorized_matches_make_status_info(fight, monkeypatch, aggregated) :
+	pytest.importorskip("numpy")
+	block, symbol_table = fight
+	if aggregated : block = aggregate_block(block)
+	block = block_to_arrays(block, symbols = True)
+	assert block_size(block) > 0
+	vectorized = MedusaStatusInfo.make_status_info_vectorized(block, 15, gametime, symbol_table)
+	monkeypatch.setattr(MedusaStatusInfo, "numpy", None)
+	expected = MedusaStatusInfo.make_status_info(block, 15, gametime, symbol_table)
+	assert len(expected["characters"]) > 0
+	assert rounded(vectorized) == rounded(expected)
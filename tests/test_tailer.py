@@ -0,0 +1,48 @@
+# Medusa gamelogs tailer tests
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaTailer import TailReader
+
+def append(path, data) :
+	with open(path, "ab") as f : f.write(data)
+
+def test_partial_line_kept(tmp_path) :
+	path = tmp_path / "gamelog.txt"
+	append(path, b"header\n")
+	reader = TailReader(str(path), from_end = False)
+	assert reader.read_lines() == ["header"]
+	append(path, b"[ 2024.01.01 10:00:00 ] (combat) first\n[ 2024.01.01 10:00:01 ] (com")
+	assert reader.read_lines() == ["[ 2024.01.01 10:00:00 ] (combat) first"]
+	assert reader.get_line_offset() == len(b"header\n[ 2024.01.01 10:00:00 ] (combat) first\n") # the partial line is not consumed yet
+	assert reader.read_lines() == [] # still no newline
+	append(path, b"bat) sec")
+	assert reader.read_lines() == []
+	append(path, b"ond\r\nthird\n")
+	assert reader.read_lines() == ["[ 2024.01.01 10:00:01 ] (combat) second", "third"]
+	assert reader.get_line_offset() == path.stat().st_size
+	reader.close()
+
+def test_partial_multibyte_character(tmp_path) :
+	path = tmp_path / "gamelog.txt"
+	path.write_bytes(b"")
+	reader = TailReader(str(path))
+	line = "Kérosène Ω".encode("utf-8")
+	append(path, line[:2]) # cut in the middle of "é"
+	assert reader.read_lines() == []
+	append(path, line[2:] + b"\n")
+	assert reader.read_lines() == ["Kérosène Ω"]
+	reader.close()
+
+def test_resume_at_line_offset(tmp_path) :
+	path = tmp_path / "gamelog.txt"
+	path.write_bytes(b"one\ntwo\nthr")
+	reader = TailReader(str(path), from_end = False)
+	assert reader.read_lines() == ["one", "two"]
+	offset = reader.get_line_offset()
+	reader.close()
+	append(path, b"ee\n")
+	reader = TailReader(str(path), offset = offset)
+	assert reader.read_lines() == ["three"]
+	reader.close()
@@ -0,0 +1,61 @@
+# Medusa wire format tests
+# This file is a part of the Medusa project, a real-time combat logs analyzer for Eve Online
+# Author : Tnemelc Abramovich
+
+# internal dependencies
+from MedusaWire import wire_versions, encode_collection, decode_collection, WireFormatError
+from MedusaParser import new_block, block_columns, block_columns_no_log_str, block_to_arrays, aggregate_block
+
+# testing
+import pytest
+
+# a few log entries, with symbol ids in name columns
+def make_block(columns = block_columns) :
+	block = new_block(columns)
+	rows = [
+		(0, 1594294520, 1, 2, 353, 3, 4, 5, 6, 1, "[ 2020.07.09 11:35:20 ] (combat) 353 to Enemy - Light Electron Blaster II - Penetrates"),
+		(1, 1594294521, 2, 1, 1 << 40, 0, 0, 0, 0, 1, ""),
+		(2, 1594294519, 7, 1, 0, 0, 0, 0, 0, 7, "[ 2020.07.09 11:35:19 ] (notify) Пилот, ünïcode"),
+	]
+	for row in rows :
+		for c, value in zip(block_columns, row) :
+			if c in block : block[c].append(value)
+	return block
+
+# decoded columns are lists
+def as_lists(col) :
+	return {k : list(v) if k in block_columns + ["hits", "max"] else v for k, v in col.items()}
+
+@pytest.mark.parametrize("version", wire_versions)
+def test_round_trip(version) :
+	col = make_block()
+	col["symbols"] = [1, ["Me", "Enemy", "Light Electron Blaster II", "Penetrates", "Ishkur", "Rifter", "Pilot, \"quoted\""]]
+	col["parser_stats"] = {"Me" : {"weapon_cycle_out" : {"attempts" : 3, "hits" : 1}}}
+	col["queue_stats"] = {"depth" : 0, "dropped" : {}}
+	assert decode_collection(encode_collection(col, version)) == as_lists(col)
+
+@pytest.mark.parametrize("version", wire_versions)
+def test_round_trip_aggregated_arrays(version) :
+	col = block_to_arrays(aggregate_block(make_block(block_columns_no_log_str)), symbols = True)
+	col["symbols"] = [8, []]
+	assert decode_collection(encode_collection(col, version)) == as_lists(col)
+
+@pytest.mark.parametrize("version", wire_versions)
+def test_round_trip_empty(version) :
+	col = new_block(block_columns_no_log_str)
+	col["symbols"] = [1, ["Me"]]
+	assert decode_collection(encode_collection(col, version)) == col
+	col = new_block(block_columns)
+	assert decode_collection(encode_collection(col, version)) == col
+
+@pytest.mark.parametrize("version", wire_versions)
+def test_corrupted(version) :
+	data = encode_collection(make_block(), version)
+	with pytest.raises(WireFormatError) :
+		decode_collection(data[:len(data) // 2])
+	with pytest.raises(WireFormatError) :
+		decode_collection(b"XYZ" + data[3:])
+
+def test_unknown_version() :
+	with pytest.raises(WireFormatError) :
+		encode_collection(make_block(), max(wire_versions) + 1)